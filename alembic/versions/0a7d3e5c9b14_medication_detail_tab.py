@@ -0,0 +1,61 @@
+"""medication detail tab
+
+Revision ID: 0a7d3e5c9b14
+Revises: f1b84d2c6a93
+Create Date: 2026-10-18 16:14:48.725390
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0a7d3e5c9b14'
+down_revision: Union[str, None] = 'f1b84d2c6a93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+DETAIL_COLUMNS = (
+    'excipient_name',
+    'other_name_of_active_ingredient',
+    'abbreviated_name_of_active_ingredient',
+    'chemical_formula',
+    'peculiar_part_of_drug',
+    'color',
+    'smell',
+    'taste',
+    'usage_of_excipient',
+    'storage',
+)
+
+
+def upgrade() -> None:
+    op.create_table('medication_detail_tab',
+    sa.Column('medication_reference', sa.String(), nullable=False),
+    *(sa.Column(column, sa.String(), nullable=True) for column in DETAIL_COLUMNS),
+    sa.ForeignKeyConstraint(['medication_reference'], ['medication_tab.medication_reference'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('medication_reference')
+    )
+    columns = ', '.join(DETAIL_COLUMNS)
+    # Only medications that have any of the details get a row
+    op.execute(
+        f'INSERT INTO medication_detail_tab (medication_reference, {columns}) '
+        f'SELECT medication_reference, {columns} FROM medication_tab '
+        f'WHERE num_nonnulls({columns}) > 0'
+    )
+    for column in DETAIL_COLUMNS:
+        op.drop_column('medication_tab', column)
+
+
+def downgrade() -> None:
+    for column in DETAIL_COLUMNS:
+        op.add_column('medication_tab', sa.Column(column, sa.String(), nullable=True))
+    op.execute(
+        'UPDATE medication_tab SET '
+        + ', '.join(f'{column} = detail.{column}' for column in DETAIL_COLUMNS)
+        + ' FROM medication_detail_tab AS detail '
+        'WHERE detail.medication_reference = medication_tab.medication_reference'
+    )
+    op.drop_table('medication_detail_tab')
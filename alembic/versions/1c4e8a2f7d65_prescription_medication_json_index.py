@@ -0,0 +1,26 @@
+"""prescription medication json index
+
+Revision ID: 1c4e8a2f7d65
+Revises: 0a7d3e5c9b14
+Create Date: 2026-10-18 16:52:30.184627
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1c4e8a2f7d65'
+down_revision: Union[str, None] = '0a7d3e5c9b14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_prescription_tab_medication_json', 'prescription_tab', ['medication_json'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_prescription_tab_medication_json', table_name='prescription_tab', postgresql_using='gin')
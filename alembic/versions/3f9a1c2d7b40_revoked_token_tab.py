@@ -0,0 +1,32 @@
+"""revoked_token_tab
+
+Revision ID: 3f9a1c2d7b40
+Revises: c2b9e0838555
+Create Date: 2026-10-18 09:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9a1c2d7b40'
+down_revision: Union[str, None] = 'c2b9e0838555'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('revoked_token_tab',
+    sa.Column('jti', sa.String(), nullable=False),
+    sa.Column('expires_on', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('jti')
+    )
+    op.create_index(op.f('ix_revoked_token_tab_expires_on'), 'revoked_token_tab', ['expires_on'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_revoked_token_tab_expires_on'), table_name='revoked_token_tab')
+    op.drop_table('revoked_token_tab')
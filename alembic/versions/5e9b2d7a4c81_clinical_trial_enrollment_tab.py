@@ -0,0 +1,35 @@
+"""clinical trial enrollment tab
+
+Revision ID: 5e9b2d7a4c81
+Revises: 1c4e8a2f7d65
+Create Date: 2026-10-18 17:31:06.552914
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e9b2d7a4c81'
+down_revision: Union[str, None] = '1c4e8a2f7d65'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('clinical_trial_enrollment_tab',
+    sa.Column('clinical_trial_refrence', sa.Integer(), nullable=False),
+    sa.Column('patient_refrence', sa.Integer(), nullable=False),
+    sa.Column('enrolled_on', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['clinical_trial_refrence'], ['clinical_trial_tab.clinical_trial_id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['patient_refrence'], ['patient_tab.registration_id'], ),
+    sa.PrimaryKeyConstraint('clinical_trial_refrence', 'patient_refrence')
+    )
+    op.create_index(op.f('ix_clinical_trial_enrollment_tab_patient_refrence'), 'clinical_trial_enrollment_tab', ['patient_refrence'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_clinical_trial_enrollment_tab_patient_refrence'), table_name='clinical_trial_enrollment_tab')
+    op.drop_table('clinical_trial_enrollment_tab')
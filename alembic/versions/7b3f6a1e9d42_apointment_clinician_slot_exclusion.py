@@ -0,0 +1,52 @@
+"""apointment clinician slot exclusion
+
+Revision ID: 7b3f6a1e9d42
+Revises: 5e9b2d7a4c81
+Create Date: 2026-10-18 18:05:41.907316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b3f6a1e9d42'
+down_revision: Union[str, None] = '5e9b2d7a4c81'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.add_column('apointment_code_tab', sa.Column('clinician_refrence', sa.Integer(), nullable=True))
+    op.add_column('apointment_code_tab', sa.Column('slot', postgresql.TSTZRANGE(), nullable=True))
+    op.create_foreign_key(None, 'apointment_code_tab', 'clinician_tab', ['clinician_refrence'], ['registration_id'])
+    # Existing apointments have no duration. They were unique by date, so
+    # single instant slots cannot overlap.
+    op.execute(
+        "UPDATE apointment_code_tab AS code "
+        "SET clinician_refrence = apointment.clinician_refrence, "
+        "slot = tstzrange(apointment.apointment_date AT TIME ZONE 'UTC', "
+        "apointment.apointment_date AT TIME ZONE 'UTC', '[]') "
+        "FROM apointment_tab AS apointment "
+        "WHERE apointment.apointment_code = code.apointment_code"
+    )
+    op.create_exclude_constraint(
+        'apointment_code_tab_clinician_slot_excl',
+        'apointment_code_tab',
+        ('clinician_refrence', '='),
+        ('slot', '&&'),
+        using='gist',
+    )
+    op.drop_constraint('apointment_tab_apointment_date_key', 'apointment_tab', type_='unique')
+
+
+def downgrade() -> None:
+    op.create_unique_constraint('apointment_tab_apointment_date_key', 'apointment_tab', ['apointment_date'])
+    op.drop_constraint('apointment_code_tab_clinician_slot_excl', 'apointment_code_tab')
+    op.drop_constraint('apointment_code_tab_clinician_refrence_fkey', 'apointment_code_tab', type_='foreignkey')
+    op.drop_column('apointment_code_tab', 'slot')
+    op.drop_column('apointment_code_tab', 'clinician_refrence')
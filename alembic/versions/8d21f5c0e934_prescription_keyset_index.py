@@ -0,0 +1,26 @@
+"""prescription keyset index
+
+Revision ID: 8d21f5c0e934
+Revises: 3f9a1c2d7b40
+Create Date: 2026-10-18 11:04:52.907316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d21f5c0e934'
+down_revision: Union[str, None] = '3f9a1c2d7b40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_prescription_tab_created_on_prescription_id', 'prescription_tab', ['created_on', 'prescription_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_prescription_tab_created_on_prescription_id', table_name='prescription_tab')
@@ -0,0 +1,28 @@
+"""organization id indexes
+
+Revision ID: 9c2e4f7b1a05
+Revises: 7b3f6a1e9d42
+Create Date: 2026-10-18 19:12:27.401583
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c2e4f7b1a05'
+down_revision: Union[str, None] = '7b3f6a1e9d42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(op.f('ix_institution_tab_organization_id'), 'institution_tab', ['organization_id'], unique=False)
+    op.create_index(op.f('ix_user_tab_organization_id'), 'user_tab', ['organization_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_user_tab_organization_id'), table_name='user_tab')
+    op.drop_index(op.f('ix_institution_tab_organization_id'), table_name='institution_tab')
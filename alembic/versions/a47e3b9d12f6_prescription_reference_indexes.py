@@ -0,0 +1,28 @@
+"""prescription reference indexes
+
+Revision ID: a47e3b9d12f6
+Revises: 8d21f5c0e934
+Create Date: 2026-10-18 12:21:37.514208
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a47e3b9d12f6'
+down_revision: Union[str, None] = '8d21f5c0e934'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_prescription_tab_patient_refrence_created_on', 'prescription_tab', ['patient_refrence', 'created_on', 'prescription_id'], unique=False)
+    op.create_index('ix_prescription_tab_clinician_refrence_created_on', 'prescription_tab', ['clinician_refrence', 'created_on', 'prescription_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_prescription_tab_clinician_refrence_created_on', table_name='prescription_tab')
+    op.drop_index('ix_prescription_tab_patient_refrence_created_on', table_name='prescription_tab')
@@ -0,0 +1,223 @@
+"""partition prescription and apointment
+
+Revision ID: b52f8e07c3d1
+Revises: a47e3b9d12f6
+Create Date: 2026-10-18 13:02:18.640915
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'b52f8e07c3d1'
+down_revision: Union[str, None] = 'a47e3b9d12f6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Partitions are created up to this many months after the current one; later
+# months are created by `python -m app.partitions`.
+MONTHS_AHEAD = 3
+
+PRESCRIPTION_COLUMNS = (
+    'prescription_id, prescription_code, clinician_refrence, patient_refrence, '
+    'reason, created_on, updated_on, start_date, end_date, frequency, '
+    'prescription_status, medication_refrence, medication_json'
+)
+APOINTMENT_COLUMNS = (
+    'apointment_id, apointment_code, clinician_refrence, patient_refrence, '
+    'institution_refrence, clincal_trial_id, reason, creted_on, updated_on, '
+    'apointment_date'
+)
+
+
+def create_monthly_partitions(table: str, column: str, source: str) -> None:
+    """
+    Create a default partition of `table` and one partition per month from the
+    first row of `source` until MONTHS_AHEAD months from now.
+    """
+    op.execute(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')
+    op.execute(f"""
+    DO $$
+    DECLARE month date;
+    BEGIN
+        FOR month IN
+            SELECT generate_series(
+                date_trunc('month', least(now()::timestamp, (SELECT min({column}) FROM {source}))),
+                date_trunc('month', greatest(
+                    now()::timestamp + interval '{MONTHS_AHEAD} months',
+                    (SELECT max({column}) FROM {source})
+                )),
+                interval '1 month'
+            )::date
+        LOOP
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF {table} FOR VALUES FROM (%L) TO (%L)',
+                '{table}_' || to_char(month, '"y"YYYY"m"MM'),
+                month,
+                (month + interval '1 month')::date
+            );
+        END LOOP;
+    END $$;
+    """)
+
+
+def upgrade() -> None:
+    # Set the unpartitioned tables aside, freeing the names of their indexes
+    # and identity sequences.
+    op.drop_index('ix_prescription_tab_clinician_refrence_created_on', table_name='prescription_tab')
+    op.drop_index('ix_prescription_tab_patient_refrence_created_on', table_name='prescription_tab')
+    op.drop_index('ix_prescription_tab_created_on_prescription_id', table_name='prescription_tab')
+    op.rename_table('prescription_tab', 'prescription_tab_old')
+    op.drop_constraint('prescription_tab_pkey', 'prescription_tab_old')
+    op.drop_constraint('prescription_tab_prescription_code_key', 'prescription_tab_old')
+    op.execute('ALTER TABLE prescription_tab_old ALTER COLUMN prescription_id DROP IDENTITY')
+    op.rename_table('apointment_tab', 'apointment_tab_old')
+    op.drop_constraint('apointment_tab_pkey', 'apointment_tab_old')
+    op.drop_constraint('apointment_tab_apointment_code_key', 'apointment_tab_old')
+    op.drop_constraint('apointment_tab_apointment_date_key', 'apointment_tab_old')
+    op.execute('ALTER TABLE apointment_tab_old ALTER COLUMN apointment_id DROP IDENTITY')
+
+    # Codes stay unique across partitions through these tables
+    op.create_table('prescription_code_tab',
+    sa.Column('prescription_code', sa.String(), nullable=False),
+    sa.PrimaryKeyConstraint('prescription_code')
+    )
+    op.create_table('apointment_code_tab',
+    sa.Column('apointment_code', sa.String(), nullable=False),
+    sa.PrimaryKeyConstraint('apointment_code')
+    )
+
+    op.execute(sa.schema.CreateSequence(sa.Sequence('prescription_tab_prescription_id_seq')))
+    op.create_table('prescription_tab',
+    sa.Column('prescription_id', sa.Integer(), server_default=sa.text("nextval('prescription_tab_prescription_id_seq')"), nullable=False),
+    sa.Column('prescription_code', sa.String(), nullable=False),
+    sa.Column('clinician_refrence', sa.Integer(), nullable=True),
+    sa.Column('patient_refrence', sa.Integer(), nullable=True),
+    sa.Column('reason', sa.TEXT(), nullable=True),
+    sa.Column('created_on', sa.DateTime(), nullable=False),
+    sa.Column('updated_on', sa.DateTime(), nullable=False),
+    sa.Column('start_date', sa.DateTime(), nullable=False),
+    sa.Column('end_date', sa.DateTime(), nullable=True),
+    sa.Column('frequency', sa.SmallInteger(), nullable=False),
+    sa.Column('prescription_status', postgresql.ENUM('ACTIVE', 'ON_HOLD', 'CANCCELED', name='prescription_status', create_type=False), server_default='ACTIVE', nullable=False),
+    sa.Column('medication_refrence', sa.String(), nullable=True),
+    sa.Column('medication_json', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.ForeignKeyConstraint(['prescription_code'], ['prescription_code_tab.prescription_code'], ),
+    sa.ForeignKeyConstraint(['clinician_refrence'], ['clinician_tab.registration_id'], ),
+    sa.ForeignKeyConstraint(['medication_refrence'], ['medication_tab.medication_reference'], ),
+    sa.ForeignKeyConstraint(['patient_refrence'], ['patient_tab.registration_id'], ),
+    sa.PrimaryKeyConstraint('prescription_id', 'created_on'),
+    postgresql_partition_by='RANGE (created_on)'
+    )
+    op.execute('ALTER SEQUENCE prescription_tab_prescription_id_seq OWNED BY prescription_tab.prescription_id')
+    create_monthly_partitions('prescription_tab', 'created_on', 'prescription_tab_old')
+
+    op.execute(sa.schema.CreateSequence(sa.Sequence('apointment_tab_apointment_id_seq')))
+    op.create_table('apointment_tab',
+    sa.Column('apointment_id', sa.Integer(), server_default=sa.text("nextval('apointment_tab_apointment_id_seq')"), nullable=False),
+    sa.Column('apointment_code', sa.String(), nullable=False),
+    sa.Column('clinician_refrence', sa.Integer(), nullable=True),
+    sa.Column('patient_refrence', sa.Integer(), nullable=True),
+    sa.Column('institution_refrence', sa.Integer(), nullable=True),
+    sa.Column('clincal_trial_id', sa.Integer(), nullable=True),
+    sa.Column('reason', sa.TEXT(), nullable=True),
+    sa.Column('creted_on', sa.DateTime(), nullable=False),
+    sa.Column('updated_on', sa.DateTime(), nullable=False),
+    sa.Column('apointment_date', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['apointment_code'], ['apointment_code_tab.apointment_code'], ),
+    sa.ForeignKeyConstraint(['clincal_trial_id'], ['clinical_trial_tab.clinical_trial_id'], ),
+    sa.ForeignKeyConstraint(['clinician_refrence'], ['clinician_tab.registration_id'], ),
+    sa.ForeignKeyConstraint(['institution_refrence'], ['institution_tab.id'], ),
+    sa.ForeignKeyConstraint(['patient_refrence'], ['patient_tab.registration_id'], ),
+    sa.PrimaryKeyConstraint('apointment_id', 'apointment_date'),
+    sa.UniqueConstraint('apointment_date'),
+    postgresql_partition_by='RANGE (apointment_date)'
+    )
+    op.execute('ALTER SEQUENCE apointment_tab_apointment_id_seq OWNED BY apointment_tab.apointment_id')
+    create_monthly_partitions('apointment_tab', 'apointment_date', 'apointment_tab_old')
+
+    # Move the rows over
+    op.execute('INSERT INTO prescription_code_tab SELECT prescription_code FROM prescription_tab_old')
+    op.execute(f'INSERT INTO prescription_tab ({PRESCRIPTION_COLUMNS}) SELECT {PRESCRIPTION_COLUMNS} FROM prescription_tab_old')
+    op.execute("SELECT setval('prescription_tab_prescription_id_seq', coalesce(max(prescription_id), 0) + 1, false) FROM prescription_tab")
+    op.execute('INSERT INTO apointment_code_tab SELECT apointment_code FROM apointment_tab_old')
+    op.execute(f'INSERT INTO apointment_tab ({APOINTMENT_COLUMNS}) SELECT {APOINTMENT_COLUMNS} FROM apointment_tab_old')
+    op.execute("SELECT setval('apointment_tab_apointment_id_seq', coalesce(max(apointment_id), 0) + 1, false) FROM apointment_tab")
+    op.drop_table('prescription_tab_old')
+    op.drop_table('apointment_tab_old')
+
+    # Created on the parents, so every partition gets its own smaller copy
+    op.create_index('ix_prescription_tab_created_on_prescription_id', 'prescription_tab', ['created_on', 'prescription_id'], unique=False)
+    op.create_index('ix_prescription_tab_patient_refrence_created_on', 'prescription_tab', ['patient_refrence', 'created_on', 'prescription_id'], unique=False)
+    op.create_index('ix_prescription_tab_clinician_refrence_created_on', 'prescription_tab', ['clinician_refrence', 'created_on', 'prescription_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.rename_table('prescription_tab', 'prescription_tab_partitioned')
+    op.rename_table('apointment_tab', 'apointment_tab_partitioned')
+    op.execute('ALTER INDEX ix_prescription_tab_created_on_prescription_id RENAME TO ix_prescription_tab_partitioned_created_on')
+    op.execute('ALTER INDEX ix_prescription_tab_patient_refrence_created_on RENAME TO ix_prescription_tab_partitioned_patient')
+    op.execute('ALTER INDEX ix_prescription_tab_clinician_refrence_created_on RENAME TO ix_prescription_tab_partitioned_clinician')
+    op.execute('ALTER TABLE prescription_tab_partitioned RENAME CONSTRAINT prescription_tab_pkey TO prescription_tab_partitioned_pkey')
+    op.execute('ALTER TABLE apointment_tab_partitioned RENAME CONSTRAINT apointment_tab_pkey TO apointment_tab_partitioned_pkey')
+    op.execute('ALTER TABLE apointment_tab_partitioned RENAME CONSTRAINT apointment_tab_apointment_date_key TO apointment_tab_partitioned_apointment_date_key')
+    op.execute('ALTER SEQUENCE prescription_tab_prescription_id_seq RENAME TO prescription_tab_partitioned_seq')
+    op.execute('ALTER SEQUENCE apointment_tab_apointment_id_seq RENAME TO apointment_tab_partitioned_seq')
+
+    op.create_table('prescription_tab',
+    sa.Column('prescription_id', sa.Integer(), sa.Identity(always=True), nullable=False),
+    sa.Column('prescription_code', sa.String(), nullable=False),
+    sa.Column('clinician_refrence', sa.Integer(), nullable=True),
+    sa.Column('patient_refrence', sa.Integer(), nullable=True),
+    sa.Column('reason', sa.TEXT(), nullable=True),
+    sa.Column('created_on', sa.DateTime(), nullable=False),
+    sa.Column('updated_on', sa.DateTime(), nullable=False),
+    sa.Column('start_date', sa.DateTime(), nullable=False),
+    sa.Column('end_date', sa.DateTime(), nullable=True),
+    sa.Column('frequency', sa.SmallInteger(), nullable=False),
+    sa.Column('prescription_status', postgresql.ENUM('ACTIVE', 'ON_HOLD', 'CANCCELED', name='prescription_status', create_type=False), server_default='ACTIVE', nullable=False),
+    sa.Column('medication_refrence', sa.String(), nullable=True),
+    sa.Column('medication_json', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.ForeignKeyConstraint(['clinician_refrence'], ['clinician_tab.registration_id'], ),
+    sa.ForeignKeyConstraint(['medication_refrence'], ['medication_tab.medication_reference'], ),
+    sa.ForeignKeyConstraint(['patient_refrence'], ['patient_tab.registration_id'], ),
+    sa.PrimaryKeyConstraint('prescription_id'),
+    sa.UniqueConstraint('prescription_code')
+    )
+    op.create_table('apointment_tab',
+    sa.Column('apointment_id', sa.Integer(), sa.Identity(always=True), nullable=False),
+    sa.Column('apointment_code', sa.String(), nullable=False),
+    sa.Column('clinician_refrence', sa.Integer(), nullable=True),
+    sa.Column('patient_refrence', sa.Integer(), nullable=True),
+    sa.Column('institution_refrence', sa.Integer(), nullable=True),
+    sa.Column('clincal_trial_id', sa.Integer(), nullable=True),
+    sa.Column('reason', sa.TEXT(), nullable=True),
+    sa.Column('creted_on', sa.DateTime(), nullable=False),
+    sa.Column('updated_on', sa.DateTime(), nullable=False),
+    sa.Column('apointment_date', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['clincal_trial_id'], ['clinical_trial_tab.clinical_trial_id'], ),
+    sa.ForeignKeyConstraint(['clinician_refrence'], ['clinician_tab.registration_id'], ),
+    sa.ForeignKeyConstraint(['institution_refrence'], ['institution_tab.id'], ),
+    sa.ForeignKeyConstraint(['patient_refrence'], ['patient_tab.registration_id'], ),
+    sa.PrimaryKeyConstraint('apointment_id'),
+    sa.UniqueConstraint('apointment_code'),
+    sa.UniqueConstraint('apointment_date')
+    )
+
+    op.execute(f'INSERT INTO prescription_tab ({PRESCRIPTION_COLUMNS}) OVERRIDING SYSTEM VALUE SELECT {PRESCRIPTION_COLUMNS} FROM prescription_tab_partitioned')
+    op.execute("SELECT setval(pg_get_serial_sequence('prescription_tab', 'prescription_id'), coalesce(max(prescription_id), 0) + 1, false) FROM prescription_tab")
+    op.execute(f'INSERT INTO apointment_tab ({APOINTMENT_COLUMNS}) OVERRIDING SYSTEM VALUE SELECT {APOINTMENT_COLUMNS} FROM apointment_tab_partitioned')
+    op.execute("SELECT setval(pg_get_serial_sequence('apointment_tab', 'apointment_id'), coalesce(max(apointment_id), 0) + 1, false) FROM apointment_tab")
+
+    # Dropping the parents drops every partition and the sequences they own
+    op.drop_table('prescription_tab_partitioned')
+    op.drop_table('apointment_tab_partitioned')
+    op.drop_table('prescription_code_tab')
+    op.drop_table('apointment_code_tab')
+
+    op.create_index('ix_prescription_tab_created_on_prescription_id', 'prescription_tab', ['created_on', 'prescription_id'], unique=False)
+    op.create_index('ix_prescription_tab_patient_refrence_created_on', 'prescription_tab', ['patient_refrence', 'created_on', 'prescription_id'], unique=False)
+    op.create_index('ix_prescription_tab_clinician_refrence_created_on', 'prescription_tab', ['clinician_refrence', 'created_on', 'prescription_id'], unique=False)
@@ -0,0 +1,26 @@
+"""organization path gist index
+
+Revision ID: d9a6c41e8f27
+Revises: b52f8e07c3d1
+Create Date: 2026-10-18 13:48:05.271934
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9a6c41e8f27'
+down_revision: Union[str, None] = 'b52f8e07c3d1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_organization_tab_path', 'organization_tab', ['path'], unique=False, postgresql_using='gist')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_organization_tab_path', table_name='organization_tab', postgresql_using='gist')
@@ -0,0 +1,26 @@
+"""organization id by default
+
+Revision ID: e3c7a5f1b820
+Revises: d9a6c41e8f27
+Create Date: 2026-10-18 14:26:51.093417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3c7a5f1b820'
+down_revision: Union[str, None] = 'd9a6c41e8f27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute('ALTER TABLE organization_tab ALTER COLUMN id SET GENERATED BY DEFAULT')
+
+
+def downgrade() -> None:
+    op.execute('ALTER TABLE organization_tab ALTER COLUMN id SET GENERATED ALWAYS')
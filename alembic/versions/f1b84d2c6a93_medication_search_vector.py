@@ -0,0 +1,28 @@
+"""medication search vector
+
+Revision ID: f1b84d2c6a93
+Revises: e3c7a5f1b820
+Create Date: 2026-10-18 15:37:12.408156
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1b84d2c6a93'
+down_revision: Union[str, None] = 'e3c7a5f1b820'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('medication_tab', sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed("setweight(to_tsvector('english', coalesce(medication_name, '') || ' ' || coalesce(brand_name, '') || ' ' || coalesce(active_ingredient_name, '')), 'A') || setweight(to_tsvector('english', coalesce(indications, '')), 'B') || setweight(to_tsvector('english', coalesce(contraindications, '') || ' ' || coalesce(side_effects, '') || ' ' || coalesce(dosage, '')), 'C')", persisted=True), nullable=True))
+    op.create_index('ix_medication_tab_search_vector', 'medication_tab', ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_medication_tab_search_vector', table_name='medication_tab', postgresql_using='gin')
+    op.drop_column('medication_tab', 'search_vector')
@@ -0,0 +1,32 @@
+from fastapi import APIRouter, status
+
+from app.catalog import medication_catalog
+from app.cohort import patient_cohorts
+from app.database import sessionmanager
+from app.dependencies import CurrentReadSuperUser, principal_cache, subtree_cache
+from app.app_endpoints.medication_endpoints import facet_cache
+from app.notifications import notification_listener
+from app.revocation import revocation_store
+from app.security import password_hasher
+
+router = APIRouter(
+    prefix="/admin", tags=["admin"], responses={404: {"description": "Not Found"}}
+)
+
+
+@router.get("/metrics", status_code=status.HTTP_200_OK)
+async def get_metrics(user: CurrentReadSuperUser):
+    """
+    Return the runtime counters of the worker serving the request.
+    """
+    return {
+        "principal_cache": principal_cache.stats(),
+        "subtree_cache": subtree_cache.stats(),
+        "password_hasher": password_hasher.stats(),
+        "revocation_store": revocation_store.stats(),
+        "notifications": notification_listener.stats(),
+        "medication_catalog": medication_catalog.stats(),
+        "medication_facet_cache": facet_cache.stats(),
+        "patient_cohorts": patient_cohorts.stats(),
+        "database_pool": sessionmanager.pool_stats(),
+    }
@@ -1,10 +1,11 @@
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
 from fastapi import APIRouter, HTTPException, status
+from sqlalchemy.dialects.postgresql import Range
 import app.schemas
 from app import models
-from app.dependencies import (Apointment, Clinician, CurrentUser, Database,
-                              Institution, Patient)
+from app.dependencies import ApointmentReferences, CurrentUser, Database
+from app.utils import insert_or_conflict
 router = APIRouter(
     prefix="/apointments",
     tags=["apointments"],
@@ -19,34 +20,48 @@ async def post_apointments(
     fields: app.schemas.ApointmentsCreate,
     apointment_code: str,
     database: Database,
-    existing_patient: Patient,
-    existing_clinician: Clinician,
-    existing_institution: Institution,
-    existing_apointment: Apointment,
+    references: ApointmentReferences,
     user: CurrentUser,
 ):
     """
     Create a new Apointments in DB
     """
 
-    if existing_apointment:
-        raise HTTPException(409, detail="There is already an apointment with this code")
-
-    if not existing_patient:
+    if references.patient_id is None:
         raise HTTPException(409, detail="There is no patient with this credentials")
-    if not existing_clinician:
+    if references.clinician_id is None:
         raise HTTPException(409, detail="There is no clinician with this credentials")
-    if not existing_institution:
+    if references.institution_id is None:
         raise HTTPException(409, detail="There is no institution with this credentials")
 
-    new_apointment = models.Apointments(
-        institution_refrence=existing_institution.id,
-        clinician_refrence=existing_clinician.registration_id,
-        patient_refrence=existing_patient.registration_id,
-        apointment_code=apointment_code,
-        updated_on=datetime.now(),
-        creted_on=datetime.now(),
-        **fields.model_dump(exclude={"apointment_code"}),
+    start = fields.apointment_date
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    await insert_or_conflict(
+        database,
+        models.Apointments,
+        dict(
+            institution_refrence=references.institution_id,
+            clinician_refrence=references.clinician_id,
+            patient_refrence=references.patient_id,
+            apointment_code=apointment_code,
+            updated_on=datetime.now(),
+            creted_on=datetime.now(),
+            **fields.model_dump(
+                exclude={"apointment_code", "apointment_date", "duration_minutes"}
+            ),
+            apointment_date=start.astimezone(timezone.utc).replace(tzinfo=None),
+        ),
+        error_msg=(
+            "There is already an apointment with this code, or the clinician "
+            "already has an apointment at this time"
+        ),
+        registry=models.ApointmentCode.apointment_code,
+        # The exclusion constraint on the slots makes concurrent bookings of
+        # the same clinician conflict inside the insert
+        registry_values=dict(
+            clinician_refrence=references.clinician_id,
+            slot=Range(start, start + timedelta(minutes=fields.duration_minutes)),
+        ),
     )
-    database.add(new_apointment)
     await  database.commit()
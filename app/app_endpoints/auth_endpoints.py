@@ -3,14 +3,15 @@ from typing import cast
 from fastapi import APIRouter, Depends, Form, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from jose import JWTError  # type: ignore
-from jose import jwt  # type: ignore
+from sqlalchemy import select
 
-from app import models, schemas
+from app import models
 from app.commons import Token, UserAuthorisation
 from app.conf import config
 from app.dependencies import CurrentUser, Database, authenticate_user
 from app.security import (create_access_token, create_refresh_token,
-                          refresh_token_valid, revoke_refresh_token)
+                          decode_token, refresh_token_valid,
+                          revoke_refresh_token)
 
 router = APIRouter(
     prefix="/api/auth",
@@ -40,7 +41,7 @@ async def login_for_access_token(
 
 
 @router.post("/refresh", response_model=Token)
-def refresh_access_token(
+async def refresh_access_token(
     database: Database,
     refresh_token: str = Form(...),
     grant_type: str = Form(...),
@@ -58,22 +59,20 @@ def refresh_access_token(
     # check that the provided refresh token is a well formed
     # JWT token.
     try:
-        payload = jwt.decode(
-            refresh_token, config.SECRET_KEY, algorithms=[config.HASH_ALGORITHM]
-        )
+        payload = decode_token(refresh_token)
     except JWTError as error:
         raise bad_request_exception from error
 
-    # check that the provided refresh token has not been
-    # revoked.
-    if not refresh_token_valid(refresh_token):
-        raise bad_request_exception
-
     # if the payload type is not "refresh", then the
     # provided access grant is invalid.
     if payload.get("type") != "refresh":
         raise bad_request_exception
 
+    # check that the provided refresh token has not been
+    # revoked.
+    if not await refresh_token_valid(database, payload):
+        raise bad_request_exception
+
     username = cast(str | None, payload.get("sub"))
     invalid_credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -82,34 +81,54 @@ def refresh_access_token(
     if username is None:
         raise invalid_credentials_exception
     user: models.User | None = (
-        database.query(models.User)
-        .filter(models.User.username == username)
-        .one_or_none()
-    )
+        await database.scalars(
+            select(models.User).where(models.User.username == username)
+        )
+    ).one_or_none()
     if user is None:
         raise invalid_credentials_exception
+    # Read before the commit expires the user's attributes
+    role = UserAuthorisation.ADMIN if user.can_edit else UserAuthorisation.USER
 
     # revoke the existing refresh token since a new one will
-    # be created and returned in the response.
-    revoke_refresh_token(refresh_token)
+    # be created and returned in the response. If another
+    # request revoked it in the meantime, the grant was reused.
+    if not await revoke_refresh_token(database, payload):
+        raise bad_request_exception
+    await database.commit()
 
     return {
         "access_token": create_access_token(username, fresh=False),
         "refresh_token": create_refresh_token(username, fresh=False),
         "token_type": "bearer",
         "expires_in": config.REFRESH_TOKEN_EXPIRE_MINUTES * 60,
-        "role": (
-            UserAuthorisation.ADMIN if user.can_edit else schemas.UserAuthorisation.USER
-        ),
+        "role": role,
     }
 
 
 @router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
-def logout(current_user: CurrentUser):
+async def logout(
+    current_user: CurrentUser,
+    database: Database,
+    refresh_token: str = Form(...),
+):
     """
     Revoke the user's currently active refresh token.
 
     NOTE: This function does not revoke the user's active *access token*.
           This will expire naturally after the exp time.
     """
-    revoke_refresh_token(current_user.username)
+    bad_request_exception = HTTPException(
+        status.HTTP_400_BAD_REQUEST,
+        detail="The provided refresh token is invalid or expired",
+    )
+    try:
+        payload = decode_token(refresh_token)
+    except JWTError as error:
+        raise bad_request_exception from error
+
+    if payload.get("type") != "refresh" or payload.get("sub") != current_user.username:
+        raise bad_request_exception
+
+    await revoke_refresh_token(database, payload)
+    await database.commit()
@@ -1,11 +1,17 @@
 from datetime import datetime, timezone
 
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, HTTPException, Query, status
+from sqlalchemy import Integer, String, any_, func, literal, select
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import app.schemas
 from app import models
-from app.dependencies import (Apointment, Clinical_Trials, Clinician, Database,
-                              Institution, Patient)
+from app.cohort import ids_of, patient_cohorts
+from app.dependencies import (ClinicalTrialReferences, Database,
+                              OrganizationSubtree, ReadDatabase,
+                              ReadOrganizationSubtree, in_subtree)
+from app.utils import expect, insert_or_conflict
 
 router = APIRouter(
     prefix="/clinical_trials",
@@ -20,33 +26,146 @@ router = APIRouter(
 async def post_clinical_trials(
     fields: app.schemas.ClinicalTrialCreate,
     clinical_trial_code: str,
-    existing_clinical_trial: Clinical_Trials,
-    clinician_code: Clinician,
-    patient_code: Patient,
-    institution_name: Institution,
-    apointment: Apointment,
+    references: ClinicalTrialReferences,
     database: Database,
 ):
     """
     Create a new clinical trial in DB
     """
 
-    if existing_clinical_trial:
-        raise HTTPException(
-            409, detail="There is already a clinical trial with this credentials"
-        )
-    if not apointment:
+    if references.apointment_id is None:
         raise HTTPException(409, detail="There is no apointment with this credentials")
+    if references.patient_id is None:
+        raise HTTPException(409, detail="There is no patient with this credentials")
+    if references.clinician_id is None:
+        raise HTTPException(409, detail="There is no clinician with this credentials")
+    if references.institution_id is None:
+        raise HTTPException(409, detail="There is no institution with this credentials")
+
+    await insert_or_conflict(
+        database,
+        models.ClinicalTrials,
+        dict(
+            clinical_trial_code=clinical_trial_code,
+            clinician_refrence=references.clinician_id,
+            patient_refrence=references.patient_id,
+            institution_refrence=references.institution_id,
+            updated_on=datetime.now(),
+            created_on=datetime.now(),
+            **fields.model_dump(),
+        ),
+        error_msg="There is already a clinical trial with this credentials",
+    )
+    await database.commit()
+
+
+async def get_trial_scope(
+    database: AsyncSession, clinical_trial_code: str, subtree: list[int]
+) -> tuple[int, list[int]]:
+    """
+    Get the id of a clinical trial of the user's organizations, with the ids
+    of the institutions of those organizations
+    """
+    institution_ids = (
+        await database.scalars(
+            select(models.Institution.id).where(
+                in_subtree(models.Institution.organization_id, subtree)
+            )
+        )
+    ).all()
+    clinical_trial_id = expect(
+        await database.scalar(
+            select(models.ClinicalTrials.clinical_trial_id)
+            .where(models.ClinicalTrials.clinical_trial_code == clinical_trial_code)
+            .where(
+                in_subtree(models.ClinicalTrials.institution_refrence, institution_ids)
+            )
+        ),
+        error_msg="No clinical trial could be found with that code",
+    )
+    return clinical_trial_id, list(institution_ids)
+
+
+@router.post(
+    "/{clinical_trial_code}/cohort",
+    status_code=status.HTTP_200_OK,
+    response_model=app.schemas.Cohort,
+)
+async def post_clinical_trial_cohort(
+    criteria: app.schemas.CohortCriteria,
+    clinical_trial_code: str,
+    database: ReadDatabase,
+    subtree: ReadOrganizationSubtree,
+    ids: bool = Query(default=False, description="Also return the patient ids"),
+    limit: int = Query(default=1_000, ge=1, le=100_000),
+) -> app.schemas.Cohort:
+    """
+    Count (and list) the patients of the user's organizations matching the
+    criteria, from the worker's patient bitmaps
+    """
+    _, institution_ids = await get_trial_scope(database, clinical_trial_code, subtree)
 
-    new_clinical_trial = models.ClinicalTrials(
-        clinical_trial_code=clinical_trial_code,
-        clinician_refrence=clinician_code.registration_id,
-        patient_refrence=patient_code.registration_id,
-        institution_refrence=institution_name.id,
-        updated_on=datetime.now(),
-        created_on=datetime.now(),
-        **fields.model_dump(),
+    cohort = patient_cohorts.match(criteria) & patient_cohorts.of_institutions(
+        institution_ids
     )
+    return app.schemas.Cohort(
+        count=cohort.bit_count(),
+        registration_ids=ids_of(cohort, limit) if ids else None,
+    )
+
 
-    database.add(new_clinical_trial)
+@router.post(
+    "/{clinical_trial_code}/enroll",
+    status_code=status.HTTP_201_CREATED,
+    response_model=app.schemas.ClinicalTrialEnrollment,
+)
+async def post_clinical_trial_enrollment(
+    patients: app.schemas.ClinicalTrialEnrollmentCreate,
+    clinical_trial_code: str,
+    database: Database,
+    subtree: OrganizationSubtree,
+) -> app.schemas.ClinicalTrialEnrollment:
+    """
+    Enroll patients of the user's organizations in a clinical trial, with a
+    single INSERT ... SELECT whatever their number
+    """
+    clinical_trial_id, institution_ids = await get_trial_scope(
+        database, clinical_trial_code, subtree
+    )
+
+    if patients.cohort is not None:
+        registration_ids = ids_of(
+            patient_cohorts.match(patients.cohort)
+            & patient_cohorts.of_institutions(institution_ids)
+        )
+        requested = len(registration_ids)
+        selection = models.Patient.registration_id == any_(
+            literal(registration_ids, ARRAY(Integer))
+        )
+    else:
+        requested = len(set(patients.patient_codes))
+        selection = models.Patient.patient_code == any_(
+            literal(patients.patient_codes, ARRAY(String))
+        )
+
+    enrolled = (
+        insert(models.ClinicalTrialEnrollment)
+        .from_select(
+            ["clinical_trial_refrence", "patient_refrence", "enrolled_on"],
+            select(
+                literal(clinical_trial_id),
+                models.Patient.registration_id,
+                literal(datetime.now()),
+            )
+            .where(selection)
+            .where(in_subtree(models.Patient.institution_id, institution_ids)),
+        )
+        .on_conflict_do_nothing()
+        .returning(models.ClinicalTrialEnrollment.patient_refrence)
+        .cte("enrolled")
+    )
+    count = await database.scalar(select(func.count()).select_from(enrolled))
     await database.commit()
+    return app.schemas.ClinicalTrialEnrollment(
+        enrolled=count, skipped=requested - count
+    )
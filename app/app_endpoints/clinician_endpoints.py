@@ -7,8 +7,8 @@ from sqlalchemy import select
 
 import app.schemas
 from app import models
-from app.dependencies import Clinician, CurrentUser, Database
-from app.utils import expect
+from app.dependencies import CurrentUser, Database
+from app.utils import expect, insert_or_conflict
 
 router = APIRouter(
     prefix="/clinician",
@@ -24,17 +24,12 @@ async def post_clinician(
     fields: app.schemas.ClinicianCreate,
     database: Database,
     clinician_code: str,
-    existing_clinician: Clinician,
     user: CurrentUser,
 ) -> None:
     """
     Create a new Clinician in DB
     """
 
-    if existing_clinician:
-        raise HTTPException(
-            409, detail="There is already a clinician with this credentials"
-        )
     if fields.institution_name:
         institution_id: int = expect(
            ( await database.scalars(
@@ -46,13 +41,16 @@ async def post_clinician(
         )
     else:
         institution_id = cast(int, user.institution_id)
-    new_clinician = models.Clinician(
-        institution_id=institution_id,
-        clinician_code=clinician_code,
-        created_on=datetime.now(),
-        updated_on=datetime.now(),
-        **fields.model_dump(exclude={"institution_name"}),
+    await insert_or_conflict(
+        database,
+        models.Clinician,
+        dict(
+            institution_id=institution_id,
+            clinician_code=clinician_code,
+            created_on=datetime.now(),
+            updated_on=datetime.now(),
+            **fields.model_dump(exclude={"institution_name"}),
+        ),
+        error_msg="There is already a clinician with this credentials",
     )
-
-    database.add(new_clinician)
     await database.commit()
@@ -1,8 +1,9 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, status
 
 import app.schemas as app
 from app import models
-from app.dependencies import Database, Image
+from app.dependencies import CurrentUser, Database
+from app.utils import insert_or_conflict
 from datetime import datetime
 
 router = APIRouter(
@@ -13,19 +14,21 @@ router = APIRouter(
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=None)
 async def post_image(
     image: app.ImageCreate,
-    existing_image: Image,
+    image_code: str,
     database: Database,
+    user: CurrentUser,
 ):
     """
     Create a new Image in DB
     """
-    if existing_image:
-        raise HTTPException(
-            409, detail="There is already an image with this credentials"
-        )
-    new_image = models.Image(
-        **image.model_dump(),
-        created_on=datetime.now(),
+    await insert_or_conflict(
+        database,
+        models.Image,
+        dict(
+            **image.model_dump(),
+            image_code=image_code,
+            created_on=datetime.now(),
+        ),
+        error_msg="There is already an image with this credentials",
     )
-    database.add(new_image)
     await database.commit()
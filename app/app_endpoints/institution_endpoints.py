@@ -5,9 +5,9 @@ from fastapi import APIRouter, HTTPException, status
 from sqlalchemy import select
 
 from app import models
-from app.dependencies import CurrentUser, Database, Institution
+from app.dependencies import CurrentUser, Database
 from app.schemas import InstitutionCreate
-from app.utils import expect
+from app.utils import expect, insert_or_conflict
 
 router = APIRouter(
     prefix="/institution",
@@ -24,16 +24,11 @@ async def post_institution(
     institution_name: str,
     database: Database,
     user: CurrentUser,
-    existing_institution: Institution,
 ):
     """
     Create a new Institution
     """
-    
-    if existing_institution:
-        raise HTTPException(
-            409, detail="There is already an institution with this credentials"
-        )
+
     if fields.organization_name:
         organization_id: int = expect(
             (await database.scalars(
@@ -46,11 +41,15 @@ async def post_institution(
     else:
         organization_id = cast(int, user.organization_id)
 
-    new_institution = models.Institution(
-        organization_id=organization_id,
-        name=institution_name,
-        created_on=datetime.now(),
-        **fields.model_dump(exclude={"institution_name", "organization_name"}),
+    await insert_or_conflict(
+        database,
+        models.Institution,
+        dict(
+            organization_id=organization_id,
+            name=institution_name,
+            created_on=datetime.now(),
+            **fields.model_dump(exclude={"institution_name", "organization_name"}),
+        ),
+        error_msg="There is already an institution with this credentials",
     )
-    database.add(new_institution)
     await database.commit()
@@ -1,8 +1,17 @@
-from fastapi import APIRouter, HTTPException, status
+import time
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Query, status
+from sqlalchemy import func, select
 
 import app.schemas
 from app import models
-from app.dependencies import CurrentUser, Database, Medication
+from app.cache import TTLCache
+from app.catalog import MEDICATION_CHANNEL, medication_catalog
+from app.conf import config
+from app.dependencies import CurrentReadUser, CurrentUser, Database, ReadDatabase
+from app.notifications import notify
+from app.utils import insert_or_conflict
 
 router = APIRouter(
     prefix="/medication",
@@ -10,6 +19,11 @@ router = APIRouter(
     responses={404: {"description": "Not Found"}},
 )
 
+# Keyed by (catalog version, search terms, flag filters)
+facet_cache: TTLCache[tuple, app.schemas.MedicationFacets] = TTLCache(
+    config.MEDICATION_FACET_CACHE_SIZE
+)
+
 
 @router.post(
     "/{medication_name}", status_code=status.HTTP_201_CREATED, response_model=None
@@ -20,21 +34,148 @@ async def post_medication(
     form: str,
     database: Database,
     user: CurrentUser,
-    existing_medication: Medication,
 ) -> None:
     """
     Create a new Medication
     """
 
-    if existing_medication:
-        raise HTTPException(
-            409, detail="There is medication, there is no need to add it in the system"
+    await insert_or_conflict(
+        database,
+        models.Medication,
+        dict(
+            medication_name=medication_name,
+            form=form,
+            **medication.model_dump(exclude={"medication_name"}),
+        ),
+        error_msg="There is medication, there is no need to add it in the system",
+    )
+    await notify(database, MEDICATION_CHANNEL, medication.code_name)
+    await database.commit()
+    medication_catalog.add(
+        medication.code_name,
+        None,
+        None,
+        (medication_name, medication.code_name, medication.international_code_name),
+    )
+
+
+@router.get(
+    "/suggest",
+    status_code=status.HTTP_200_OK,
+    response_model=list[app.schemas.MedicationSuggestion],
+)
+async def suggest_medications(
+    user: CurrentReadUser,
+    q: str = Query(min_length=1, description="Beginning of a medication name"),
+    limit: int = Query(default=10, ge=1, le=100),
+):
+    """
+    Return the medications whose name, brand name, code or international code
+    starts with `q`.
+    """
+    return medication_catalog.suggest(q, limit)
+
+
+def flag_filters(flags: app.schemas.MedicationFlags) -> list:
+    return [
+        getattr(models.Medication, flag) == value
+        for flag, value in flags.model_dump(exclude_none=True).items()
+    ]
+
+
+@router.get(
+    "/search",
+    status_code=status.HTTP_200_OK,
+    response_model=list[app.schemas.MedicationSearchResult],
+)
+async def search_medications(
+    database: ReadDatabase,
+    user: CurrentReadUser,
+    flags: Annotated[app.schemas.MedicationFlags, Depends()],
+    q: str = Query(
+        min_length=1,
+        description="Search terms, with optional \"quoted phrases\", OR and -exclusions",
+    ),
+    limit: int = Query(default=20, ge=1, le=100),
+):
+    """
+    Search the names and clinical text of medications, best matches first.
+
+    `highlight` is an excerpt of the indications, contraindications, side
+    effects and dosage with the matching terms in bold.
+    """
+    query = func.websearch_to_tsquery("english", q)
+    rank = func.ts_rank(models.Medication.search_vector, query)
+    return (
+        await database.execute(
+            select(
+                models.Medication.code_name,
+                models.Medication.medication_name,
+                models.Medication.brand_name,
+                rank.label("rank"),
+                # Only computed for the returned rows
+                func.ts_headline(
+                    "english",
+                    func.concat_ws(
+                        " ",
+                        models.Medication.indications,
+                        models.Medication.contraindications,
+                        models.Medication.side_effects,
+                        models.Medication.dosage,
+                    ),
+                    query,
+                ).label("highlight"),
+            )
+            .where(models.Medication.search_vector.op("@@")(query))
+            .where(*flag_filters(flags))
+            .order_by(rank.desc(), models.Medication.code_name)
+            .limit(limit)
         )
+    ).all()
+
+
+@router.get(
+    "/facets",
+    status_code=status.HTTP_200_OK,
+    response_model=app.schemas.MedicationFacets,
+)
+async def get_medication_facets(
+    database: ReadDatabase,
+    user: CurrentReadUser,
+    flags: Annotated[app.schemas.MedicationFlags, Depends()],
+    q: str | None = Query(default=None, description="Optional search terms"),
+):
+    """
+    Count the medications matching the filter, and how many of them have each
+    flag set.
+    """
+    filters = flags.model_dump(exclude_none=True)
+    key = (medication_catalog.version, q, tuple(sorted(filters.items())))
+    facets = facet_cache.get(key)
+    if facets is not None:
+        return facets
 
-    new_medication = models.Medication(
-        medication_name=medication_name,
-        form=form,
-        **medication.model_dump(exclude={"medication_name"}),
+    query = (
+        select(
+            func.count().label("total"),
+            *(
+                func.count()
+                .filter(getattr(models.Medication, flag).is_(True))
+                .label(flag)
+                for flag in app.schemas.MedicationFlags.model_fields
+            ),
+        )
+        .select_from(models.Medication)
+        .where(*flag_filters(flags))
     )
-    database.add(new_medication)
-    await database.commit()
+    if q is not None:
+        query = query.where(
+            models.Medication.search_vector.op("@@")(
+                func.websearch_to_tsquery("english", q)
+            )
+        )
+    counts = (await database.execute(query)).one()._asdict()
+
+    facets = app.schemas.MedicationFacets(total=counts.pop("total"), facets=counts)
+    facet_cache.set(key, facets, time.time() + config.MEDICATION_FACET_CACHE_TTL)
+    return facets
@@ -1,11 +1,18 @@
-from fastapi import APIRouter, HTTPException, status
-from sqlalchemy import func, insert, select, update
-from sqlalchemy.exc import IntegrityError
+from typing import Sequence
+
+from fastapi import APIRouter, HTTPException, Query, status
+from sqlalchemy import Row, Select, String, any_, func, literal, select, update
+from sqlalchemy.dialects.postgresql import ARRAY, insert
 from sqlalchemy_utils import Ltree
 
 from app import models
-from app.dependencies import CurrentAdminUser, Database
-from app.schemas import OrganizationCreate
+from app.dependencies import (SUBTREE_CHANNEL, CurrentAdminUser, Database,
+                              OrganizationSubtree, ReadDatabase,
+                              ReadOrganizationSubtree, subtree_cache)
+from app.notifications import notify
+from app.schemas import (OrganizationBulkCreate, OrganizationCreate,
+                         OrganizationParentUpdate, OrganizationTree)
+from app.utils import expect
 
 router = APIRouter(
     prefix="/organization",
@@ -14,6 +21,136 @@ router = APIRouter(
 )
 
 
+# Ids are drawn from the identity sequence before inserting, so that the path
+# "<parent path>.<id>" can be written along with the row.
+ORGANIZATION_ID_SEQUENCE = func.pg_get_serial_sequence(
+    models.Organization.__tablename__, "id"
+)
+# Advisory lock key guarding organization paths. Moving a subtree takes it
+# exclusively, creating organizations (which copy their parent's path)
+# takes it shared.
+ORGANIZATION_TREE_LOCK = 0x6F7267
+
+
+@router.post(
+    "/bulk",
+    status_code=status.HTTP_201_CREATED,
+    response_model=list[OrganizationTree],
+)
+async def create_organizations(
+    organizations: list[OrganizationBulkCreate],
+    db_session: Database,
+    user: CurrentAdminUser,
+):
+    """
+    Create several organizations in one transaction.
+
+    The parent of an organization may be an existing organization or one
+    created by the same request.
+    """
+    if not organizations:
+        return []
+    await db_session.execute(
+        select(func.pg_advisory_xact_lock_shared(ORGANIZATION_TREE_LOCK))
+    )
+    by_name = {organization.name: organization for organization in organizations}
+    if len(by_name) != len(organizations):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Organization names must be unique",
+        )
+
+    external_parents = {
+        organization.parent
+        for organization in organizations
+        if organization.parent is not None and organization.parent not in by_name
+    }
+    existing_paths = dict(
+        (
+            await db_session.execute(
+                select(models.Organization.name, models.Organization.path).where(
+                    models.Organization.name
+                    == any_(literal(list(external_parents), ARRAY(String)))
+                )
+            )
+        ).all()
+    )
+    unknown_parents = external_parents - set(existing_paths)
+    if unknown_parents:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No parent organizations could be found with these names: "
+            + ", ".join(sorted(unknown_parents)),
+        )
+
+    ids = (
+        await db_session.scalars(
+            select(func.nextval(ORGANIZATION_ID_SEQUENCE)).select_from(
+                func.generate_series(1, len(organizations))
+            )
+        )
+    ).all()
+    ids_by_name = dict(zip(by_name, ids))
+
+    paths: dict[str, str] = {}
+
+    def path_of(name: str, pending: frozenset[str] = frozenset()) -> str:
+        if name in paths:
+            return paths[name]
+        if name in pending:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Organization {name} is its own ancestor",
+            )
+        parent = by_name[name].parent
+        if parent is None:
+            parent_path = "A"
+        elif parent in by_name:
+            parent_path = path_of(parent, pending | {name})
+        else:
+            parent_path = str(existing_paths[parent])
+        paths[name] = f"{parent_path}.{ids_by_name[name]}"
+        return paths[name]
+
+    created = (
+        await db_session.scalars(
+            insert(models.Organization)
+            .values(
+                [
+                    dict(
+                        id=ids_by_name[organization.name],
+                        name=organization.name,
+                        created_on=func.now(),
+                        path=Ltree(path_of(organization.name)),
+                        **organization.model_dump(
+                            exclude={"name", "parent"}, mode="json"
+                        ),
+                    )
+                    for organization in organizations
+                ]
+            )
+            .on_conflict_do_nothing()
+            .returning(models.Organization.name)
+        )
+    ).all()
+    if len(created) != len(organizations):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Organizations with these names already exist: "
+            + ", ".join(sorted(set(by_name) - set(created))),
+        )
+    # Every worker drops the cached subtrees the new organizations are part of
+    await notify(db_session, SUBTREE_CHANNEL, *paths.values())
+    await db_session.commit()
+
+    for path in paths.values():
+        subtree_cache.invalidate_ancestors(path)
+    return [
+        OrganizationTree(id=ids_by_name[name], name=name, path=paths[name])
+        for name in by_name
+    ]
+
+
 @router.post(
     "/{organization_name}",
     status_code=status.HTTP_201_CREATED,
@@ -26,40 +163,251 @@ async def create_organization(
     """
     Create a new organization.
     """
+    # The lock is its own statement: a statement reads the rows committed
+    # when it started, so the parent's path must be read by a statement
+    # starting after any move holding the lock has committed. The parent's
+    # existence can be checked along with it, since moves do not remove
+    # organizations.
+    parent_exists = (
+        await db_session.execute(
+            select(
+                func.pg_advisory_xact_lock_shared(ORGANIZATION_TREE_LOCK),
+                select(models.Organization.id)
+                .where(models.Organization.name == organization_fields.parent)
+                .exists(),
+            )
+        )
+    ).one()[1]
+    if organization_fields.parent is not None and not parent_exists:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No parent organization could be found with that name",
+        )
 
-    parent_organization_path = (await db_session.scalars(
-        select(models.Organization.path).where(
-            models.Organization.name == organization_fields.parent
+    # The organization's path is "<parent_organization.path>.<organization_id>",
+    # or "A.<organization_id>" without a parent. The id is drawn first so
+    # that the row is inserted with its final path, and the other workers are
+    # notified of it, in a single statement.
+    new_id = select(func.nextval(ORGANIZATION_ID_SEQUENCE).label("id")).cte("new_id")
+    parent_path = (
+        select(func.ltree2text(models.Organization.path))
+        .where(models.Organization.name == organization_fields.parent)
+        .scalar_subquery()
+    )
+    values = dict(
+        name=organization_name,
+        **organization_fields.model_dump(exclude={"parent"}, mode="json"),
+    )
+    columns = models.Organization.__table__.columns
+    created = (
+        insert(models.Organization)
+        .from_select(
+            ["id", "created_on", "path", *values],
+            select(
+                new_id.c.id,
+                func.now(),
+                func.text2ltree(
+                    func.concat(func.coalesce(parent_path, "A"), ".", new_id.c.id)
+                ),
+                *(
+                    literal(value, columns[name].type)
+                    for name, value in values.items()
+                ),
+            ),
         )
-    )).first()
-    try:
-        organization_id = (await  db_session.scalars(
-            insert(models.Organization)
-            .values(
-                name=organization_name,
-                created_on=func.now(),
-                # The organization requires a path field which is in the form
-                # "<parent_organization.path>.<organization_id>" in order to
-                # achieve this, we insert the organization with a placeholder
-                # path of "1", and then update it with the correct path
-                path=Ltree("A"),
-                **organization_fields.model_dump(exclude={"parent"}, mode="json"),
+        .add_cte(new_id)
+        .on_conflict_do_nothing()
+        .returning(models.Organization.path)
+        .cte("created")
+    )
+    # The only UNIQUE field on this table is "name".
+    path = expect(
+        await db_session.scalar(
+            # The new organization is part of the subtree of every ancestor,
+            # on every worker
+            select(
+                func.ltree2text(created.c.path),
+                func.pg_notify(SUBTREE_CHANNEL, func.ltree2text(created.c.path)),
+            )
+        ),
+        "An organization with that name already exists",
+        status.HTTP_409_CONFLICT,
+    )
+    await db_session.commit()
+    subtree_cache.invalidate_ancestors(path)
+
+
+@router.patch(
+    "/{organization_name}/parent",
+    status_code=status.HTTP_200_OK,
+    response_model=OrganizationTree,
+)
+async def move_organization(
+    organization_name: str,
+    fields: OrganizationParentUpdate,
+    db_session: Database,
+    user: CurrentAdminUser,
+    subtree: OrganizationSubtree,
+):
+    """
+    Move an organization, and every organization below it, under another
+    parent.
+    """
+    await db_session.execute(select(func.pg_advisory_xact_lock(ORGANIZATION_TREE_LOCK)))
+    organizations = {
+        row.name: row
+        for row in (
+            await db_session.execute(
+                select(
+                    models.Organization.id,
+                    models.Organization.name,
+                    models.Organization.path,
+                ).where(
+                    models.Organization.name
+                    == any_(literal([organization_name, fields.parent], ARRAY(String)))
+                )
             )
-            .returning(models.Organization.id)
-        )).first()
-        await db_session.commit()
-    except IntegrityError as error:
-        # The error that can occur here is a 409 (Conflict)
-        # and the only UNIQUE field on this table is "name".
+        ).all()
+    }
+
+    organization = organizations.get(organization_name)
+    if organization is None or organization.id not in subtree:
         raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail="An organization with that name already exists",
-        ) from error
-    print(organization_id)
-    query = (
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No organization could be found with that name",
+        )
+    if fields.parent is None:
+        parent_path = "A"
+    else:
+        parent = organizations.get(fields.parent)
+        if parent is None or parent.id not in subtree:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="No parent organization could be found with that name",
+            )
+        parent_path = str(parent.path)
+
+    old_path = str(organization.path)
+    if parent_path == old_path or parent_path.startswith(f"{old_path}."):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="An organization cannot be moved below itself",
+        )
+
+    # Swap the old parent's prefix for the new one on the whole subtree.
+    # "path <@ old_path" is answered by the GiST index on path.
+    await db_session.execute(
         update(models.Organization)
-        .where(models.Organization.id == organization_id)
-        .values(path=Ltree(f"{parent_organization_path or 'A'}.{organization_id}"))
+        .where(models.Organization.path.descendant_of(Ltree(old_path)))
+        .values(
+            path=func.text2ltree(parent_path).op("||")(
+                func.subpath(models.Organization.path, len(old_path.split(".")) - 1)
+            )
+        )
+        .execution_options(synchronize_session=False)
     )
-    await db_session.execute(query)
+    # Every cached subtree above the old or the new position changed, and the
+    # paths cached for the moved organizations are stale, on every worker.
+    await notify(db_session, SUBTREE_CHANNEL, "")
     await db_session.commit()
+    subtree_cache.clear()
+    return OrganizationTree(
+        id=organization.id,
+        name=organization.name,
+        path=f"{parent_path}.{old_path.rpartition('.')[2]}",
+    )
+
+
+@router.get(
+    "/{organization_name}/tree",
+    status_code=status.HTTP_200_OK,
+    response_model=OrganizationTree,
+)
+async def get_organization_tree(
+    organization_name: str,
+    db_session: ReadDatabase,
+    subtree: ReadOrganizationSubtree,
+    depth: int | None = Query(
+        default=None,
+        ge=0,
+        description="Number of levels below the organization to return",
+    ),
+):
+    """
+    Return an organization and the organizations below it as a tree, with
+    the number of institutions and users of each.
+    """
+    rows = (
+        await db_session.execute(organization_tree_query(organization_name, depth))
+    ).all()
+    if not rows or rows[0].id not in subtree:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No organization could be found with that name",
+        )
+    return build_organization_tree(rows)
+
+
+def organization_tree_query(organization_name: str, depth: int | None) -> Select:
+    """
+    Select an organization and the organizations below it, up to `depth`
+    levels down, parents first, with the number of institutions and users of
+    each.
+
+    The counts are correlated subqueries answered from the organization_id
+    indexes, so the cost grows with the size of the subtree rather than with
+    the number of users and institutions.
+    """
+    root = (
+        select(models.Organization.path)
+        .where(models.Organization.name == organization_name)
+        .cte("root")
+    )
+    institution_count = (
+        select(func.count())
+        .where(models.Institution.organization_id == models.Organization.id)
+        .scalar_subquery()
+    )
+    user_count = (
+        select(func.count())
+        .where(models.User.organization_id == models.Organization.id)
+        .scalar_subquery()
+    )
+    query = (
+        select(
+            models.Organization.id,
+            models.Organization.name,
+            models.Organization.path,
+            institution_count.label("institution_count"),
+            user_count.label("user_count"),
+        )
+        .join(root, models.Organization.path.descendant_of(root.c.path))
+        # Parents sort before their children
+        .order_by(models.Organization.path)
+    )
+    if depth is not None:
+        query = query.where(
+            func.nlevel(models.Organization.path) <= func.nlevel(root.c.path) + depth
+        )
+    return query
+
+
+def build_organization_tree(rows: Sequence[Row]) -> OrganizationTree:
+    """
+    Nest the rows of `organization_tree_query` below the first one.
+    """
+    nodes: dict[str, OrganizationTree] = {}
+    for row in rows:
+        path = str(row.path)
+        node = OrganizationTree(
+            id=row.id,
+            name=row.name,
+            path=path,
+            institution_count=row.institution_count,
+            user_count=row.user_count,
+        )
+        nodes[path] = node
+        parent = nodes.get(path.rpartition(".")[0])
+        if parent is not None:
+            parent.children.append(node)
+    return nodes[str(rows[0].path)]
@@ -6,8 +6,9 @@ from sqlalchemy import and_, select
 
 import app.schemas
 from app import models
-from app.dependencies import CurrentUser, Database, Patient
-from app.utils import expect
+from app.cohort import patient_cohorts
+from app.dependencies import CurrentUser, Database
+from app.utils import expect, insert_or_conflict
 
 router = APIRouter(
     prefix="/patient", tags=["patient"], responses={404: {"description": "Not Found"}}
@@ -20,7 +21,6 @@ router = APIRouter(
 async def post_patient(
     fields: app.schemas.PatientCreate,
     patient_code: str,
-    patient: Patient,
     db_session: Database,
     user: CurrentUser,
 ):
@@ -28,10 +28,6 @@ async def post_patient(
     Create a new Patient in DB
     """
 
-    if patient:
-        raise HTTPException(
-            409, detail="There is already a patient with this credentials"
-        )
     if fields.institution_name:
         institution_id: int = expect(
            (await db_session.scalars(
@@ -60,16 +56,20 @@ async def post_patient(
     else:
         clinician_id = cast(int, user.institution_id)
 
-    new_patient = models.Patient(
-        institution_id=institution_id,
-        patient_code=patient_code,
-        clinician_id=clinician_id,
-        updated_on=datetime.now(),
-        created_on=datetime.now(),
-        **fields.model_dump(
-            exclude={"institution_name", "clinician_code", "patient_code"}
+    patient = await insert_or_conflict(
+        db_session,
+        models.Patient,
+        dict(
+            institution_id=institution_id,
+            patient_code=patient_code,
+            clinician_id=clinician_id,
+            updated_on=datetime.now(),
+            created_on=datetime.now(),
+            **fields.model_dump(
+                exclude={"institution_name", "clinician_code", "patient_code"}
+            ),
         ),
+        error_msg="There is already a patient with this credentials",
     )
-
-    db_session.add(new_patient)
     await db_session.commit()
+    await patient_cohorts.index(db_session, patient.registration_id)
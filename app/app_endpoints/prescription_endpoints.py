@@ -1,14 +1,22 @@
+import logging
+import time
 import zoneinfo
 from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Literal
 
-from fastapi import APIRouter, HTTPException, Query, status
-from sqlalchemy import orm, select
-from sqlalchemy.orm import load_only
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Row, Select, orm, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import app.schemas
 from app import models
+from app.catalog import medication_catalog
 from app.commons import PrescriptionStatusType
-from app.dependencies import Clinician, Database, Patient, Prescription
+from app.database import sessionmanager
+from app.dependencies import (CurrentReadUser, CurrentUser, Database,
+                              PrescriptionReferences, ReadDatabase)
+from app.utils import decode_cursor, encode_cursor, insert_or_conflict
 
 router = APIRouter(
     prefix="/prescription",
@@ -16,6 +24,13 @@ router = APIRouter(
     responses={404: {"description": "Not Found"}},
 )
 
+logger = logging.getLogger(__name__)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# Number of rows fetched from the server-side cursor and serialized at a time
+# when streaming prescriptions.
+STREAM_CHUNK_SIZE = 1_000
+
 
 @router.post(
     "/{prescription_id}", status_code=status.HTTP_201_CREATED, response_model=None
@@ -23,50 +38,47 @@ router = APIRouter(
 async def post_prescription(
     fields: app.schemas.PrescriptionCreate,
     prescription_code: str,
-    existing_prescription: Prescription,
-    patient: Patient,
-    clinician: Clinician,
+    references: PrescriptionReferences,
     medication_code: list[str],
     database: Database,
+    user: CurrentUser,
 ):
     """
     Create a new OPrescription in DB
     """
-    if not patient:
+    if references.patient_id is None:
         raise HTTPException(404, detail="Patient not found")
-    if not clinician:
+    if references.clinician_id is None:
         raise HTTPException(404, detail="Clinician not found")
 
-    if existing_prescription:
+    medications = await medication_catalog.resolve(database, medication_code)
+    missing = sorted(set(medication_code) - set(medications))
+    if missing:
         raise HTTPException(
-            409, detail="There is already a prescription with this credentials"
+            404, detail=f"Medication codes not found: {', '.join(missing)}"
         )
-    medication_json = {}
-
-    for code in medication_code:
-        medication = ( await database.scalars(
-            select(models.Medication)
-            .where(models.Medication.code_name == code)
-            .options(load_only(models.Medication.indications, models.Medication.dosage))
-        )).first()
-        if not medication:
-            raise HTTPException(404, detail=f"Medication code not found{code}")
-        medication_json[code] = {
-            "indications": medication.indications,
-            "dossage": medication.dosage,
-        }
-
-    new_prescription = models.Prescription(
-        clinician_refrence=clinician.registration_id,
-        patient_refrence=patient.registration_id,
-        prescription_code=prescription_code,
-        updated_on=datetime.now(),
-        created_on=datetime.now(),
-        medication_json=medication_json,
-        **fields.model_dump(exclude={"patient_name", "clinician_name"}),
-    )
+    medication_json = {
+        code: {"indications": medication.indications, "dossage": medication.dosage}
+        for code, medication in medications.items()
+    }
+    # created_on is stored as naive UTC, like apointment_date
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
 
-    database.add(new_prescription)
+    await insert_or_conflict(
+        database,
+        models.Prescription,
+        dict(
+            clinician_refrence=references.clinician_id,
+            patient_refrence=references.patient_id,
+            prescription_code=prescription_code,
+            updated_on=now,
+            created_on=now,
+            medication_json=medication_json,
+            **fields.model_dump(exclude={"patient_name", "clinician_name"}),
+        ),
+        error_msg="There is already a prescription with this credentials",
+        registry=models.PrescriptionCode.prescription_code,
+    )
     await database.commit()
 
 
@@ -76,7 +88,9 @@ async def post_prescription(
     response_model=list[app.schemas.GetPrescription],
 )
 async def get_medication_prescription_for_a_patient(
-    database: Database,
+    database: ReadDatabase,
+    request: Request,
+    response: Response,
     status_: PrescriptionStatusType | None = Query(
         default=None,
         description="Filter a medication by it's status",
@@ -91,9 +105,39 @@ async def get_medication_prescription_for_a_patient(
         alias="end_date",
         description="End Date of Prescription",  # noqa: E501
     ),
+    patient_code: str | None = Query(
+        default=None,
+        description="Only return prescriptions of this patient",
+    ),
+    clinician_code: str | None = Query(
+        default=None,
+        description="Only return prescriptions written by this clinician",
+    ),
+    limit: int = Query(
+        default=100,
+        ge=1,
+        le=1_000,
+        description="Maximum number of prescriptions to return",
+    ),
+    cursor: str | None = Query(
+        default=None,
+        description="The X-Next-Cursor header of the previous page",
+    ),
+    format_: Literal["json", "ndjson"] = Query(
+        default="json",
+        alias="format",
+        description="ndjson streams every matching prescription, one per line",
+    ),
 ):
     """
     # Return a list of medication requests, inlcuding medication code and the clinician first and last name
+
+    Prescriptions are returned oldest first, one page at a time. When there
+    are more, the `X-Next-Cursor` response header holds the cursor of the
+    next page.
+
+    With `format=ndjson` (or `Accept: application/x-ndjson`) every matching
+    prescription is streamed instead, ignoring `limit`.
     """
     # construct WHERE clause
     filters = []
@@ -127,11 +171,132 @@ async def get_medication_prescription_for_a_patient(
             "end time cannot be in the future",
         )
 
+    # created_on is stored as naive UTC
+    filters.append(
+        models.Prescription.created_on.between(
+            start_date_.astimezone(timezone.utc).replace(tzinfo=None),
+            end_date_.astimezone(timezone.utc).replace(tzinfo=None),
+        )
+    )
+
     if status_ is not None:
         filters.append(models.Prescription.prescription_status == status_)
+    if patient_code is not None:
+        filters.append(
+            models.Prescription.patient_refrence
+            == select(models.Patient.registration_id)
+            .where(models.Patient.patient_code == patient_code)
+            .scalar_subquery()
+        )
+    if clinician_code is not None:
+        filters.append(
+            models.Prescription.clinician_refrence
+            == select(models.Clinician.registration_id)
+            .where(models.Clinician.clinician_code == clinician_code)
+            .scalar_subquery()
+        )
+
+    if cursor is not None:
+        filters.append(after_cursor(cursor))
+
+    query = prescription_listing_query(*filters)
+
+    if format_ == "ndjson" or NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+        # The stream opens its own session, which has to honour the client's
+        # read-your-writes marker too
+        return StreamingResponse(
+            stream_prescriptions(
+                query, primary=sessionmanager.wrote_recently(request)
+            ),
+            media_type=NDJSON_MEDIA_TYPE,
+        )
+
+    return await fetch_page(database, query, limit, response)
+
+
+@router.get(
+    "/by-medication/{medication_code}",
+    status_code=status.HTTP_200_OK,
+    response_model=list[app.schemas.GetPrescription],
+)
+async def get_prescriptions_by_medication(
+    medication_code: str,
+    database: ReadDatabase,
+    user: CurrentReadUser,
+    response: Response,
+    limit: int = Query(
+        default=100,
+        ge=1,
+        le=1_000,
+        description="Maximum number of prescriptions to return",
+    ),
+    cursor: str | None = Query(
+        default=None,
+        description="The X-Next-Cursor header of the previous page",
+    ),
+):
+    """
+    Return the prescriptions including a medication, oldest first, e.g. to
+    find the patients affected by a recall.
+
+    Paginated like `GET /prescription/`.
+    """
+    # medication_json is keyed by medication code, so this is a key lookup
+    # in the GIN index on medication_json.
+    filters = [models.Prescription.medication_json.has_key(medication_code)]
+    if cursor is not None:
+        filters.append(after_cursor(cursor))
+
+    return await fetch_page(
+        database, prescription_listing_query(*filters), limit, response
+    )
+
+
+def after_cursor(cursor: str):
+    """
+    Filter on the rows after the cursor of the previous page.
+
+    Seeks past the last row of the previous page using the
+    (created_on, prescription_id) index rather than an OFFSET.
+    """
+    try:
+        created_on, prescription_id = decode_cursor(cursor)
+        last_row = (datetime.fromisoformat(created_on), int(prescription_id))
+    except (TypeError, ValueError) as error:
+        raise HTTPException(
+            status.HTTP_422_UNPROCESSABLE_ENTITY, "Invalid cursor"
+        ) from error
+    return (
+        tuple_(models.Prescription.created_on, models.Prescription.prescription_id)
+        > tuple_(*last_row)
+    )
+
 
-    return ( await database.execute(
+async def fetch_page(
+    database: AsyncSession, query: Select, limit: int, response: Response
+) -> list[Row]:
+    """
+    Return the first `limit` rows of a prescription listing, setting the
+    X-Next-Cursor header when there are more.
+    """
+    prescriptions = (await database.execute(query.limit(limit + 1))).all()
+
+    if len(prescriptions) > limit:
+        prescriptions = prescriptions[:limit]
+        last = prescriptions[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(
+            last.prescription_date.isoformat(), last.prescription_id
+        )
+    return prescriptions
+
+
+def prescription_listing_query(*filters) -> Select:
+    """
+    Select the prescriptions matching the filters, oldest first.
+    """
+    return (
         select(
+            models.Prescription.prescription_id,
             models.Prescription.reason,
             models.Prescription.created_on.label("prescription_date"),
             models.Prescription.start_date,
@@ -154,6 +319,43 @@ async def get_medication_prescription_for_a_patient(
             models.Prescription.patient_refrence == models.Patient.registration_id,
         )
         .filter(*filters)
+        .order_by(
+            models.Prescription.created_on, models.Prescription.prescription_id
+        )
     )
-    ).all()
 
+
+async def stream_prescriptions(
+    query: Select, primary: bool = False
+) -> AsyncIterator[bytes]:
+    """
+    Serialize the rows of a prescription listing as NDJSON.
+
+    Rows are read from a server-side cursor and serialized STREAM_CHUNK_SIZE
+    at a time, so memory does not grow with the size of the result. The
+    stream opens its own session since it outlives the request handler, on
+    the primary when `primary` is set.
+    """
+    rows = 0
+    start = time.perf_counter()
+    async with sessionmanager.read_session(primary=primary) as session:
+        result = await session.stream(
+            query.execution_options(yield_per=STREAM_CHUNK_SIZE)
+        )
+        async for partition in result.partitions():
+            yield b"".join(
+                app.schemas.GetPrescription.model_validate(row)
+                .model_dump_json()
+                .encode()
+                + b"\n"
+                for row in partition
+            )
+            rows += len(partition)
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        "Streamed %d prescriptions in %.2fs (%.0f rows/s)",
+        rows,
+        elapsed,
+        rows / elapsed if elapsed else 0,
+    )
@@ -22,9 +22,15 @@ from sqlalchemy.orm import joinedload
 from sqlalchemy.sql import select
 
 from app import models
-from app.dependencies import CurrentAdminUser, CurrentUser, Database
+from app.dependencies import (CurrentAdminUser, CurrentReadAdminUser,
+                              CurrentReadUser, CurrentUser, Database,
+                              OrganizationSubtree, ReadDatabase,
+                              ReadOrganizationSubtree, PRINCIPAL_CHANNEL,
+                              in_subtree, principal_cache)
+from app.notifications import notify
 from app.schemas import UserCreate, UserPasswordUpdate, UserUpdate
 from app.security import get_password_hash, verify_password
+from app.utils import insert_or_conflict
 
 router = APIRouter(
     prefix="/user", tags=["user"], responses={404: {"description": "Not Found"}}
@@ -33,7 +39,7 @@ router = APIRouter(
 
 @router.get("/me", response_model=None)
 async def get_current_user(
-    user: CurrentUser,
+    user: CurrentReadUser,
 ):
     """
     Get the currently logged in user.
@@ -60,24 +66,29 @@ async def update_password(
             detail="New password and confirm password do not match.",
         )
 
-    if verify_password(password_fields.new_password, existing_password_hash):
+    if await verify_password(password_fields.new_password, existing_password_hash):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="New password must be different from old password.",
         )
 
-    if not verify_password(password_fields.old_password, existing_password_hash):
+    if not await verify_password(password_fields.old_password, existing_password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect password."
         )
 
+    new_password_hash = await get_password_hash(password_fields.new_password)
+    # Read before the commit expires the user's attributes
+    username = user.username
     query = (
         update(models.User)
         .where(models.User.id == user.id)
-        .values(pword_hash=get_password_hash(password_fields.new_password))
+        .values(pword_hash=new_password_hash)
     )
     await db_session.execute(query)
+    await notify(db_session, PRINCIPAL_CHANNEL, username)
     await db_session.commit()
+    principal_cache.invalidate(username)
 
 
 @router.put("/me")
@@ -108,6 +119,9 @@ async def update_current_user(
             detail="A user with that username or email already exists",
         )
 
+    # Principals are cached under the old username, which the update below
+    # also writes into `user`
+    old_username = user.username
     query = (
         update(models.User)
         .where(models.User.id == user.id)
@@ -119,27 +133,26 @@ async def update_current_user(
         )
     )
     await database.execute(query)
+    await notify(database, PRINCIPAL_CHANNEL, old_username)
     await database.commit()
+    principal_cache.invalidate(old_username)
 
 
 @router.get("/users/{username}", response_model=None)
 async def get_user(
     username: str,
-    user: CurrentAdminUser,
-    db_session: Database,
+    user: CurrentReadAdminUser,
+    subtree: ReadOrganizationSubtree,
+    db_session: ReadDatabase,
 ):
-    user = await(
-        select(models.User)
-        .where(models.User.username == username)
-        .options(joinedload(models.User.organization))
-        .where(
-            models.User.organization_id.in_(
-                select(models.Organization.id).where(
-                    models.Organization.path.descendant_of(user.organization.path)
-                )
-            )
+    user = (
+        await db_session.scalars(
+            select(models.User)
+            .where(models.User.username == username)
+            .options(joinedload(models.User.organization))
+            .where(in_subtree(models.User.organization_id, subtree))
         )
-    )
+    ).first()
     return user
 
 @router.post("/{username}")
@@ -148,25 +161,18 @@ async def create_user(
     user: UserCreate,
     db_session: Database,
     current_user: CurrentUser,
+    subtree: OrganizationSubtree,
 ):
     """
     Create a new user in your organization.
     """
-    existing_user =  (await db_session.scalars(select(models.User).where(models.User.username == username))).first()
-    if existing_user:
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail="A user with that username or email already exists",
-        )
     if not user.organization_name:
         organization_id = current_user.organization_id
     else:
         organization_id =  (await db_session.scalars(
             select(models.Organization.id)
             .where(models.Organization.name == user.organization_name)
-            .where(
-                models.Organization.path.descendant_of(current_user.organization.path)
-            )
+            .where(in_subtree(models.Organization.id, subtree))
         )).first()
 
         if organization_id is None:
@@ -174,16 +180,21 @@ async def create_user(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="No organization could be found with that name",
             )
-    query = insert(models.User).values(
+    password_hash = await get_password_hash(user.password)
+    await insert_or_conflict(
+        db_session,
+        models.User,
+        dict(
             username=username,
             email=user.email,
             firstname=user.firstname,
             lastname=user.lastname,
-            pword_hash=get_password_hash(user.password),
+            pword_hash=password_hash,
             organization_id=organization_id,
             can_edit=user.is_admin,
-        )
-    user = await db_session.execute(query)
+        ),
+        error_msg="A user with that username or email already exists",
+    )
     await db_session.commit()
 
 
@@ -197,6 +208,7 @@ async def delete_user(
     username: str,
     db_session: Database,
     current_user: CurrentAdminUser,
+    subtree: OrganizationSubtree,
 ):
     if username == current_user.username:
         raise HTTPException(
@@ -209,15 +221,7 @@ async def delete_user(
         .where(
             models.User.username == username,
         )
-        .where(
-            models.User.organization_id.in_(
-                select(models.Organization.id).where(
-                    models.Organization.path.descendant_of(
-                        current_user.organization.path
-                    )
-                )
-            )
-        )
+        .where(in_subtree(models.User.organization_id, subtree))
     )
     ).first()
 
@@ -230,4 +234,6 @@ async def delete_user(
 
     query = (delete(models.User).where(models.User.username == username))
     await db_session.execute(query)
+    await notify(db_session, PRINCIPAL_CHANNEL, username)
     await db_session.commit()
+    principal_cache.invalidate(username)
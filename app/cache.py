@@ -0,0 +1,143 @@
+import time
+from collections import OrderedDict
+from typing import Any, Generic, Hashable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    """
+    A bounded, least recently used cache whose entries expire at an absolute
+    unix timestamp.
+
+    Expired entries are dropped lazily when they are looked up, and the least
+    recently used entry is evicted when the cache is full.
+    """
+
+    def __init__(self, maxsize: int):
+        self._maxsize = maxsize
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: K) -> V | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.time():
+            self._remove(key)
+            self.evictions += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: K, value: V, expires_at: float) -> None:
+        if key in self._entries:
+            self._remove(key)
+        elif len(self._entries) >= self._maxsize:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+        self._entries[key] = (expires_at, value)
+
+    def pop(self, key: K) -> V | None:
+        if key not in self._entries:
+            return None
+        return self._remove(key)
+
+    def clear(self) -> None:
+        for key in list(self._entries):
+            self._remove(key)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "size": len(self._entries),
+            "maxsize": self._maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _remove(self, key: K) -> V:
+        _, value = self._entries.pop(key)
+        self._on_remove(key, value)
+        return value
+
+    def _on_remove(self, key: K, value: V) -> None:
+        """
+        Hook called whenever an entry leaves the cache.
+        """
+
+
+class PrincipalCache(TTLCache[str, Any]):
+    """
+    Verified users keyed by the `jti` of the access token they were loaded
+    for, with a secondary index on the username so that every token of a user
+    can be dropped when that user is updated or deleted.
+    """
+
+    def __init__(self, maxsize: int):
+        super().__init__(maxsize)
+        self._tokens_by_username: dict[str, set[str]] = {}
+
+    def set(self, key: str, value: Any, expires_at: float) -> None:
+        super().set(key, value, expires_at)
+        self._tokens_by_username.setdefault(value.username, set()).add(key)
+
+    def invalidate(self, username: str) -> None:
+        """
+        Drop every cached principal belonging to the given username.
+        """
+        for jti in list(self._tokens_by_username.get(username, ())):
+            self.pop(jti)
+
+    def _on_remove(self, key: str, value: Any) -> None:
+        tokens = self._tokens_by_username.get(value.username)
+        if tokens is None:
+            return
+        tokens.discard(key)
+        if not tokens:
+            del self._tokens_by_username[value.username]
+
+
+class SubtreeCache(TTLCache[int, tuple[str, list[int]]]):
+    """
+    The path of an organization and the ids of the organizations below it,
+    itself included, keyed by the organization's id, with a secondary index
+    on the path so that the subtrees containing a new organization can be
+    dropped.
+    """
+
+    def __init__(self, maxsize: int):
+        super().__init__(maxsize)
+        self._ids_by_path: dict[str, int] = {}
+
+    def set(
+        self, key: int, value: tuple[str, list[int]], expires_at: float
+    ) -> None:
+        super().set(key, value, expires_at)
+        self._ids_by_path[value[0]] = key
+
+    def invalidate_ancestors(self, path: str) -> None:
+        """
+        Drop the cached subtrees that contain the organization at `path`.
+        """
+        labels = path.split(".")
+        for depth in range(1, len(labels) + 1):
+            organization_id = self._ids_by_path.get(".".join(labels[:depth]))
+            if organization_id is not None:
+                self.pop(organization_id)
+
+    def _on_remove(self, key: int, value: tuple[str, list[int]]) -> None:
+        if self._ids_by_path.get(value[0]) == key:
+            del self._ids_by_path[value[0]]
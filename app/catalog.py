@@ -0,0 +1,142 @@
+from typing import Any, Iterable, NamedTuple
+
+from sqlalchemy import String, any_, literal, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.notifications import notification_listener
+from app.suggest import SuggestIndex, Suggestion
+
+# Postgres channel on which the code name of every created medication is
+# sent, for the other workers to add it to their snapshot
+MEDICATION_CHANNEL = "medication_created"
+
+
+class CatalogEntry(NamedTuple):
+    indications: str | None
+    dosage: str | None
+
+
+# Names a medication can be found by in `MedicationCatalog.suggest`
+NAME_COLUMNS = (
+    models.Medication.medication_name,
+    models.Medication.brand_name,
+    models.Medication.code_name,
+    models.Medication.international_code_name,
+)
+# The hot columns of medication_tab that prescriptions and suggestions need,
+# selected as plain columns rather than Medication entities so that the cold
+# columns and medication_detail_tab are never read
+CATALOG_COLUMNS = (
+    models.Medication.code_name,
+    models.Medication.indications,
+    models.Medication.dosage,
+    *NAME_COLUMNS,
+)
+
+
+class MedicationCatalog:
+    """
+    An in-process snapshot of the medication catalog, keyed by `code_name`,
+    with a prefix index over the medications' names.
+
+    The snapshot is loaded at startup and extended when a medication is
+    created. Medications created by other workers are announced on
+    MEDICATION_CHANNEL and fetched by the next `refresh`, or on their first
+    lookup if that comes sooner, so the snapshot never has to be reloaded.
+    `version` is bumped whenever the snapshot changes.
+    """
+
+    def __init__(self):
+        self._entries: dict[str, CatalogEntry] = {}
+        self._names = SuggestIndex()
+        # Codes announced on MEDICATION_CHANNEL, not fetched yet
+        self._pending: set[str] = set()
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def load(self, db_session: AsyncSession) -> None:
+        entries = {}
+        names = []
+        result = await db_session.stream(select(*CATALOG_COLUMNS))
+        async for code_name, indications, dosage, *medication_names in result:
+            entries[code_name] = CatalogEntry(indications, dosage)
+            names.extend((code_name, name) for name in medication_names)
+        self._entries = entries
+        self._names.build(names)
+        self.version += 1
+
+    def add(
+        self,
+        code_name: str,
+        indications: str | None,
+        dosage: str | None,
+        names: Iterable[str | None] = (),
+    ) -> None:
+        self._entries[code_name] = CatalogEntry(indications, dosage)
+        self._names.add(code_name, names)
+        self.version += 1
+
+    def suggest(self, prefix: str, limit: int) -> list[Suggestion]:
+        return self._names.suggest(prefix, limit)
+
+    async def resolve(
+        self, db_session: AsyncSession, codes: Iterable[str]
+    ) -> dict[str, CatalogEntry]:
+        """
+        Look up the given codes, fetching those missing from the snapshot
+        with a single query. Codes that do not exist are left out.
+        """
+        codes = set(codes)
+        missing = [code for code in codes if code not in self._entries]
+        self.hits += len(codes) - len(missing)
+        self.misses += len(missing)
+        await self._fetch(db_session, missing)
+        return {
+            code: self._entries[code] for code in codes if code in self._entries
+        }
+
+    def on_created(self, code_name: str) -> None:
+        if code_name not in self._entries:
+            self._pending.add(code_name)
+
+    async def refresh(self, db_session: AsyncSession) -> None:
+        """
+        Fetch the medications announced since the last refresh.
+        """
+        pending, self._pending = self._pending, set()
+        await self._fetch(
+            db_session, [code for code in pending if code not in self._entries]
+        )
+
+    async def _fetch(self, db_session: AsyncSession, codes: list[str]) -> None:
+        if not codes:
+            return
+        rows = (
+            await db_session.execute(
+                select(*CATALOG_COLUMNS).where(
+                    models.Medication.code_name == any_(literal(codes, ARRAY(String)))
+                )
+            )
+        ).all()
+        for code_name, indications, dosage, *names in rows:
+            self.add(code_name, indications, dosage, names)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "size": len(self._entries),
+            "names": len(self._names),
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "pending": len(self._pending),
+        }
+
+
+medication_catalog = MedicationCatalog()
+notification_listener.subscribe(MEDICATION_CHANNEL, medication_catalog.on_created)
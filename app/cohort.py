@@ -0,0 +1,370 @@
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict
+from datetime import date, datetime, timedelta
+from enum import Enum
+from typing import Any, Iterable
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.schemas import CohortCriteria
+
+# Low cardinality attributes, each value of which gets its own bitmap
+BITMAP_COLUMNS = (
+    models.Patient.is_active,
+    models.Patient.is_smoker,
+    models.Patient.is_alcohool_drinker,
+    models.Patient.is_donor,
+    models.Patient.is_armed_forces,
+    models.Patient.blood_type,
+    models.Patient.gender,
+)
+
+# Number of sets of institutions (a trial's scope, or those of a criteria)
+# whose bitmap is kept up to date
+SCOPE_CACHE_SIZE = 64
+
+COHORT_COLUMNS = (
+    models.Patient.registration_id,
+    models.Patient.updated_on,
+    models.Patient.date_of_birth,
+    models.Patient.institution_id,
+    *BITMAP_COLUMNS,
+)
+
+
+def _key(value: Any) -> Any:
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def bitmap_of(ids: Iterable[int]) -> int:
+    """
+    Build the bitmap with the bits of `ids` set.
+    """
+    ids = list(ids)
+    if not ids:
+        return 0
+    bits = bytearray((max(ids) >> 3) + 1)
+    for id_ in ids:
+        bits[id_ >> 3] |= 1 << (id_ & 7)
+    return int.from_bytes(bits, "little")
+
+
+def ids_of(bitmap: int, limit: int | None = None) -> list[int]:
+    """
+    Return the (first `limit`) ids set in `bitmap`, in increasing order.
+    """
+    ids = []
+    # Reversed, so that the position of each "1" is the id it stands for
+    bits = bin(bitmap)[:1:-1]
+    index = bits.find("1")
+    while index != -1 and (limit is None or len(ids) < limit):
+        ids.append(index)
+        index = bits.find("1", index + 1)
+    return ids
+
+
+def years_before(day: date, years: int) -> date:
+    if years >= day.year:
+        return date.min
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:
+        # 29 February
+        return day.replace(year=day.year - years, day=28)
+
+
+class PatientCohorts:
+    """
+    Bitmap indexes over the patients, for selecting trial cohorts.
+
+    Bitmaps are Python ints in which bit `registration_id` is set for every
+    patient having a given attribute value, so criteria are evaluated with
+    `&`, `|` and `~` over whole bitmaps and counted with `int.bit_count`,
+    without touching the database.
+
+    Every value of a low cardinality attribute and every year of birth has a
+    bitmap. Institutions and exact dates of birth have too many values for a
+    bitmap each, so they are kept as arrays of ids, from which the bitmap of
+    the first and last years of an age range is built on demand. The bitmaps
+    of the last SCOPE_CACHE_SIZE sets of institutions queried are kept, and
+    updated along with the others.
+
+    The indexes are loaded at startup, then extended by the worker's own
+    writes and by `refresh`, which picks up the patients created or updated
+    since the last load. The values each patient is indexed under are kept,
+    so that re-indexing a patient only touches its own bitmaps, and is
+    skipped when they did not change.
+    """
+
+    def __init__(self):
+        self._bitmaps: dict[tuple[str, Any], int] = {}
+        self._born_in: dict[int, int] = {}
+        # Ids by date of birth ordinal, and sorted ids by institution
+        self._birth_ids: dict[int, array] = {}
+        self._institutions: dict[int, array] = {}
+        self._scopes: OrderedDict[frozenset[int], int] = OrderedDict()
+        # The BITMAP_COLUMNS values of the patients, interned
+        self._profiles: list[tuple] = []
+        self._profile_ids: dict[tuple, int] = {}
+        # By registration id, the profile, date of birth ordinal and
+        # institution of each patient, -1 when not indexed or none
+        self._profile_of = array("l")
+        self._birth_of = array("l")
+        self._institution_of = array("l")
+        self._patients = 0
+        self.watermark: datetime | None = None
+
+    def __len__(self) -> int:
+        return self._patients.bit_count()
+
+    def _intern(self, row: Any) -> tuple[int, int, int, int]:
+        """
+        The registration id and indexed values of a COHORT_COLUMNS row.
+        """
+        registration_id, _, date_of_birth, institution_id, *values = row
+        profile = tuple(_key(value) for value in values)
+        profile_id = self._profile_ids.get(profile)
+        if profile_id is None:
+            profile_id = self._profile_ids[profile] = len(self._profiles)
+            self._profiles.append(profile)
+        return (
+            registration_id,
+            profile_id,
+            _key(date_of_birth).toordinal(),
+            -1 if institution_id is None else institution_id,
+        )
+
+    async def load(self, db_session: AsyncSession) -> None:
+        ids: dict[tuple[str, Any], list[int]] = defaultdict(list)
+        born_in: dict[int, list[int]] = defaultdict(list)
+        birth_ids: dict[int, array] = defaultdict(lambda: array("l"))
+        institutions: dict[int, array] = defaultdict(lambda: array("l"))
+        patients = []
+        watermark = None
+        result = await db_session.stream(select(*COHORT_COLUMNS))
+        async for row in result:
+            registration_id, profile_id, day, institution_id = self._intern(row)
+            for column, value in zip(BITMAP_COLUMNS, self._profiles[profile_id]):
+                if value is not None:
+                    ids[column.key, value].append(registration_id)
+            born_in[date.fromordinal(day).year].append(registration_id)
+            birth_ids[day].append(registration_id)
+            if institution_id != -1:
+                institutions[institution_id].append(registration_id)
+            patients.append((registration_id, profile_id, day, institution_id))
+            updated_on = row[1]
+            if watermark is None or updated_on > watermark:
+                watermark = updated_on
+
+        size = max((patient[0] for patient in patients), default=-1) + 1
+        self._profile_of = array("l", [-1]) * size
+        self._birth_of = array("l", [-1]) * size
+        self._institution_of = array("l", [-1]) * size
+        for registration_id, profile_id, day, institution_id in patients:
+            self._profile_of[registration_id] = profile_id
+            self._birth_of[registration_id] = day
+            self._institution_of[registration_id] = institution_id
+        self._bitmaps = {key: bitmap_of(values) for key, values in ids.items()}
+        self._born_in = {year: bitmap_of(values) for year, values in born_in.items()}
+        self._birth_ids = dict(birth_ids)
+        self._institutions = {
+            institution_id: array("l", sorted(values))
+            for institution_id, values in institutions.items()
+        }
+        self._scopes.clear()
+        self._patients = bitmap_of(patient[0] for patient in patients)
+        self.watermark = watermark
+
+    async def refresh(
+        self, db_session: AsyncSession, overlap: timedelta = timedelta()
+    ) -> None:
+        """
+        Index the patients updated since the last load or refresh, looking
+        `overlap` further back for the writes committed out of order.
+        """
+        query = select(*COHORT_COLUMNS)
+        if self.watermark is not None:
+            query = query.where(models.Patient.updated_on >= self.watermark - overlap)
+        for row in (await db_session.execute(query)).all():
+            self.add(row)
+
+    async def index(self, db_session: AsyncSession, registration_id: int) -> None:
+        """
+        Index one patient, after it has been written.
+        """
+        row = (
+            await db_session.execute(
+                select(*COHORT_COLUMNS).where(
+                    models.Patient.registration_id == registration_id
+                )
+            )
+        ).first()
+        if row is not None:
+            self.add(row)
+
+    def add(self, row: Any) -> None:
+        registration_id, profile_id, day, institution_id = self._intern(row)
+        updated_on = row[1]
+        if self.watermark is None or updated_on > self.watermark:
+            self.watermark = updated_on
+
+        missing = registration_id + 1 - len(self._profile_of)
+        if missing > 0:
+            for values in (self._profile_of, self._birth_of, self._institution_of):
+                values.extend(array("l", [-1]) * missing)
+        elif self._profile_of[registration_id] != -1:
+            if (
+                self._profile_of[registration_id],
+                self._birth_of[registration_id],
+                self._institution_of[registration_id],
+            ) == (profile_id, day, institution_id):
+                return
+            self._remove(registration_id)
+
+        bit = 1 << registration_id
+        self._patients |= bit
+        for column, value in zip(BITMAP_COLUMNS, self._profiles[profile_id]):
+            if value is not None:
+                key = (column.key, value)
+                self._bitmaps[key] = self._bitmaps.get(key, 0) | bit
+        year = date.fromordinal(day).year
+        self._born_in[year] = self._born_in.get(year, 0) | bit
+        self._birth_ids.setdefault(day, array("l")).append(registration_id)
+        if institution_id != -1:
+            ids = self._institutions.setdefault(institution_id, array("l"))
+            ids.insert(bisect_left(ids, registration_id), registration_id)
+            for scope, bitmap in self._scopes.items():
+                if institution_id in scope:
+                    self._scopes[scope] = bitmap | bit
+        self._profile_of[registration_id] = profile_id
+        self._birth_of[registration_id] = day
+        self._institution_of[registration_id] = institution_id
+
+    def _remove(self, registration_id: int) -> None:
+        mask = ~(1 << registration_id)
+        self._patients &= mask
+        profile = self._profiles[self._profile_of[registration_id]]
+        for column, value in zip(BITMAP_COLUMNS, profile):
+            if value is not None:
+                self._bitmaps[column.key, value] &= mask
+        day = self._birth_of[registration_id]
+        self._born_in[date.fromordinal(day).year] &= mask
+        self._birth_ids[day].remove(registration_id)
+        institution_id = self._institution_of[registration_id]
+        if institution_id != -1:
+            ids = self._institutions[institution_id]
+            del ids[bisect_left(ids, registration_id)]
+            for scope, bitmap in self._scopes.items():
+                if institution_id in scope:
+                    self._scopes[scope] = bitmap & mask
+        self._profile_of[registration_id] = -1
+        self._birth_of[registration_id] = -1
+        self._institution_of[registration_id] = -1
+
+    def born_between(self, first: date, last: date) -> int:
+        """
+        The bitmap of the patients born between `first` and `last` included.
+        """
+        if first > last:
+            return 0
+        if first.year == last.year:
+            return self._born_on(first, last)
+        bitmap = self._born_on(first, date(first.year, 12, 31))
+        bitmap |= self._born_on(date(last.year, 1, 1), last)
+        for year, born_in in self._born_in.items():
+            if first.year < year < last.year:
+                bitmap |= born_in
+        return bitmap
+
+    def _born_on(self, first: date, last: date) -> int:
+        if (first.month, first.day, last.month, last.day) == (1, 1, 12, 31):
+            return self._born_in.get(first.year, 0)
+        return bitmap_of(
+            id_
+            for day in range(first.toordinal(), last.toordinal() + 1)
+            for id_ in self._birth_ids.get(day, ())
+        )
+
+    def of_institutions(self, institution_ids: Iterable[int]) -> int:
+        scope = frozenset(institution_ids)
+        bitmap = self._scopes.get(scope)
+        if bitmap is not None:
+            self._scopes.move_to_end(scope)
+            return bitmap
+
+        bitmap = bitmap_of(
+            id_
+            for institution_id in scope
+            for id_ in self._institutions.get(institution_id, ())
+        )
+        if len(self._scopes) >= SCOPE_CACHE_SIZE:
+            self._scopes.popitem(last=False)
+        self._scopes[scope] = bitmap
+        return bitmap
+
+    def match(self, criteria: CohortCriteria, today: date | None = None) -> int:
+        """
+        The bitmap of the patients matching `criteria`.
+        """
+        today = today or date.today()
+        bitmap = self._patients
+        for column in BITMAP_COLUMNS:
+            value = getattr(criteria, column.key)
+            if value is None:
+                continue
+            if isinstance(value, list):
+                bitmap &= self._any_of(column.key, value)
+            else:
+                bitmap &= self._bitmaps.get((column.key, _key(value)), 0)
+
+        if criteria.institution_id is not None:
+            bitmap &= self.of_institutions(criteria.institution_id)
+        if criteria.min_age is not None or criteria.max_age is not None:
+            # Patients aged n were born in the year up to today, n years ago
+            first = (
+                years_before(today, criteria.max_age + 1) + timedelta(days=1)
+                if criteria.max_age is not None
+                else date.min
+            )
+            last = (
+                years_before(today, criteria.min_age)
+                if criteria.min_age is not None
+                else today
+            )
+            bitmap &= self.born_between(first, last)
+
+        for nested in criteria.all_of:
+            bitmap &= self.match(nested, today)
+        if criteria.any_of:
+            any_of = 0
+            for nested in criteria.any_of:
+                any_of |= self.match(nested, today)
+            bitmap &= any_of
+        for nested in criteria.none_of:
+            bitmap &= ~self.match(nested, today)
+        return bitmap
+
+    def _any_of(self, attribute: str, values: list[Any]) -> int:
+        bitmap = 0
+        for value in values:
+            bitmap |= self._bitmaps.get((attribute, _key(value)), 0)
+        return bitmap
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "patients": len(self),
+            "bitmaps": len(self._bitmaps) + len(self._born_in),
+            "institutions": len(self._institutions),
+            "scopes": len(self._scopes),
+            "watermark": self.watermark,
+        }
+
+
+patient_cohorts = PatientCohorts()
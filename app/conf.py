@@ -1,5 +1,4 @@
 import os
-import secrets
 
 from dotenv import load_dotenv
 
@@ -11,7 +10,20 @@ class Config:
     POSTGRES_DB = os.getenv("POSTGRES_DB")
     POSTGRES_HOST = os.getenv("POSTGRES_HOST")
     POSTGRES_PORT = os.getenv("POSTGRES_PORT")
-    SECRET_KEY: str = secrets.token_urlsafe(32)
+    # Tokens are signed with a key ring shared by every worker and node, read
+    # from the JSON file SIGNING_KEYS_FILE or the JSON string SIGNING_KEYS:
+    #   {"active": "<kid>", "keys": {"<kid>": "<secret>", ...}}
+    # The active key signs new tokens, the others only verify existing ones.
+    # Without a key ring, SECRET_KEY is used as the only key. If that is unset
+    # too, startup fails, unless DEV_RANDOM_SIGNING_KEY=true asks for a random
+    # key, which only suits a single dev worker: no other worker can verify
+    # its tokens.
+    SECRET_KEY: str | None = os.getenv("SECRET_KEY")
+    DEV_RANDOM_SIGNING_KEY: bool = (
+        os.getenv("DEV_RANDOM_SIGNING_KEY", "false").lower() == "true"
+    )
+    SIGNING_KEYS_FILE = os.getenv("SIGNING_KEYS_FILE")
+    SIGNING_KEYS = os.getenv("SIGNING_KEYS")
     POSTGRES_TEST_USER = os.getenv("POSTGRES_TEST_USER")
     POSTGRES_TEST_PASSWORD = os.getenv("POSTGRES_TEST_PASSWORD")
     POSTGRES_TEST_DB = os.getenv("POSTGRES_TEST_DB")
@@ -23,10 +35,100 @@ class Config:
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     REFRESH_TOKEN_EXPIRE_MINUTES: int = 1_440
     HASH_ALGORITHM: str = "HS256"
+    # Maximum number of verified users kept in memory per worker, keyed by the
+    # "jti" of their access token.
+    PRINCIPAL_CACHE_SIZE: int = int(os.getenv("PRINCIPAL_CACHE_SIZE", 10_000))
+    # Changes to a user are broadcast to every worker; cached users are also
+    # reloaded after PRINCIPAL_CACHE_TTL seconds in case a broadcast is lost.
+    PRINCIPAL_CACHE_TTL: int = int(os.getenv("PRINCIPAL_CACHE_TTL", 60))
+    # Ids of the organizations below each organization, used to scope
+    # queries. Changes to the hierarchy are broadcast to every worker, and
+    # cached subtrees also expire after ORGANIZATION_SUBTREE_CACHE_TTL seconds
+    # in case a broadcast is lost.
+    ORGANIZATION_SUBTREE_CACHE_SIZE: int = int(
+        os.getenv("ORGANIZATION_SUBTREE_CACHE_SIZE", 1_000)
+    )
+    ORGANIZATION_SUBTREE_CACHE_TTL: int = int(
+        os.getenv("ORGANIZATION_SUBTREE_CACHE_TTL", 60)
+    )
+    # Medication facet counts are cached per filter until the local catalog
+    # snapshot changes, and for at most MEDICATION_FACET_CACHE_TTL seconds to
+    # pick up medications created by other workers.
+    MEDICATION_FACET_CACHE_SIZE: int = int(
+        os.getenv("MEDICATION_FACET_CACHE_SIZE", 1_000)
+    )
+    MEDICATION_FACET_CACHE_TTL: int = int(os.getenv("MEDICATION_FACET_CACHE_TTL", 60))
+    # Medications created by other workers are announced to every worker,
+    # which adds them to its suggest index every
+    # MEDICATION_CATALOG_REFRESH_INTERVAL seconds.
+    MEDICATION_CATALOG_REFRESH_INTERVAL: int = int(
+        os.getenv("MEDICATION_CATALOG_REFRESH_INTERVAL", 5)
+    )
+    # Every worker keeps bitmap indexes of the patients for trial cohorts,
+    # and picks up the patients written by other workers every
+    # PATIENT_COHORT_REFRESH_INTERVAL seconds.
+    PATIENT_COHORT_REFRESH_INTERVAL: int = int(
+        os.getenv("PATIENT_COHORT_REFRESH_INTERVAL", 30)
+    )
+    # Every worker listens for the invalidations of the other workers on a
+    # dedicated connection, checked every NOTIFICATION_HEALTH_CHECK_INTERVAL
+    # seconds and re-established after a loss, backing off from
+    # NOTIFICATION_RECONNECT_DELAY up to NOTIFICATION_RECONNECT_MAX_DELAY seconds.
+    NOTIFICATION_HEALTH_CHECK_INTERVAL: float = float(
+        os.getenv("NOTIFICATION_HEALTH_CHECK_INTERVAL", 30)
+    )
+    NOTIFICATION_HEALTH_CHECK_TIMEOUT: float = float(
+        os.getenv("NOTIFICATION_HEALTH_CHECK_TIMEOUT", 5)
+    )
+    NOTIFICATION_RECONNECT_DELAY: float = float(
+        os.getenv("NOTIFICATION_RECONNECT_DELAY", 1)
+    )
+    NOTIFICATION_RECONNECT_MAX_DELAY: float = float(
+        os.getenv("NOTIFICATION_RECONNECT_MAX_DELAY", 30)
+    )
+    # bcrypt runs on a dedicated pool ("thread" or "process") so that it does
+    # not block the event loop. Requests beyond PASSWORD_HASH_MAX_PENDING
+    # in-flight operations are rejected with a 503.
+    PASSWORD_HASH_EXECUTOR: str = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", 4))
+    PASSWORD_HASH_MAX_PENDING: int = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 64))
+    # Revoked refresh tokens are stored in Postgres and mirrored in a per-worker
+    # Bloom filter sized for REVOKED_TOKEN_FILTER_CAPACITY live tokens. Expired
+    # tokens are pruned every REVOKED_TOKEN_PRUNE_INTERVAL seconds.
+    REVOKED_TOKEN_FILTER_CAPACITY: int = int(
+        os.getenv("REVOKED_TOKEN_FILTER_CAPACITY", 100_000)
+    )
+    REVOKED_TOKEN_FILTER_ERROR_RATE: float = float(
+        os.getenv("REVOKED_TOKEN_FILTER_ERROR_RATE", 0.01)
+    )
+    REVOKED_TOKEN_PRUNE_INTERVAL: int = int(
+        os.getenv("REVOKED_TOKEN_PRUNE_INTERVAL", 3_600)
+    )
+    # Connection pool of each worker. Size it so that
+    # workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) stays below max_connections.
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", 5))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", 10))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", 30))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", 1_800))
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+    DB_STATEMENT_CACHE_SIZE: int = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
     DB_CONFIG = os.getenv(
         "DATABASE_URL",
         f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
     )
+    # Optional read replicas, as a comma separated list of URLs. Read-only
+    # routes are spread over them ("round_robin" or "least_busy"), except for
+    # clients that committed a write in the last READ_YOUR_WRITES_SECONDS, which
+    # keep reading from the primary until the replicas have caught up.
+    DB_REPLICA_URLS: list[str] = [
+        url for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url
+    ]
+    DB_REPLICA_ROUTING: str = os.getenv("DB_REPLICA_ROUTING", "round_robin")
+    READ_YOUR_WRITES_SECONDS: float = float(os.getenv("READ_YOUR_WRITES_SECONDS", 5))
+    # prescription_tab and apointment_tab are partitioned by month, and
+    # `python -m app.partitions` creates the partitions of the current month
+    # and of the PARTITION_MONTHS_AHEAD following ones.
+    PARTITION_MONTHS_AHEAD: int = int(os.getenv("PARTITION_MONTHS_AHEAD", 3))
     DB_TEST_URL = os.getenv(
         "DATABASE_TEST_URL",
         f"postgresql+asyncpg://{POSTGRES_TEST_USER}:{POSTGRES_TEST_PASSWORD}@{POSTGRES_TEST_HOST}:{POSTGRES_TEST_PORT}/{POSTGRES_TEST_DB}"
@@ -1,31 +1,218 @@
 import contextlib
+import itertools
+import math
+import time
 from typing import Any, AsyncIterator
 from app.conf import config as settings
+from fastapi import Request, Response
+from app.metrics import Histogram
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import (
     AsyncConnection,
+    AsyncEngine,
     AsyncSession,
     async_sessionmaker,
     create_async_engine,
 )
-from sqlalchemy.orm import declarative_base
+from sqlalchemy.orm import Session, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 Base = declarative_base()
 
+# Set on the responses of requests that committed a write to the time of the
+# commit, so that the client's next reads stay on the primary until the
+# replicas have replayed it, whichever worker serves them. Clients that do
+# not keep cookies can send the header back instead.
+LAST_WRITE_COOKIE = "last_write"
+LAST_WRITE_HEADER = "X-Last-Write"
+
 # Heavily inspired by https://praciano.com.br/fastapi-and-async-sqlalchemy-20-with-pytest-done-right.html
 
 
+class PoolTelemetry:
+    """
+    Checkout wait times and connection ages of an engine's connection pool.
+    """
+
+    def __init__(self):
+        self.wait_time = Histogram()
+        self._connected_at: dict[int, float] = {}
+
+    def pool_class(self) -> type[AsyncAdaptedQueuePool]:
+        """
+        Return a queue pool class that records how long each checkout waited
+        for a connection.
+        """
+        telemetry = self
+
+        class InstrumentedPool(AsyncAdaptedQueuePool):
+            def _do_get(self):
+                start = time.perf_counter()
+                try:
+                    return super()._do_get()
+                finally:
+                    telemetry.wait_time.observe(time.perf_counter() - start)
+
+        return InstrumentedPool
+
+    def attach(self, engine: AsyncEngine) -> None:
+        @event.listens_for(engine.sync_engine, "connect")
+        def on_connect(dbapi_connection, connection_record):
+            self._connected_at[id(connection_record)] = time.monotonic()
+
+        @event.listens_for(engine.sync_engine, "close")
+        def on_close(dbapi_connection, connection_record):
+            self._connected_at.pop(id(connection_record), None)
+
+    def stats(self, engine: AsyncEngine) -> dict[str, Any]:
+        pool = engine.sync_engine.pool
+        now = time.monotonic()
+        ages = [now - connected_at for connected_at in self._connected_at.values()]
+        stats: dict[str, Any] = {
+            "connection_age": {
+                "count": len(ages),
+                "min": min(ages, default=0.0),
+                "max": max(ages, default=0.0),
+            },
+            "wait_time": self.wait_time.stats(),
+        }
+        if isinstance(pool, QueuePool):
+            stats.update(
+                size=pool.size(),
+                checked_in=pool.checkedin(),
+                checked_out=pool.checkedout(),
+                overflow=pool.overflow(),
+            )
+        return stats
+
+
 class DatabaseSessionManager:
-    def __init__(self, host: str, engine_kwargs: dict[str, Any] = {}):
-        self._engine = create_async_engine(host, **engine_kwargs)
-        self._sessionmaker = async_sessionmaker(autocommit=False, bind=self._engine)
+    def __init__(
+        self,
+        host: str,
+        engine_kwargs: dict[str, Any] = {},
+        replica_hosts: list[str] = [],
+        replica_routing: str = "round_robin",
+        read_your_writes_seconds: float = 0,
+    ):
+        self._telemetry = PoolTelemetry()
+        self._engine = self._create_engine(host, engine_kwargs, self._telemetry)
+        self._sessionmaker = async_sessionmaker(
+            autocommit=False,
+            bind=self._engine,
+            sync_session_class=self._primary_session_class(),
+        )
+        self._replicas: list[tuple[AsyncEngine, PoolTelemetry, async_sessionmaker]] = []
+        for replica_host in replica_hosts:
+            telemetry = PoolTelemetry()
+            engine = self._create_engine(replica_host, engine_kwargs, telemetry)
+            self._replicas.append(
+                (engine, telemetry, async_sessionmaker(autocommit=False, bind=engine))
+            )
+        self._replica_routing = replica_routing
+        self._replica_counter = itertools.count()
+        self._read_your_writes_seconds = read_your_writes_seconds
+
+    @staticmethod
+    def _create_engine(
+        host: str, engine_kwargs: dict[str, Any], telemetry: PoolTelemetry
+    ) -> AsyncEngine:
+        engine = create_async_engine(
+            host, **{"poolclass": telemetry.pool_class(), **engine_kwargs}
+        )
+        telemetry.attach(engine)
+        return engine
+
+    def _primary_session_class(self) -> type[Session]:
+        """
+        Return a session class that marks the response of a request that
+        committed a write, so that the client's reads stay on the primary for
+        a while.
+
+        The response is read from `session.info["response"]`.
+        """
+
+        class PrimarySession(Session):
+            pass
+
+        @event.listens_for(PrimarySession, "do_orm_execute")
+        def on_execute(orm_execute_state):
+            if not orm_execute_state.is_select:
+                orm_execute_state.session.info["has_writes"] = True
+
+        @event.listens_for(PrimarySession, "after_flush")
+        def on_flush(session, flush_context):
+            session.info["has_writes"] = True
+
+        @event.listens_for(PrimarySession, "after_commit")
+        def on_commit(session):
+            response = session.info.get("response")
+            if session.info.pop("has_writes", False) and response is not None:
+                self.mark_write(response)
+
+        @event.listens_for(PrimarySession, "after_rollback")
+        def on_rollback(session):
+            session.info.pop("has_writes", None)
+
+        return PrimarySession
+
+    @property
+    def engine(self) -> AsyncEngine:
+        if self._engine is None:
+            raise Exception("DatabaseSessionManager is not initialized")
+        return self._engine
+
+    def mark_write(self, response: Response) -> None:
+        """
+        Route the client's reads to the primary until the replicas have had
+        time to replay its latest commit.
+        """
+        if not self._replicas:
+            return
+        committed_at = f"{time.time():.3f}"
+        response.set_cookie(
+            LAST_WRITE_COOKIE,
+            committed_at,
+            max_age=math.ceil(self._read_your_writes_seconds),
+            httponly=True,
+            samesite="lax",
+        )
+        response.headers[LAST_WRITE_HEADER] = committed_at
+
+    def wrote_recently(self, request: Request) -> bool:
+        """
+        Whether the client committed a write within the read-your-writes
+        window, according to the marker set by `mark_write`. Markers in the
+        future (or not a number) are ignored, so a forged value cannot pin the
+        client to the primary.
+        """
+        committed_at = request.headers.get(
+            LAST_WRITE_HEADER, request.cookies.get(LAST_WRITE_COOKIE)
+        )
+        try:
+            elapsed = time.time() - float(committed_at)
+        except (TypeError, ValueError):
+            return False
+        return 0 <= elapsed < self._read_your_writes_seconds
+
+    def pool_stats(self) -> dict[str, Any]:
+        return {
+            "primary": self._telemetry.stats(self.engine),
+            "replicas": [
+                telemetry.stats(engine) for engine, telemetry, _ in self._replicas
+            ],
+        }
 
     async def close(self):
         if self._engine is None:
             raise Exception("DatabaseSessionManager is not initialized")
         await self._engine.dispose()
+        for engine, _, _ in self._replicas:
+            await engine.dispose()
 
         self._engine = None
         self._sessionmaker = None
+        self._replicas = []
 
     @contextlib.asynccontextmanager
     async def connect(self) -> AsyncIterator[AsyncConnection]:
@@ -39,12 +226,50 @@ class DatabaseSessionManager:
                 await connection.rollback()
                 raise
 
+    def _read_sessionmaker(self, primary: bool) -> async_sessionmaker:
+        if self._sessionmaker is None:
+            raise Exception("DatabaseSessionManager is not initialized")
+        if primary or not self._replicas:
+            return self._sessionmaker
+
+        if self._replica_routing == "least_busy":
+            _, _, sessionmaker = min(
+                self._replicas,
+                key=lambda replica: replica[0].sync_engine.pool.checkedout(),
+            )
+        else:
+            _, _, sessionmaker = self._replicas[
+                next(self._replica_counter) % len(self._replicas)
+            ]
+        return sessionmaker
+
     @contextlib.asynccontextmanager
     async def session(self) -> AsyncIterator[AsyncSession]:
         if self._sessionmaker is None:
             raise Exception("DatabaseSessionManager is not initialized")
 
-        session = self._sessionmaker()
+        async with self._session(self._sessionmaker) as session:
+            yield session
+
+    @contextlib.asynccontextmanager
+    async def read_session(
+        self, primary: bool = False
+    ) -> AsyncIterator[AsyncSession]:
+        """
+        A session for read-only work, bound to one of the read replicas.
+
+        Falls back to the primary when there are no replicas, or when
+        `primary` is set because the client wrote recently.
+        """
+        async with self._session(self._read_sessionmaker(primary)) as session:
+            yield session
+
+    @staticmethod
+    @contextlib.asynccontextmanager
+    async def _session(
+        sessionmaker: async_sessionmaker,
+    ) -> AsyncIterator[AsyncSession]:
+        session = sessionmaker()
         try:
             yield session
         except Exception:
@@ -54,10 +279,24 @@ class DatabaseSessionManager:
             await session.close()
 
 
-sessionmanager = DatabaseSessionManager(settings.DB_CONFIG)
+sessionmanager = DatabaseSessionManager(
+    settings.DB_CONFIG,
+    {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "connect_args": {"statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE},
+    },
+    replica_hosts=settings.DB_REPLICA_URLS,
+    replica_routing=settings.DB_REPLICA_ROUTING,
+    read_your_writes_seconds=settings.READ_YOUR_WRITES_SECONDS,
+)
 
 
-async def get_db_session():
+async def get_db_session(response: Response):
     async with sessionmanager.session() as session:
+        session.info["response"] = response
         yield session
 
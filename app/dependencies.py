@@ -1,21 +1,48 @@
+import time
 from typing import Annotated, cast
 
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
-from sqlalchemy import and_, select
+from jose import JWTError
+from sqlalchemy import Integer, Row, Select, any_, literal, select
+from sqlalchemy.dialects.postgresql import ARRAY
 
 from sqlalchemy.orm import Session, joinedload
 from app import models
+from app.cache import PrincipalCache, SubtreeCache
 from app.conf import config
-from app.security import verify_password
-from app.database import get_db_session
+from app.security import decode_token, verify_password
+from app.database import get_db_session, sessionmanager
+from app.notifications import notification_listener
 from sqlalchemy.ext.asyncio import AsyncSession
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
+# Postgres channel used to tell every worker to drop the cached principals of
+# a user, with the username as payload.
+PRINCIPAL_CHANNEL = "principal_changed"
+
+# Postgres channel used to tell every worker that the organization hierarchy
+# changed, with the path of a new organization as payload, or an empty
+# payload when subtrees were moved.
+SUBTREE_CHANNEL = "organization_subtree_changed"
+
+principal_cache = PrincipalCache(config.PRINCIPAL_CACHE_SIZE)
+subtree_cache = SubtreeCache(config.ORGANIZATION_SUBTREE_CACHE_SIZE)
+
+
+def on_subtree_changed(path: str) -> None:
+    if path:
+        subtree_cache.invalidate_ancestors(path)
+    else:
+        subtree_cache.clear()
+
+
+notification_listener.subscribe(PRINCIPAL_CHANNEL, principal_cache.invalidate)
+notification_listener.subscribe(SUBTREE_CHANNEL, on_subtree_changed)
+
 
 
 
@@ -25,6 +52,23 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 Database = Annotated[AsyncSession, Depends(get_db_session)]
 
 
+async def get_read_db_session(request: Request):
+    """
+    Yield a session for read-only routes, bound to a read replica when
+    replicas are configured.
+
+    Clients that committed a write in the last READ_YOUR_WRITES_SECONDS keep
+    reading from the primary, see `DatabaseSessionManager.mark_write`.
+    """
+    async with sessionmanager.read_session(
+        primary=sessionmanager.wrote_recently(request)
+    ) as session:
+        yield session
+
+
+ReadDatabase = Annotated[AsyncSession, Depends(get_read_db_session)]
+
+
 
 
 
@@ -42,7 +86,7 @@ async def authenticate_user(db_session: Database, username: str, password: str):
 
     if user is None:
         return None
-    if not verify_password(password, cast(str, user.pword_hash)):
+    if not await verify_password(password, cast(str, user.pword_hash)):
         return None
     return user
 
@@ -72,11 +116,7 @@ async def user_from_token(
         )
 
     try:
-        payload = jwt.decode(
-            token,
-            config.SECRET_KEY,
-            algorithms=[config.HASH_ALGORITHM],
-        )
+        payload = decode_token(token)
     except JWTError as error:
         raise credentials_exception from error
 
@@ -86,12 +126,36 @@ async def user_from_token(
     username = cast(str | None, payload.get("sub"))
     if username is None:
         raise credentials_exception
+
+    # Users are cached per access token, so repeated requests with the same
+    # token do not query the database. Changes to a user are broadcast on
+    # PRINCIPAL_CHANNEL, and entries are kept at most PRINCIPAL_CACHE_TTL
+    # seconds in case a notification is missed. The cached instance is
+    # detached and merged into the request's session without loading it
+    # again.
+    jti = cast(str | None, payload.get("jti"))
+    cached_user = principal_cache.get(jti) if jti is not None else None
+    if cached_user is not None:
+        return await db_session.merge(cached_user, load=False)
+
     user = (await db_session.scalars(select(models.User)
         .filter(models.User.username == username)
         .join(models.User.organization)
         .options(joinedload(models.User.organization)))).first()
 
-    return user
+    if user is None or jti is None:
+        return user
+
+    db_session.expunge(user.organization)
+    db_session.expunge(user)
+    principal_cache.set(
+        jti,
+        user,
+        expires_at=min(
+            float(payload["exp"]), time.time() + config.PRINCIPAL_CACHE_TTL
+        ),
+    )
+    return await db_session.merge(user, load=False)
 
 
 async def get_current_user(
@@ -104,27 +168,31 @@ async def get_current_user(
     If the token is valid, return the currently logged in user.
     If the token is invalid, raise a 401 (Unauthorized) exception.
     """
-    user = await user_from_token(token, database)
-    return user
+    return await user_from_token(token, database)
 
 
 CurrentUser = Annotated[models.User, Depends(get_current_user)]
 
 
-def get_current_super_user(user: CurrentUser):
+async def get_current_read_user(
+    database: ReadDatabase,
+    token: str = Depends(oauth2_scheme),
+):
     """
-    Returns the current user if they're in the RL Automotive
+    Validate the user's JWT token, loading the user from a read replica.
+
+    Only for read-only routes, see `get_current_user`.
     """
-    if user.organization_id != 1:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You have insufficient rights to access this resource",
-        )
-    return user
+    return await user_from_token(token, database)
 
 
-def get_current_admin_user(user: CurrentUser):
+CurrentReadUser = Annotated[models.User, Depends(get_current_read_user)]
+
 
+def require_admin(user: models.User) -> models.User:
+    """
+    Returns the user if they're in the RL Automotive
+    """
     if user.organization_id != 1:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -133,171 +201,190 @@ def get_current_admin_user(user: CurrentUser):
     return user
 
 
-async def get_institution(
-    database: Database, institution_name: str, user: CurrentUser
-) -> models.Institution | None:
+def get_current_super_user(user: CurrentUser):
     """
-    Get a  institution from database
+    Returns the current user if they're in the RL Automotive
     """
+    return require_admin(user)
 
-    institution =  (
-        await database.scalars(
-            select(models.Institution)
-            .where(models.Institution.name == institution_name)
-            )
-        ).first()
-    return  institution
 
-async def get_clinician(
-    database: Database,
-    clinician_code: str,
-) -> models.Clinician | None:
+def get_current_read_super_user(user: CurrentReadUser):
     """
-    Get a  clinician from database
+    `get_current_super_user` for read-only routes, see `get_current_read_user`.
     """
+    return require_admin(user)
 
-    clinician = (
-        await database.scalars(
-            select(models.Clinician).where(
-                and_(
-                    models.Clinician.clinician_code == clinician_code,
-                )
-            )
-        )
-    ).first()
 
-    return clinician
+def get_current_admin_user(user: CurrentUser):
+    return require_admin(user)
 
 
-async def get_patient_by_code(
-    database: Database,
-    patient_code: str,
-) -> models.Patient | None:
+def get_current_read_admin_user(user: CurrentReadUser):
     """
-    Get a  patient from database
+    `get_current_admin_user` for read-only routes, see `get_current_read_user`.
     """
+    return require_admin(user)
+
 
-    patient = (
-        await database.scalars(
-            select(models.Patient).where(
-                and_(
-                    models.Patient.patient_code == patient_code,
+async def organization_subtree(database: AsyncSession, user: models.User) -> list[int]:
+    """
+    Get the ids of the user's organization and of every organization below it
+    """
+    entry = subtree_cache.get(user.organization_id)
+    if entry is not None:
+        return entry[1]
+
+    # The path is read from the table rather than from the (possibly cached)
+    # user, since organizations can be moved.
+    rows = (
+        await database.execute(
+            select(models.Organization.id, models.Organization.path).where(
+                models.Organization.path.descendant_of(
+                    select(models.Organization.path)
+                    .where(models.Organization.id == user.organization_id)
+                    .scalar_subquery()
                 )
             )
         )
-    ).first()
-    return patient
+    ).all()
+    ids = [row.id for row in rows]
+    path = next(
+        (str(row.path) for row in rows if row.id == user.organization_id), None
+    )
+    if path is not None:
+        subtree_cache.set(
+            user.organization_id,
+            (path, ids),
+            time.time() + config.ORGANIZATION_SUBTREE_CACHE_TTL,
+        )
+    return ids
 
-async def get_medication(
-    database: Database,
-    medication_code: str,
-) -> models.Medication | None:
+
+async def get_organization_subtree(database: Database, user: CurrentUser) -> list[int]:
+    return await organization_subtree(database, user)
+
+
+async def get_read_organization_subtree(
+    database: ReadDatabase, user: CurrentReadUser
+) -> list[int]:
     """
-    Get a  patient from database
+    `get_organization_subtree` for read-only routes, resolved from a read
+    replica along with the user.
     """
+    return await organization_subtree(database, user)
 
-    medication =  (
-    await  database.scalars(
-            select(models.Medication).where(
-                and_(
-                    models.Medication.code_name == medication_code,
-                )
-            )
-        )
-    ).first()
-    return medication
 
-async def get_prescription(
-    database: Database,
-    prescription_code: str,
-    user: CurrentUser,
-) -> models.Prescription | None:
+OrganizationSubtree = Annotated[list[int], Depends(get_organization_subtree)]
+ReadOrganizationSubtree = Annotated[
+    list[int], Depends(get_read_organization_subtree)
+]
+
+
+def in_subtree(column, ids: list[int]):
     """
-    Get a  prescription from database
+    `column = ANY(:ids)`, a single array parameter whatever the number of ids.
     """
-    prescription = (
-        await database.scalars(
-            select(models.Prescription.prescription_code).where(
-                models.Prescription.prescription_code == prescription_code
-            )
-        )
-    ).first()
-    return prescription
+    return column == any_(literal(ids, ARRAY(Integer)))
 
-async def get_apointment(
-    database: Database,
-    apointment_code: str,
-    user: CurrentUser,
-) -> models.Apointments | None:
+
+async def resolve_references(database: AsyncSession, **references: Select) -> Row:
     """
-    Get a  prescription from database
+    Run several single value lookups in one round trip.
+
+    Each keyword is a query selecting one column. The returned row has one
+    attribute per keyword, holding the first value found or None.
     """
-    apointment = (
-        await database.scalars(
-            select(models.Apointments)
-            .join(
-                models.Institution,
-                models.Institution.id == models.Apointments.institution_refrence,
+    return (
+        await database.execute(
+            select(
+                *(
+                    query.limit(1).scalar_subquery().label(name)
+                    for name, query in references.items()
+                )
             )
-            .where(models.Apointments.apointment_code == apointment_code)
         )
-    ).first()
-    return apointment
-
+    ).one()
 
 
-async def get_clinical_trial(
+async def get_apointment_references(
     database: Database,
-    clinical_trial_code: str,
+    patient_code: str,
+    clinician_code: str,
     institution_name: str,
     user: CurrentUser,
-) -> models.ClinicalTrials | None:
-    """
-    Get a  prescription from database
-    """
-    clinical_trial = (
-    await database.scalars(
-            select(models.ClinicalTrials)
-            .join(models.Institution, models.Institution.name == institution_name)
-            .where(models.ClinicalTrials.clinical_trial_code == clinical_trial_code)
-            .where(
-                models.Institution.organization_id.in_(
-                    select(models.Organization.id).where(
-                        models.Organization.path.descendant_of(user.organization.path)
-                    )
-                )
-            )
-        )
-    ).first()
-    return clinical_trial
-
-async def get_image(
+) -> Row:
+    """
+    Get the ids of everything an apointment refers to from database
+    """
+    return await resolve_references(
+        database,
+        patient_id=select(models.Patient.registration_id).where(
+            models.Patient.patient_code == patient_code
+        ),
+        clinician_id=select(models.Clinician.registration_id).where(
+            models.Clinician.clinician_code == clinician_code
+        ),
+        institution_id=select(models.Institution.id).where(
+            models.Institution.name == institution_name
+        ),
+    )
+
+
+async def get_prescription_references(
     database: Database,
-    image_code: str,
+    patient_code: str,
+    clinician_code: str,
     user: CurrentUser,
-) -> models.Image | None:
+) -> Row:
     """
-    Get a  prescription from database
+    Get the ids of the patient and clinician of a prescription from database
     """
-    image = (
-        await database.scalars(
-            select(models.Image)
-            .where(models.Image.image_code == image_code)
+    return await resolve_references(
+        database,
+        patient_id=select(models.Patient.registration_id).where(
+            models.Patient.patient_code == patient_code
+        ),
+        clinician_id=select(models.Clinician.registration_id).where(
+            models.Clinician.clinician_code == clinician_code
+        ),
+    )
+
+
+async def get_clinical_trial_references(
+    database: Database,
+    apointment_code: str,
+    patient_code: str,
+    clinician_code: str,
+    institution_name: str,
+    user: CurrentUser,
+) -> Row:
+    """
+    Get the ids of everything a clinical trial refers to from database
+    """
+    return await resolve_references(
+        database,
+        apointment_id=select(models.Apointments.apointment_id)
+        .join(
+            models.Institution,
+            models.Institution.id == models.Apointments.institution_refrence,
         )
-    ).first()
-    return image
-
-
-Clinical_Trials = Annotated[models.ClinicalTrials, Depends(get_clinical_trial)]
-Apointment = Annotated[models.Apointments, Depends(get_apointment)]
-Prescription = Annotated[models.Prescription, Depends(get_prescription)]
-Clinician = Annotated[models.Clinician, Depends(get_clinician)]
-Patient = Annotated[models.Patient, Depends(get_patient_by_code)]
-Medication = Annotated[models.Medication, Depends(get_medication)]
+        .where(models.Apointments.apointment_code == apointment_code),
+        patient_id=select(models.Patient.registration_id).where(
+            models.Patient.patient_code == patient_code
+        ),
+        clinician_id=select(models.Clinician.registration_id).where(
+            models.Clinician.clinician_code == clinician_code
+        ),
+        institution_id=select(models.Institution.id).where(
+            models.Institution.name == institution_name
+        ),
+    )
+
+
+ApointmentReferences = Annotated[Row, Depends(get_apointment_references)]
+PrescriptionReferences = Annotated[Row, Depends(get_prescription_references)]
+ClinicalTrialReferences = Annotated[Row, Depends(get_clinical_trial_references)]
 CurrentSuperUser = Annotated[models.User, Depends(get_current_super_user)]
-Institution = Annotated[models.Institution, Depends(get_institution)]
+CurrentReadSuperUser = Annotated[models.User, Depends(get_current_read_super_user)]
 CurrentAdminUser = Annotated[models.User, Depends(get_current_admin_user)]
-Image = Annotated[models.Image, Depends(get_image)]
-
-
-
+CurrentReadAdminUser = Annotated[models.User, Depends(get_current_read_admin_user)]
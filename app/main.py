@@ -1,10 +1,20 @@
+import asyncio
 import logging
 import sys
 from contextlib import asynccontextmanager
+from datetime import timedelta
 
 from app.app_endpoints import (user_endpoints, auth_endpoints, organisation_endpoints, institution_endpoints, patient_endpoints,
-clinician_endpoints, image_endpoints, prescription_endpoints, apointments, medication_endpoints, clinical_trials_endpoints)
+clinician_endpoints, image_endpoints, prescription_endpoints, apointments, medication_endpoints, clinical_trials_endpoints,
+admin_endpoints)
+from app.catalog import medication_catalog
+from app.cohort import patient_cohorts
+from app.conf import config
 from app.database import sessionmanager
+from app.notifications import notification_listener
+from app.revocation import revocation_store
+from app.security import password_hasher
+from app.utils import run_periodically
 from fastapi import FastAPI
 
 logging.basicConfig(stream=sys.stdout)
@@ -16,7 +26,49 @@ async def lifespan(app: FastAPI):
     Function that handles startup and shutdown events.
     To understand more, read https://fastapi.tiangolo.com/advanced/events/
     """
+    async with sessionmanager.session() as session:
+        await revocation_store.load(session)
+        await medication_catalog.load(session)
+        await patient_cohorts.load(session)
+    await notification_listener.listen(sessionmanager)
+
+    async def prune_revoked_tokens():
+        async with sessionmanager.session() as session:
+            await revocation_store.prune(session)
+
+    async def refresh_patient_cohorts():
+        async with sessionmanager.session() as session:
+            await patient_cohorts.refresh(
+                session,
+                overlap=timedelta(seconds=config.PATIENT_COHORT_REFRESH_INTERVAL),
+            )
+
+    async def refresh_medication_catalog():
+        async with sessionmanager.session() as session:
+            await medication_catalog.refresh(session)
+
+    background_tasks = [
+        asyncio.create_task(
+            run_periodically(config.REVOKED_TOKEN_PRUNE_INTERVAL, prune_revoked_tokens)
+        ),
+        asyncio.create_task(
+            run_periodically(
+                config.PATIENT_COHORT_REFRESH_INTERVAL, refresh_patient_cohorts
+            )
+        ),
+        asyncio.create_task(
+            run_periodically(
+                config.MEDICATION_CATALOG_REFRESH_INTERVAL, refresh_medication_catalog
+            )
+        ),
+    ]
+
     yield
+
+    for task in background_tasks:
+        task.cancel()
+    await notification_listener.close()
+    password_hasher.shutdown()
     if sessionmanager._engine is not None:
         # Close the DB connection
         await sessionmanager.close()
@@ -39,6 +91,7 @@ routers = [
     apointments.router,
     medication_endpoints.router,
     clinical_trials_endpoints.router,
+    admin_endpoints.router,
 
 ]
 for router in routers:
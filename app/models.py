@@ -2,14 +2,16 @@ from datetime import date, datetime
 from typing import Never
 from uuid import uuid4
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION, JSONB
+from sqlalchemy import select, text
+from sqlalchemy.dialects.postgresql import (DOUBLE_PRECISION, JSONB, TSTZRANGE,
+                                            TSVECTOR, ExcludeConstraint)
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.ext.mutable import MutableDict
-from sqlalchemy.orm import (Session, mapped_column, object_session,
+from sqlalchemy.orm import (Session, deferred, mapped_column, object_session,
                             relationship)
-from sqlalchemy.sql.schema import Column, ForeignKey, Identity
+from sqlalchemy.sql.schema import (Column, Computed, ForeignKey, Identity, Index,
+                                   Sequence)
 from sqlalchemy.sql.sqltypes import (TEXT, Boolean, Date, DateTime, Enum,
                                      Integer, SmallInteger, String)
 from sqlalchemy_utils import LtreeType
@@ -27,8 +29,13 @@ from fastapi import HTTPException, status
 
 class Organization(Base):
     __tablename__ = "organization_tab"
+    __table_args__ = (
+        # Subtree lookups (path <@ ...) on the organization hierarchy
+        Index("ix_organization_tab_path", "path", postgresql_using="gist"),
+    )
 
-    id = Column(Integer, Identity(always=True), primary_key=True)
+    # Not "always", the id is drawn beforehand to compute the path
+    id = Column(Integer, Identity(always=False), primary_key=True)
     name = Column(String, nullable=False, unique=True)
     created_on = Column(DateTime(timezone=False), nullable=False, unique=False)
     address = Column(String, nullable=True)
@@ -72,7 +79,9 @@ class User(Base):
     can_edit: bool = Column(
         Boolean, default=False, server_default="false", nullable=False
     )
-    organization_id = Column(Integer, ForeignKey("organization_tab.id"), nullable=True)
+    organization_id = Column(
+        Integer, ForeignKey("organization_tab.id"), nullable=True, index=True
+    )
     organization: "Organization" = relationship(
         "Organization", lazy="joined", uselist=False, back_populates="users"
     )
@@ -200,7 +209,7 @@ class Institution(Base):
     created_on = Column(DateTime, nullable=False)
     contact_number: Column[String] = Column(String(255), nullable=True)
     organization_id: Column[Integer] = Column(
-        Integer, ForeignKey("organization_tab.id"), nullable=True
+        Integer, ForeignKey("organization_tab.id"), nullable=True, index=True
     )
     patient = relationship("Patient", back_populates="institution")
     clinician = relationship("Clinician", back_populates="institution")
@@ -212,9 +221,23 @@ class Institution(Base):
     def __repr__(self) -> str:
         return f"Institution(id={self.id}, name={self.name})"
 
+# Full-text search document of a medication: names rank above indications,
+# which rank above the other clinical text.
+MEDICATION_SEARCH_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(medication_name, '') || ' ' || "
+    "coalesce(brand_name, '') || ' ' || coalesce(active_ingredient_name, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(indications, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(contraindications, '') || ' ' || "
+    "coalesce(side_effects, '') || ' ' || coalesce(dosage, '')), 'C')"
+)
+
+
 class Medication(Base):
     __tablename__ = "medication_tab"
     """"table holding the Medication Columns"""
+    __table_args__ = (
+        Index("ix_medication_tab_search_vector", "search_vector", postgresql_using="gin"),
+    )
     medication_name: Column[str] = Column(String, nullable=False)
     medication_reference: Column[str] = Column(String, primary_key=True)
     code_name: Column[str] = Column(String, nullable=False, unique=True)
@@ -233,16 +256,6 @@ class Medication(Base):
     )  # type: ignore
     brand_name: Column[str] = Column(String, nullable=True)
     active_ingredient_name: Column[str] = Column(String, nullable=True)
-    excipient_name: Column[str] = Column(String, nullable=True)
-    other_name_of_active_ingredient: Column[str] = Column(String, nullable=True)
-    abbreviated_name_of_active_ingredient: Column[str] = Column(String, nullable=True)
-    abbreviated_name_of_active_ingredient: Column[str] = Column(String, nullable=True)
-    chemical_formula: Column[str] = Column(String, nullable=True)
-    peculiar_part_of_drug: Column[str] = Column(String, nullable=True)
-    color: Column[str] = Column(String, nullable=True)
-    smell: Column[str] = Column(String, nullable=True)
-    taste: Column[str] = Column(String, nullable=True)
-    usage_of_excipient: Column[str] = Column(String, nullable=True)
     indications: Column[str] = Column(String, nullable=True)
     contraindications: Column[str] = Column(String, nullable=True)
     is_allowed_for_children: Column[bool] = Column(Boolean, nullable=True)
@@ -252,7 +265,6 @@ class Medication(Base):
     frequency: Column[int] = Column(SmallInteger, nullable=True)
     dosage: Column[str] = Column(String, nullable=True)
     side_effects: Column[str] = Column(String, nullable=True)
-    storage: Column[str] = Column(String, nullable=True)
     medication_image: Column[int] = Column(Integer, ForeignKey("image_tab.image_id"))
     image = relationship("Image", uselist=True, back_populates="medication")
     is_fda_approved: Column[bool] = Column(Boolean, nullable=True)
@@ -272,16 +284,86 @@ class Medication(Base):
     is_medical_gas: Column[bool] = Column(Boolean, nullable=True)
     is_medical_radioisotope: Column[bool] = Column(Boolean, nullable=True)
     is_medical_radioactive: Column[bool] = Column(Boolean, nullable=True)
+    search_vector = deferred(
+        Column(TSVECTOR, Computed(MEDICATION_SEARCH_VECTOR, persisted=True))
+    )
     prescription = relationship("Prescription", back_populates="medication")
+    # Descriptive columns nobody queries on, kept out of this table so that
+    # catalog scans and the buffer cache only hold the clinical ones. Load
+    # them explicitly with selectinload(Medication.detail).
+    detail = relationship(
+        "MedicationDetail",
+        uselist=False,
+        lazy="raise",
+        back_populates="medication",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+
+
+class MedicationDetail(Base):
+    __tablename__ = "medication_detail_tab"
+    """Table holding the rarely read descriptive Medication columns"""
+    medication_reference: Column[str] = Column(
+        String,
+        ForeignKey("medication_tab.medication_reference", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    medication = relationship("Medication", back_populates="detail")
+    excipient_name: Column[str] = Column(String, nullable=True)
+    other_name_of_active_ingredient: Column[str] = Column(String, nullable=True)
+    abbreviated_name_of_active_ingredient: Column[str] = Column(String, nullable=True)
+    chemical_formula: Column[str] = Column(String, nullable=True)
+    peculiar_part_of_drug: Column[str] = Column(String, nullable=True)
+    color: Column[str] = Column(String, nullable=True)
+    smell: Column[str] = Column(String, nullable=True)
+    taste: Column[str] = Column(String, nullable=True)
+    usage_of_excipient: Column[str] = Column(String, nullable=True)
+    storage: Column[str] = Column(String, nullable=True)
 
 
 class Prescription(Base):
     __tablename__ = "prescription_tab"
     """Table holding the Prescription columns"""
+    __table_args__ = (
+        # Keyset pagination of the prescription listing
+        Index("ix_prescription_tab_created_on_prescription_id", "created_on", "prescription_id"),
+        # Per patient / per clinician listings within a date window
+        Index(
+            "ix_prescription_tab_patient_refrence_created_on",
+            "patient_refrence",
+            "created_on",
+            "prescription_id",
+        ),
+        Index(
+            "ix_prescription_tab_clinician_refrence_created_on",
+            "clinician_refrence",
+            "created_on",
+            "prescription_id",
+        ),
+        # Prescriptions including a medication (medication_json ? code).
+        # jsonb_path_ops would be smaller but cannot answer key lookups.
+        Index(
+            "ix_prescription_tab_medication_json",
+            "medication_json",
+            postgresql_using="gin",
+        ),
+        # Monthly partitions, see app/partitions.py
+        {"postgresql_partition_by": "RANGE (created_on)"},
+    )
+    # Partitioned tables cannot have identity columns, and their primary key
+    # must include the partition key. The sequence is owned by the column and
+    # is its server default, so raw SQL inserts get an id too.
     prescription_id: Column[str] = Column(
-        Integer, Identity(always=True), primary_key=True
+        Integer,
+        Sequence("prescription_tab_prescription_id_seq"),
+        server_default=text("nextval('prescription_tab_prescription_id_seq')"),
+        primary_key=True,
+    )
+    # Unique across partitions through prescription_code_tab
+    prescription_code: Column[str] = Column(
+        String, ForeignKey("prescription_code_tab.prescription_code"), nullable=False
     )
-    prescription_code: Column[str] = Column(String, nullable=False, unique=True)
     clinician_refrence: Column[int] = Column(
         Integer, ForeignKey("clinician_tab.registration_id")
     )
@@ -291,7 +373,7 @@ class Prescription(Base):
     clinician = relationship("Clinician", back_populates="prescription")
     patient = relationship("Patient", back_populates="prescription")
     reason: Column[date | None] = Column(TEXT, nullable=True)  # type: ignore
-    created_on: Column[datetime] = Column(DateTime, nullable=False)
+    created_on: Column[datetime] = Column(DateTime, primary_key=True)
     updated_on: Column[datetime] = Column(DateTime, nullable=False)
     start_date: Column[datetime] = Column(DateTime, nullable=False)
     end_date: Column[datetime | None] = Column(DateTime, nullable=True)  # type: ignore
@@ -314,13 +396,29 @@ class Prescription(Base):
     medication_json = Column(MutableDict.as_mutable(JSONB), nullable=True)
 
 
+class PrescriptionCode(Base):
+    __tablename__ = "prescription_code_tab"
+    """Table keeping prescription codes unique across all partitions"""
+    prescription_code: Column[str] = Column(String, primary_key=True)
+
+
 class Apointments(Base):
     __tablename__ = "apointment_tab"
     """Table holding the Apointment columns"""
+    __table_args__ = (
+        # Monthly partitions, see app/partitions.py
+        {"postgresql_partition_by": "RANGE (apointment_date)"},
+    )
     apointment_id: Column[int] = Column(
-        Integer, Identity(always=True), primary_key=True
+        Integer,
+        Sequence("apointment_tab_apointment_id_seq"),
+        server_default=text("nextval('apointment_tab_apointment_id_seq')"),
+        primary_key=True,
+    )
+    # Unique across partitions through apointment_code_tab
+    apointment_code: Column[str] = Column(
+        String, ForeignKey("apointment_code_tab.apointment_code"), nullable=False
     )
-    apointment_code: Column[str] = Column(String, nullable=False, unique=True)
     clinician_refrence: Column[int] = Column(
         Integer, ForeignKey("clinician_tab.registration_id")
     )
@@ -340,7 +438,30 @@ class Apointments(Base):
     reason: Column[date | None] = Column(TEXT, nullable=True)
     creted_on: Column[datetime] = Column(DateTime, nullable=False)
     updated_on: Column[datetime] = Column(DateTime, nullable=False)
-    apointment_date: Column[datetime] = Column(DateTime, nullable=False, unique=True)
+    # Clinicians cannot be double booked, see ApointmentCode
+    apointment_date: Column[datetime] = Column(DateTime, primary_key=True)
+
+
+class ApointmentCode(Base):
+    __tablename__ = "apointment_code_tab"
+    """Table keeping apointment codes unique across all partitions"""
+    __table_args__ = (
+        # A partitioned table can only exclude rows sharing its partition key,
+        # so the slots of each clinician are kept from overlapping here, with
+        # an index probe inside the insert.
+        ExcludeConstraint(
+            ("clinician_refrence", "="),
+            ("slot", "&&"),
+            name="apointment_code_tab_clinician_slot_excl",
+            using="gist",
+        ),
+    )
+    apointment_code: Column[str] = Column(String, primary_key=True)
+    clinician_refrence: Column[int] = Column(
+        Integer, ForeignKey("clinician_tab.registration_id"), nullable=True
+    )
+    # [apointment_date, end of the apointment)
+    slot: Column[TSTZRANGE] = Column(TSTZRANGE, nullable=True)
 
 
 class ClinicalTrials(Base):
@@ -367,3 +488,26 @@ class ClinicalTrials(Base):
     reason: Column[date | None] = Column(TEXT, nullable=True)
     created_on: Column[datetime] = Column(DateTime, nullable=False)
     updated_on: Column[datetime] = Column(DateTime, nullable=False)
+
+
+
+class ClinicalTrialEnrollment(Base):
+    __tablename__ = "clinical_trial_enrollment_tab"
+    """Table holding the patients enrolled in each Clinical Trial"""
+    clinical_trial_refrence: Column[int] = Column(
+        Integer,
+        ForeignKey("clinical_trial_tab.clinical_trial_id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    patient_refrence: Column[int] = Column(
+        Integer, ForeignKey("patient_tab.registration_id"), primary_key=True, index=True
+    )
+    enrolled_on: Column[datetime] = Column(DateTime, nullable=False)
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_token_tab"
+    """Table holding revoked refresh tokens until they expire"""
+    jti: Column[str] = Column(String, primary_key=True)
+    expires_on: Column[datetime] = Column(
+        DateTime(timezone=True), nullable=False, index=True
+    )
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+from typing import Any, Callable
+
+from sqlalchemy import String, func, literal, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from app.conf import config
+from app.database import DatabaseSessionManager
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationListener:
+    """
+    A dedicated connection per worker listening to Postgres channels, through
+    which the workers tell each other about changes to what they keep in
+    memory.
+
+    Handlers are subscribed to a channel before `listen` is called, and are
+    called with the payload of every notification sent on it, including the
+    worker's own. Postgres only delivers a notification once the transaction
+    that sent it commits.
+
+    A watchdog re-listens on a new connection when the current one is
+    terminated or stops answering the periodic health check. Notifications
+    sent while no connection is listening are lost.
+    """
+
+    def __init__(self):
+        self._handlers: dict[str, Callable[[str], None]] = {}
+        self._sessionmanager: DatabaseSessionManager | None = None
+        self._connection: AsyncConnection | None = None
+        self._lost = asyncio.Event()
+        self._watchdog: asyncio.Task | None = None
+        self.received = 0
+        self.reconnects = 0
+
+    def subscribe(self, channel: str, handler: Callable[[str], None]) -> None:
+        self._handlers[channel] = handler
+
+    def _on_notification(self, connection: Any, pid: int, channel: str, payload: str):
+        self.received += 1
+        try:
+            self._handlers[channel](payload)
+        except Exception:
+            logger.exception("Handling a notification on %s failed", channel)
+
+    def _on_termination(self, connection: Any) -> None:
+        logger.warning("The notification connection was terminated")
+        self._lost.set()
+
+    async def listen(self, sessionmanager: DatabaseSessionManager) -> None:
+        self._sessionmanager = sessionmanager
+        await self._connect()
+        self._watchdog = asyncio.create_task(self._watch())
+
+    async def _connect(self) -> None:
+        connection = await self._sessionmanager.engine.connect()
+        try:
+            raw_connection = await connection.get_raw_connection()
+            driver_connection = raw_connection.driver_connection
+            for channel in self._handlers:
+                await driver_connection.add_listener(channel, self._on_notification)
+            driver_connection.add_termination_listener(self._on_termination)
+        except Exception:
+            await self._discard(connection)
+            raise
+        self._connection = connection
+        self._lost.clear()
+
+    @staticmethod
+    async def _discard(connection: AsyncConnection) -> None:
+        # The connection is likely broken, so it is not returned to the pool.
+        try:
+            await connection.invalidate()
+            await connection.close()
+        except Exception:
+            logger.debug("Closing the notification connection failed", exc_info=True)
+
+    async def _healthy(self) -> bool:
+        try:
+            raw_connection = await self._connection.get_raw_connection()
+            await asyncio.wait_for(
+                raw_connection.driver_connection.execute("SELECT 1"),
+                timeout=config.NOTIFICATION_HEALTH_CHECK_TIMEOUT,
+            )
+        except Exception:
+            logger.warning("The notification connection failed its health check")
+            return False
+        return True
+
+    async def _watch(self) -> None:
+        """
+        Wait for the connection to be lost, checking its health every
+        NOTIFICATION_HEALTH_CHECK_INTERVAL seconds, then listen again on a new
+        connection, retrying with an exponential backoff.
+        """
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._lost.wait(),
+                    timeout=config.NOTIFICATION_HEALTH_CHECK_INTERVAL,
+                )
+            except asyncio.TimeoutError:
+                if await self._healthy():
+                    continue
+
+            connection, self._connection = self._connection, None
+            if connection is not None:
+                await self._discard(connection)
+
+            delay = config.NOTIFICATION_RECONNECT_DELAY
+            while True:
+                try:
+                    await self._connect()
+                    break
+                except Exception:
+                    logger.exception(
+                        "Listening for notifications failed, retrying in %ss", delay
+                    )
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, config.NOTIFICATION_RECONNECT_MAX_DELAY)
+            self.reconnects += 1
+            logger.warning(
+                "Listening for notifications again, those sent while "
+                "disconnected were missed"
+            )
+
+    async def close(self) -> None:
+        if self._watchdog is not None:
+            self._watchdog.cancel()
+            try:
+                await self._watchdog
+            except asyncio.CancelledError:
+                pass
+            self._watchdog = None
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "listening": self._connection is not None and not self._lost.is_set(),
+            "channels": sorted(self._handlers),
+            "received": self.received,
+            "reconnects": self.reconnects,
+        }
+
+
+async def notify(db_session: AsyncSession, channel: str, *payloads: str) -> None:
+    """
+    Send each payload on `channel` when the session commits, in one
+    statement whatever their number.
+    """
+    if not payloads:
+        return
+    await db_session.execute(
+        select(
+            func.pg_notify(
+                channel, func.unnest(literal(list(payloads), ARRAY(String)))
+            )
+        )
+    )
+
+
+notification_listener = NotificationListener()
@@ -0,0 +1,137 @@
+"""
+Monthly range partitions of prescription_tab and apointment_tab.
+
+Each table has one partition per calendar month plus a default partition
+catching rows outside of them. Run `python -m app.partitions` regularly
+(e.g. daily from cron) so that the partitions of the coming months exist
+before rows are written to them. Rows already in the default partition for a
+month, such as apointments booked beyond the pre-created months, are moved
+into the month's partition when it is created.
+"""
+import argparse
+import asyncio
+import logging
+import sys
+from datetime import date
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.conf import config
+from app.database import sessionmanager
+
+logger = logging.getLogger(__name__)
+
+# Partitioned tables and their partition key
+PARTITIONED_TABLES = {
+    "prescription_tab": "created_on",
+    "apointment_tab": "apointment_date",
+}
+
+
+def add_months(month: date, months: int) -> date:
+    """
+    Return the first day of the month `months` after the month of `month`.
+    """
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_y{month:%Y}m{month:%m}"
+
+
+async def create_partition(
+    connection: AsyncConnection, table: str, column: str, month: date
+) -> bool:
+    """
+    Create the partition of `table` for `month` unless it exists, moving the
+    rows the default partition holds for that month into it. Returns whether
+    the partition was created.
+    """
+    name = partition_name(table, month)
+    exists = await connection.scalar(
+        text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}
+    )
+    if exists:
+        return False
+
+    # Postgres refuses to create a partition for rows the default partition
+    # already holds, so they are set aside and put back through the parent.
+    bounds = {"start": month, "end": add_months(month, 1)}
+    in_month = f"{column} >= :start AND {column} < :end"
+    await connection.execute(text(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE"))
+    misplaced = await connection.scalar(
+        text(f"SELECT EXISTS (SELECT FROM {table}_default WHERE {in_month})"),
+        bounds,
+    )
+    if misplaced:
+        await connection.execute(
+            text(f"CREATE TEMPORARY TABLE misplaced (LIKE {table}) ON COMMIT DROP")
+        )
+        await connection.execute(
+            text(
+                f"WITH moved AS (DELETE FROM {table}_default WHERE {in_month} "
+                "RETURNING *) INSERT INTO misplaced SELECT * FROM moved"
+            ),
+            bounds,
+        )
+    await connection.execute(
+        text(
+            f"CREATE TABLE {name} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{bounds['start']}') TO ('{bounds['end']}')"
+        )
+    )
+    if misplaced:
+        await connection.execute(text(f"INSERT INTO {table} SELECT * FROM misplaced"))
+        logger.info("Moved rows of %s out of %s_default", name, table)
+    return True
+
+
+async def create_partitions(
+    engine: AsyncEngine, months_ahead: int, today: date | None = None
+) -> tuple[list[str], list[str]]:
+    """
+    Create the partitions of the current month and of the `months_ahead`
+    following ones, each in its own transaction so that one failure does not
+    hold back the others. Returns the names of the partitions created and of
+    those that could not be.
+    """
+    first_month = add_months(today or date.today(), 0)
+    created, failed = [], []
+    for table, column in PARTITIONED_TABLES.items():
+        for offset in range(months_ahead + 1):
+            month = add_months(first_month, offset)
+            try:
+                async with engine.begin() as connection:
+                    if await create_partition(connection, table, column, month):
+                        created.append(partition_name(table, month))
+            except Exception:
+                logger.exception(
+                    "Creating partition %s failed", partition_name(table, month)
+                )
+                failed.append(partition_name(table, month))
+    return created, failed
+
+
+async def main(months_ahead: int) -> bool:
+    try:
+        created, failed = await create_partitions(sessionmanager.engine, months_ahead)
+    finally:
+        await sessionmanager.close()
+    for name in created:
+        logger.info("Created partition %s", name)
+    return not failed
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--months-ahead",
+        type=int,
+        default=config.PARTITION_MONTHS_AHEAD,
+        help="number of months after the current one to create partitions for",
+    )
+    if not asyncio.run(main(parser.parse_args().months_ahead)):
+        sys.exit(1)
@@ -0,0 +1,154 @@
+import hashlib
+import math
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.conf import config
+from app.notifications import notification_listener, notify
+
+# Postgres channel used to tell every worker about newly revoked tokens.
+REVOKED_TOKEN_CHANNEL = "revoked_token"
+
+
+class BloomFilter:
+    """
+    A fixed-size Bloom filter over strings.
+
+    `item in bloom_filter` is False when the item was definitely never added,
+    and True when it probably was.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self._size = max(
+            8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        )
+        self._hashes = max(1, round(self._size / capacity * math.log(2)))
+        self._bits = bytearray(math.ceil(self._size / 8))
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for index in range(self._hashes):
+            yield (first + index * second) % self._size
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+
+class RevocationStore:
+    """
+    Revoked refresh tokens, keyed by their `jti`.
+
+    The `revoked_token_tab` table is the source of truth and is shared by all
+    workers. Each worker keeps a Bloom filter of the revoked ids so that most
+    lookups are answered without a query, and the filters are kept in sync
+    through Postgres LISTEN/NOTIFY. Expired rows are pruned periodically and
+    the filter is rebuilt from the remaining rows, so its memory stays
+    constant however long the worker runs.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self._capacity = capacity
+        self._error_rate = error_rate
+        self._filter = BloomFilter(capacity, error_rate)
+        # Lookups answered by the Bloom filter alone, and those that needed a
+        # query because the filter reported a possible match.
+        self.filter_negatives = 0
+        self.database_lookups = 0
+
+    async def load(self, db_session: AsyncSession) -> None:
+        """
+        Rebuild the Bloom filter from the tokens that have not expired yet.
+        """
+        bloom_filter = BloomFilter(self._capacity, self._error_rate)
+        result = await db_session.stream_scalars(
+            select(models.RevokedToken.jti).where(
+                models.RevokedToken.expires_on > func.now()
+            )
+        )
+        async for jti in result:
+            bloom_filter.add(jti)
+        self._filter = bloom_filter
+
+    async def revoke(
+        self, db_session: AsyncSession, jti: str, expires_on: datetime
+    ) -> bool:
+        """
+        Revoke a token, returning False if it had already been revoked.
+
+        The revocation and the notification to the other workers take effect
+        when the caller commits the session.
+        """
+        revoked = (
+            await db_session.execute(
+                insert(models.RevokedToken)
+                .values(jti=jti, expires_on=expires_on)
+                .on_conflict_do_nothing()
+                .returning(models.RevokedToken.jti)
+            )
+        ).first()
+        if revoked is None:
+            return False
+
+        await notify(db_session, REVOKED_TOKEN_CHANNEL, jti)
+        self._filter.add(jti)
+        return True
+
+    async def is_revoked(self, db_session: AsyncSession, jti: str) -> bool:
+        if jti not in self._filter:
+            self.filter_negatives += 1
+            return False
+
+        self.database_lookups += 1
+        revoked = (
+            await db_session.scalars(
+                select(models.RevokedToken.jti).where(models.RevokedToken.jti == jti)
+            )
+        ).first()
+        return revoked is not None
+
+    async def prune(self, db_session: AsyncSession) -> None:
+        """
+        Delete expired tokens and rebuild the Bloom filter without them.
+        """
+        await db_session.execute(
+            delete(models.RevokedToken).where(
+                models.RevokedToken.expires_on <= func.now()
+            )
+        )
+        await db_session.commit()
+        await self.load(db_session)
+
+    def on_revoked(self, jti: str) -> None:
+        """
+        Add a token revoked by another worker to the Bloom filter.
+        """
+        self._filter.add(jti)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "capacity": self._capacity,
+            "error_rate": self._error_rate,
+            "filter_negatives": self.filter_negatives,
+            "database_lookups": self.database_lookups,
+        }
+
+
+revocation_store = RevocationStore(
+    capacity=config.REVOKED_TOKEN_FILTER_CAPACITY,
+    error_rate=config.REVOKED_TOKEN_FILTER_ERROR_RATE,
+)
+notification_listener.subscribe(REVOKED_TOKEN_CHANNEL, revocation_store.on_revoked)
@@ -2,7 +2,7 @@ from datetime import date, datetime
 from typing import Dict, List, Literal, Optional
 
 from pydantic import (BaseModel, ConfigDict, EmailStr, Field, PositiveInt,
-                      field_validator)
+                      field_validator, model_validator)
 from typing_extensions import Annotated
 
 from app.commons import (BloodGroupType, FormType, GenderType,
@@ -309,6 +309,77 @@ class MedicationCreate(BaseModel):
     ]
 
 
+class MedicationSuggestion(BaseModel):
+    code_name: str
+    name: str
+
+
+class MedicationFlags(BaseModel):
+    """Filters on the medication flags, unset flags are not filtered on"""
+
+    is_allowed_for_children: bool | None = None
+    is_fda_approved: bool | None = None
+    is_nhs_approved: bool | None = None
+    is_emergency_medicine: bool | None = None
+    is_controlled_drug: bool | None = None
+    is_generic: bool | None = None
+    is_over_the_counter: bool | None = None
+    is_herbal: bool | None = None
+    is_homeopathic: bool | None = None
+    is_banned: bool | None = None
+    is_restricted: bool | None = None
+    is_unlicensed: bool | None = None
+    is_orphan_drug: bool | None = None
+    is_biological: bool | None = None
+    is_trial_drug: bool | None = None
+    is_medical_gas: bool | None = None
+    is_medical_radioisotope: bool | None = None
+    is_medical_radioactive: bool | None = None
+
+
+class MedicationFacets(BaseModel):
+    # Number of medications matching the filter, and how many of them have
+    # each flag set
+    total: int
+    facets: Dict[str, int]
+
+
+class MedicationSearchResult(BaseModel):
+    code_name: str
+    medication_name: str
+    brand_name: str | None = None
+    rank: float
+    highlight: str | None = None
+
+
+class CohortCriteria(BaseModel):
+    """
+    Patient attributes a trial cohort is selected on. The set fields must
+    all match, list fields match any of their values; `all_of`, `any_of`
+    and `none_of` combine nested criteria.
+    """
+
+    is_active: bool | None = None
+    is_smoker: bool | None = None
+    is_alcohool_drinker: bool | None = None
+    is_donor: bool | None = None
+    is_armed_forces: bool | None = None
+    blood_type: List[BloodGroupType] | None = None
+    gender: List[GenderType] | None = None
+    institution_id: List[int] | None = None
+    min_age: int | None = Field(default=None, ge=0, le=150)
+    max_age: int | None = Field(default=None, ge=0, le=150)
+    all_of: List["CohortCriteria"] = []
+    any_of: List["CohortCriteria"] = []
+    none_of: List["CohortCriteria"] = []
+
+
+class Cohort(BaseModel):
+    # Number of matching patients, and their ids when they were asked for
+    count: int
+    registration_ids: List[int] | None = None
+
+
 class MedicationRequestBase(BaseModel):
     """class base for medication"""
 
@@ -375,6 +446,24 @@ class OrganizationCreate(BaseModel):
     url: str | None = None
 
 
+class OrganizationBulkCreate(OrganizationCreate):
+    name: str
+
+
+class OrganizationParentUpdate(BaseModel):
+    # Without a parent, the organization is moved to the top level
+    parent: str | None = None
+
+
+class OrganizationTree(BaseModel):
+    id: int
+    name: str
+    path: str
+    institution_count: int = 0
+    user_count: int = 0
+    children: List["OrganizationTree"] = []
+
+
 class UserBase(BaseModel):
     # Shared properties
     email: EmailStr
@@ -463,6 +552,7 @@ class Apointments(BaseModel):
 class ApointmentsCreate(BaseModel):
     reason: str
     apointment_date: datetime
+    duration_minutes: int = Field(default=30, gt=0, le=1_440)
 
 
 class ClinicalTrial(BaseModel):
@@ -473,6 +563,26 @@ class ClinicalTrialCreate(BaseModel):
     reason: str
 
 
+class ClinicalTrialEnrollmentCreate(BaseModel):
+    """Patients to enroll, either by code or as the cohort of the criteria"""
+
+    patient_codes: List[str] | None = Field(default=None, min_length=1)
+    cohort: CohortCriteria | None = None
+
+    @model_validator(mode="after")
+    def has_one_selection(self):
+        if (self.patient_codes is None) == (self.cohort is None):
+            raise ValueError("Give either patient_codes or cohort")
+        return self
+
+
+class ClinicalTrialEnrollment(BaseModel):
+    # Patients newly enrolled, and those skipped because they were already
+    # enrolled, unknown or outside the user's organizations
+    enrolled: int
+    skipped: int
+
+
 class GetClinician(BaseModel):
 
     first_name: str | None = None
@@ -1,29 +1,200 @@
+import asyncio
+import json
+import logging
+import secrets
+import time
 import uuid
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Literal
+from typing import Any, Callable, Literal, TypeVar
 
-from jose import jwt
+from fastapi import HTTPException, status
+from jose import JWTError, jwk, jwt
+from jose.backends.base import Key
 from passlib.context import CryptContext
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.conf import config
+from app.metrics import Histogram
+from app.revocation import revocation_store
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
 
 context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-denylist = set()
+
+def _verify_password(plain_password: str, hashed_password: str) -> bool:
+    return context.verify(plain_password, hashed_password)
+
+
+def _hash_password(password: str) -> str:
+    return context.hash(password)
+
+
+class PasswordHasher:
+    """
+    Run bcrypt hashing and verification on a dedicated worker pool.
+
+    bcrypt takes hundreds of milliseconds per call, so running it on the event
+    loop stalls every other request on the worker. At most `max_pending`
+    operations may be queued or running at once, further calls are rejected
+    with an `HTTP 503 (Service Unavailable)`.
+    """
+
+    def __init__(self, workers: int, max_pending: int, executor: str = "thread"):
+        self._workers = workers
+        self._max_pending = max_pending
+        self._executor_type = executor
+        self._executor: Executor | None = None
+        self.pending = 0
+        self.rejected = 0
+        self.latency = Histogram()
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self._executor_type == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self._workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._workers, thread_name_prefix="password-hasher"
+                )
+        return self._executor
+
+    async def _run(self, function: Callable[..., T], *args: Any) -> T:
+        if self.pending >= self._max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many concurrent password operations, try again later",
+                headers={"Retry-After": "1"},
+            )
+
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), function, *args)
+        finally:
+            self.pending -= 1
+            self.latency.observe(time.perf_counter() - start)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(_verify_password, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash_password, password)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "executor": self._executor_type,
+            "workers": self._workers,
+            "max_pending": self._max_pending,
+            "pending": self.pending,
+            "rejected": self.rejected,
+            "latency": self.latency.stats(),
+        }
+
+
+password_hasher = PasswordHasher(
+    workers=config.PASSWORD_HASH_WORKERS,
+    max_pending=config.PASSWORD_HASH_MAX_PENDING,
+    executor=config.PASSWORD_HASH_EXECUTOR,
+)
 
 
-def verify_password(
+async def verify_password(
     plain_password: str,
     hashed_password: str,
 ) -> bool:
     """
     Verify a plaintext password against a hashed password.
     """
-    return context.verify(plain_password, hashed_password)
+    return await password_hasher.verify(plain_password, hashed_password)
 
 
-def get_password_hash(password: str) -> str:
-    return context.hash(password)
+async def get_password_hash(password: str) -> str:
+    return await password_hasher.hash(password)
+
+
+class KeyRing:
+    """
+    The keys used to sign and verify tokens, identified by their `kid`.
+
+    Tokens are signed with the active key and carry its `kid` in their
+    header, so that retired keys can still verify tokens issued before a
+    rotation. Key objects are constructed once rather than on every call.
+    """
+
+    def __init__(self, active_kid: str, secrets_by_kid: dict[str, str], algorithm: str):
+        if active_kid not in secrets_by_kid:
+            raise ValueError(f"The active signing key {active_kid!r} is not in the key ring")
+        self.active_kid = active_kid
+        self.algorithm = algorithm
+        self._keys: dict[str, Key] = {
+            kid: jwk.construct(secret, algorithm)
+            for kid, secret in secrets_by_kid.items()
+        }
+
+    @classmethod
+    def from_config(cls) -> "KeyRing":
+        if config.SIGNING_KEYS_FILE:
+            with open(config.SIGNING_KEYS_FILE) as keys_file:
+                key_ring = json.load(keys_file)
+        elif config.SIGNING_KEYS:
+            key_ring = json.loads(config.SIGNING_KEYS)
+        elif config.SECRET_KEY:
+            key_ring = {"active": "default", "keys": {"default": config.SECRET_KEY}}
+        elif not config.DEV_RANDOM_SIGNING_KEY:
+            raise RuntimeError(
+                "No signing key is configured: set SIGNING_KEYS_FILE, SIGNING_KEYS "
+                "or SECRET_KEY so that every worker verifies the same tokens "
+                "(or DEV_RANDOM_SIGNING_KEY=true for a single dev worker)"
+            )
+        else:
+            logger.warning(
+                "No signing key is configured, tokens are signed with a random "
+                "key that no other process can verify and that changes on restart"
+            )
+            key_ring = {
+                "active": "default",
+                "keys": {"default": secrets.token_urlsafe(32)},
+            }
+        return cls(key_ring["active"], key_ring["keys"], config.HASH_ALGORITHM)
+
+    def signing_key(self) -> tuple[str, Key]:
+        return self.active_kid, self._keys[self.active_kid]
+
+    def verification_key(self, kid: str | None) -> Key:
+        # Tokens issued before key ids were introduced have no "kid" header.
+        key = self._keys.get(kid or self.active_kid)
+        if key is None:
+            raise JWTError(f"Unknown signing key {kid!r}")
+        return key
+
+
+key_ring = KeyRing.from_config()
+
+
+def decode_token(token: str) -> dict[str, Any]:
+    """
+    Verify a token against the key named in its header and return its claims.
+
+    Raises a `JWTError` if the token is malformed, expired, or signed with an
+    unknown key.
+    """
+    kid = jwt.get_unverified_header(token).get("kid")
+    return jwt.decode(
+        token,
+        key_ring.verification_key(kid),
+        algorithms=[key_ring.algorithm],
+    )
 
 
 def allowed_password(password: str) -> bool:
@@ -97,22 +268,31 @@ def _create_token(
         "fresh": fresh,
     }
 
+    kid, key = key_ring.signing_key()
     return jwt.encode(
         claims=token_data,
-        key=config.SECRET_KEY,
-        algorithm=config.HASH_ALGORITHM,
+        key=key,
+        algorithm=key_ring.algorithm,
+        headers={"kid": kid},
     )
 
 
-def revoke_refresh_token(token: str):
+async def revoke_refresh_token(db_session: AsyncSession, payload: dict[str, Any]) -> bool:
     """
-    Revoke a refresh token from a given user.
+    Revoke a decoded refresh token, returning False if it was already revoked.
+
+    The revocation is persisted when the session is committed.
     """
-    denylist.add(token)
+    return await revocation_store.revoke(
+        db_session,
+        jti=payload["jti"],
+        expires_on=datetime.fromtimestamp(payload["exp"], tz=timezone.utc),
+    )
 
 
-def refresh_token_valid(token: str):
+async def refresh_token_valid(db_session: AsyncSession, payload: dict[str, Any]) -> bool:
     """
-    Check if a given token is valid.
+    Check if a decoded refresh token has not been revoked.
     """
-    return token not in denylist
+    return not await revocation_store.is_revoked(db_session, payload["jti"])
+
@@ -0,0 +1,59 @@
+from bisect import bisect_left, insort
+from typing import Iterable, NamedTuple
+
+
+class Suggestion(NamedTuple):
+    code_name: str
+    name: str
+
+
+class SuggestIndex:
+    """
+    Prefix lookups over names, for autocompletion.
+
+    Names are kept case-folded in one sorted list, so a lookup is a binary
+    search for the first name starting with the prefix followed by a scan of
+    at most `limit` matches, whatever the size of the index. Adding a name
+    keeps the list sorted with `insort`.
+    """
+
+    def __init__(self):
+        # (folded name, name, code_name)
+        self._names: list[tuple[str, str, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def build(self, names: Iterable[tuple[str, str]]) -> None:
+        """
+        Replace the index with the given (code_name, name) pairs.
+        """
+        self._names = sorted(
+            {(name.casefold(), name, code_name) for code_name, name in names if name}
+        )
+
+    def add(self, code_name: str, names: Iterable[str | None]) -> None:
+        for name in names:
+            if not name:
+                continue
+            entry = (name.casefold(), name, code_name)
+            index = bisect_left(self._names, entry)
+            if index == len(self._names) or self._names[index] != entry:
+                insort(self._names, entry, lo=index)
+
+    def suggest(self, prefix: str, limit: int) -> list[Suggestion]:
+        """
+        Return up to `limit` codes with a name starting with `prefix`, in
+        alphabetical order of the name, each code at most once.
+        """
+        prefix = prefix.casefold()
+        suggestions: dict[str, Suggestion] = {}
+        for index in range(bisect_left(self._names, (prefix,)), len(self._names)):
+            folded, name, code_name = self._names[index]
+            if not folded.startswith(prefix):
+                break
+            if code_name not in suggestions:
+                suggestions[code_name] = Suggestion(code_name, name)
+                if len(suggestions) == limit:
+                    break
+        return list(suggestions.values())
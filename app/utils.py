@@ -1,9 +1,19 @@
-from typing import TypeVar
+import asyncio
+import base64
+import binascii
+import json
+import logging
+from typing import Any, Awaitable, Callable, TypeVar
 
 from fastapi import HTTPException, status
+from sqlalchemy import Column, Row, literal, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
 T = TypeVar("T")
 
+logger = logging.getLogger(__name__)
+
 
 def scalar(value: list[T]) -> T:
     return value[0]
@@ -23,3 +33,107 @@ def expect(
             detail=error_msg,
         )
     return value
+
+
+def encode_cursor(*values: Any) -> str:
+    """
+    Encode the sort key of the last row of a page as an opaque cursor.
+    """
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> list[Any]:
+    """
+    Decode a cursor made by `encode_cursor`, raising an HTTPException
+    (422 Unprocessable Entity) if it is malformed.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError) as error:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Invalid cursor",
+        ) from error
+    if not isinstance(values, list):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Invalid cursor",
+        )
+    return values
+
+
+async def insert_or_conflict(
+    database: AsyncSession,
+    model: type[Any],
+    values: dict[str, Any],
+    error_msg: str | None = None,
+    registry: Column | None = None,
+    registry_values: dict[str, Any] | None = None,
+) -> Row:
+    """
+    Insert a row with a single `INSERT ... ON CONFLICT DO NOTHING RETURNING`
+    and return its primary key, or raise an HTTPException (409 Conflict) if
+    it clashed with an existing row.
+
+    Partitioned tables cannot enforce a unique code across partitions, so
+    their codes are kept in a registry table instead. When `registry` (the
+    code column of that table) is given, the code is claimed in the same
+    statement and the row is only inserted if the code was free.
+    `registry_values` are stored alongside the code, and a clash with any
+    constraint of the registry counts as a conflict too.
+    """
+    statement = insert(model)
+    if registry is None:
+        statement = statement.values(**values)
+    else:
+        claimed = (
+            insert(registry.table)
+            .values(
+                {registry.name: values[registry.name], **(registry_values or {})}
+            )
+            .on_conflict_do_nothing()
+            .returning(registry)
+            .cte("claimed")
+        )
+        columns = model.__table__.columns
+        statement = statement.from_select(
+            list(values),
+            select(
+                *(
+                    claimed.c[name]
+                    if name == registry.name
+                    else literal(value, columns[name].type)
+                    for name, value in values.items()
+                )
+            ),
+        ).add_cte(claimed)
+
+    row = (
+        await database.execute(
+            statement.on_conflict_do_nothing().returning(
+                *model.__table__.primary_key.columns
+            )
+        )
+    ).first()
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=error_msg,
+        )
+    return row
+
+
+async def run_periodically(
+    interval: float,
+    function: Callable[[], Awaitable[None]],
+) -> None:
+    """
+    Await `function` every `interval` seconds until cancelled, logging rather
+    than propagating any error so that one failed run does not stop the loop.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await function()
+        except Exception:
+            logger.exception("Periodic task %s failed", function.__qualname__)
@@ -0,0 +1,56 @@
+"""
+Rows shared by the benchmarks and the database tests.
+"""
+from datetime import date, datetime
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+
+
+async def insert_clinician_and_patient(
+    db_session: AsyncSession, code: str, now: datetime
+) -> tuple[int, int]:
+    """
+    Insert a clinician and a patient both identified by `code`, returning
+    their registration ids.
+    """
+    clinician_id = await db_session.scalar(
+        insert(models.Clinician)
+        .values(
+            clinician_code=code,
+            gmc_number="GMC",
+            mc_number="MC",
+            first_name="Jane",
+            last_name="Doe",
+            mobile_number="0000",
+            email="jane.doe@example.com",
+            password="password",
+            address="1 Main St",
+            created_on=now,
+            updated_on=now,
+        )
+        .returning(models.Clinician.registration_id)
+    )
+    patient_id = await db_session.scalar(
+        insert(models.Patient)
+        .values(
+            patient_code=code,
+            first_name="John",
+            last_name="Doe",
+            date_of_birth=date(1980, 1, 1),
+            address="1 Main St",
+            emergency_contact_number="0000",
+            is_active=True,
+            is_armed_forces=False,
+            is_from_emergency_services=False,
+            is_from_abroad=False,
+            is_from_nhs=True,
+            is_alcohool_drinker=False,
+            created_on=now,
+            updated_on=now,
+        )
+        .returning(models.Patient.registration_id)
+    )
+    return clinician_id, patient_id
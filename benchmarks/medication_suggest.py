@@ -0,0 +1,70 @@
+"""
+Benchmark of the medication autocomplete index.
+
+Builds a SuggestIndex over a synthetic 100k medication catalog (four names
+per medication, like the real catalog) and times prefix lookups.
+
+    python -m benchmarks.medication_suggest
+"""
+import random
+import statistics
+import string
+import time
+
+from app.suggest import SuggestIndex
+
+CATALOG_SIZE = 100_000
+QUERIES = 20_000
+LIMIT = 10
+
+
+def random_name(rng: random.Random) -> str:
+    return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(6, 14)))
+
+
+def main() -> None:
+    rng = random.Random(0)
+    names = []
+    for number in range(CATALOG_SIZE):
+        code_name = f"med{number:06d}"
+        names.extend(
+            (code_name, name)
+            for name in (
+                random_name(rng).capitalize(),
+                random_name(rng).upper(),
+                code_name,
+                f"INT{number:06d}",
+            )
+        )
+
+    index = SuggestIndex()
+    start = time.perf_counter()
+    index.build(names)
+    print(f"built {len(index)} names in {time.perf_counter() - start:.2f}s")
+
+    prefixes = [
+        rng.choice(names)[1][: rng.randint(1, 4)] for _ in range(QUERIES)
+    ]
+    timings = []
+    for prefix in prefixes:
+        start = time.perf_counter()
+        index.suggest(prefix, LIMIT)
+        timings.append(time.perf_counter() - start)
+
+    timings.sort()
+    print(
+        f"{QUERIES} lookups, top {LIMIT}: "
+        f"mean {statistics.mean(timings) * 1e6:.1f}us, "
+        f"p50 {timings[len(timings) // 2] * 1e6:.1f}us, "
+        f"p99 {timings[int(len(timings) * 0.99)] * 1e6:.1f}us, "
+        f"max {timings[-1] * 1e6:.1f}us"
+    )
+
+    start = time.perf_counter()
+    for number in range(1_000):
+        index.add(f"new{number:04d}", (random_name(rng),))
+    print(f"1000 incremental adds: {(time.perf_counter() - start) * 1e3:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Benchmark of the NDJSON prescription stream.
+
+Seeds ROWS prescriptions of a throwaway clinician in the database of
+DATABASE_URL (migrated to head), streams them through `stream_prescriptions`
+and reports rows/s and the peak memory allocated while streaming, then
+deletes them again.
+
+    python -m benchmarks.prescription_stream [--rows 200000]
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import String, cast, delete, func, insert, literal, select
+
+from app import models
+from app.app_endpoints.prescription_endpoints import (STREAM_CHUNK_SIZE,
+                                                      prescription_listing_query,
+                                                      stream_prescriptions)
+from app.database import sessionmanager
+from benchmarks.factories import insert_clinician_and_patient
+
+ROWS = 200_000
+
+
+async def seed(prefix: str, rows: int) -> int:
+    """
+    Insert `rows` prescriptions of a new clinician, returning its id.
+    """
+    now = datetime.now()
+    async with sessionmanager.session() as session:
+        clinician_id, patient_id = await insert_clinician_and_patient(
+            session, prefix, now
+        )
+        series = func.generate_series(1, rows).table_valued("n")
+        code = literal(f"{prefix}_") + cast(series.c.n, String)
+        await session.execute(
+            insert(models.PrescriptionCode).from_select(
+                ["prescription_code"], select(code)
+            )
+        )
+        # Spread over the last 30 days, like a month of listings
+        created_on = literal(now) - series.c.n * literal(
+            timedelta(days=30) / rows
+        )
+        await session.execute(
+            insert(models.Prescription).from_select(
+                [
+                    "prescription_code",
+                    "clinician_refrence",
+                    "patient_refrence",
+                    "reason",
+                    "created_on",
+                    "updated_on",
+                    "start_date",
+                    "frequency",
+                    "medication_json",
+                ],
+                select(
+                    code,
+                    literal(clinician_id),
+                    literal(patient_id),
+                    literal("Benchmark"),
+                    created_on,
+                    created_on,
+                    created_on,
+                    literal(2),
+                    func.jsonb_build_object(
+                        "MEDICATION",
+                        func.jsonb_build_object(
+                            "dosage", "10mg", "indications", "none"
+                        ),
+                    ),
+                ),
+            )
+        )
+        await session.commit()
+    return clinician_id
+
+
+async def clean_up(prefix: str, clinician_id: int) -> None:
+    async with sessionmanager.session() as session:
+        await session.execute(
+            delete(models.Prescription).where(
+                models.Prescription.clinician_refrence == clinician_id
+            )
+        )
+        await session.execute(
+            delete(models.PrescriptionCode).where(
+                models.PrescriptionCode.prescription_code.startswith(f"{prefix}_")
+            )
+        )
+        await session.execute(
+            delete(models.Patient).where(models.Patient.patient_code == prefix)
+        )
+        await session.execute(
+            delete(models.Clinician).where(
+                models.Clinician.registration_id == clinician_id
+            )
+        )
+        await session.commit()
+
+
+async def drain(query) -> tuple[int, int]:
+    """
+    Consume the stream of `query`, returning the number of rows and bytes.
+    """
+    rows = 0
+    size = 0
+    async for chunk in stream_prescriptions(query):
+        rows += chunk.count(b"\n")
+        size += len(chunk)
+    return rows, size
+
+
+async def main(rows: int) -> None:
+    prefix = f"BENCH_{uuid.uuid4().hex[:8]}"
+    start = time.perf_counter()
+    clinician_id = await seed(prefix, rows)
+    print(f"seeded {rows} prescriptions in {time.perf_counter() - start:.2f}s")
+
+    try:
+        query = prescription_listing_query(
+            models.Prescription.clinician_refrence == clinician_id
+        )
+        start = time.perf_counter()
+        streamed, size = await drain(query)
+        elapsed = time.perf_counter() - start
+        print(
+            f"streamed {streamed} rows ({size / 2**20:.1f} MiB of NDJSON) "
+            f"in {elapsed:.2f}s: {streamed / elapsed:.0f} rows/s "
+            f"(chunks of {STREAM_CHUNK_SIZE} rows)"
+        )
+
+        # Traced separately, tracemalloc slows allocations down
+        tracemalloc.start()
+        await drain(query)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"peak memory while streaming: {peak / 2**20:.1f} MiB")
+    finally:
+        await clean_up(prefix, clinician_id)
+        await sessionmanager.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--rows", type=int, default=ROWS)
+    asyncio.run(main(parser.parse_args().rows))
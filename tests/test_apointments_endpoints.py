@@ -0,0 +1,157 @@
+import asyncio
+from contextlib import ExitStack
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple
+
+import pytest
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from alembic.script import ScriptDirectory
+from asyncpg import Connection
+from fastapi import HTTPException, status
+from sqlalchemy import insert, select
+
+from app import models
+from app.app_endpoints.apointments import post_apointments
+from app.conf import config as settings
+from app.database import Base, sessionmanager
+from app.main import app as actual_app
+from app.schemas import ApointmentsCreate
+from benchmarks.factories import insert_clinician_and_patient
+
+SLOT_START = datetime(2024, 1, 15, 10, tzinfo=timezone.utc)
+
+
+class References(NamedTuple):
+    patient_id: int
+    clinician_id: int
+    institution_id: int
+
+
+class TestApointmentsEndpoints:
+
+    @pytest.fixture(autouse=True)
+    def app(self):
+        with ExitStack():
+            yield actual_app
+
+
+    @pytest.fixture(scope="session")
+    def event_loop(self, request):
+        loop = asyncio.get_event_loop_policy().new_event_loop()
+        yield loop
+        loop.close()
+
+
+    def run_migrations(self, connection: Connection):
+        config = Config("app/alembic.ini")
+        config.set_main_option("script_location", "alembic")
+        config.set_main_option("sqlalchemy.url", settings.DB_TEST_URL)
+        script = ScriptDirectory.from_config(config)
+
+        def upgrade(rev, context):
+            return script._upgrade_revs("head", rev)
+
+        context = MigrationContext.configure(connection, opts={"target_metadata": Base.metadata, "fn": upgrade})
+
+        with context.begin_transaction():
+            with Operations.context(context):
+                context.run_migrations()
+
+
+    @pytest.fixture(scope="session", autouse=True)
+    async def setup_database(self):
+        # Run alembic migrations on test DB
+        async with sessionmanager.connect() as connection:
+            await connection.run_sync(self.run_migrations)
+
+        yield
+
+        # Teardown
+        await sessionmanager.close()
+
+
+    # Each test function is a clean slate
+    @pytest.fixture(scope="function")
+    async def db_session(self, monkeypatch):
+        async with sessionmanager.session() as session:
+            try:
+                await session.begin()
+                # The endpoint commits, flush instead so that the test
+                # transaction is still rolled back.
+                monkeypatch.setattr(session, "commit", session.flush)
+                yield session
+            finally:
+                await session.rollback()
+
+
+    @pytest.fixture(scope="function")
+    async def references(self, db_session) -> dict[str, References]:
+        """
+        Two clinicians of one institution, each with a patient.
+        """
+        now = datetime(2024, 1, 1)
+        institution_id = await db_session.scalar(
+            insert(models.Institution)
+            .values(name="SLOT_INSTITUTION", created_on=now)
+            .returning(models.Institution.id)
+        )
+        references = {}
+        for code in ("SLOT_FIRST", "SLOT_SECOND"):
+            clinician_id, patient_id = await insert_clinician_and_patient(
+                db_session, code, now
+            )
+            references[code] = References(patient_id, clinician_id, institution_id)
+        return references
+
+
+    async def book(
+        self, db_session, references: References, code: str, start: datetime
+    ) -> None:
+        await post_apointments(
+            ApointmentsCreate(reason="Checkup", apointment_date=start, duration_minutes=30),
+            code,
+            db_session,
+            references,
+            None,
+        )
+
+
+    @pytest.mark.parametrize(
+        "clinician, start, booked",
+        [
+            # Overlaps the end of the first slot
+            ("SLOT_FIRST", SLOT_START + timedelta(minutes=15), False),
+            # Overlaps the start of the first slot
+            ("SLOT_FIRST", SLOT_START - timedelta(minutes=15), False),
+            ("SLOT_FIRST", SLOT_START, False),
+            # Starts when the first slot ends
+            ("SLOT_FIRST", SLOT_START + timedelta(minutes=30), True),
+            ("SLOT_SECOND", SLOT_START, True),
+        ],
+    )
+    async def test_clinician_slots_cannot_overlap(
+        self, db_session, references, clinician: str, start: datetime, booked: bool
+    ) -> None:
+        """
+        An apointment overlapping another of the same clinician is a 409,
+        adjacent slots and other clinicians are accepted.
+        """
+        await self.book(db_session, references["SLOT_FIRST"], "SLOT_1", SLOT_START)
+
+        if booked:
+            await self.book(db_session, references[clinician], "SLOT_2", start)
+        else:
+            with pytest.raises(HTTPException) as error:
+                await self.book(db_session, references[clinician], "SLOT_2", start)
+            assert error.value.status_code == status.HTTP_409_CONFLICT
+
+        codes = (
+            await db_session.scalars(
+                select(models.Apointments.apointment_code).where(
+                    models.Apointments.apointment_code.in_(["SLOT_1", "SLOT_2"])
+                )
+            )
+        ).all()
+        assert sorted(codes) == (["SLOT_1", "SLOT_2"] if booked else ["SLOT_1"])
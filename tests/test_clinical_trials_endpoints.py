@@ -0,0 +1,195 @@
+import random
+from datetime import date, datetime, timedelta
+from typing import Any
+
+import pytest
+from pydantic import ValidationError
+
+from app.cohort import PatientCohorts, bitmap_of, ids_of, years_before
+from app.commons import BloodGroupType, GenderType
+from app.schemas import CohortCriteria
+
+TODAY = date(2024, 2, 29)
+FLAGS = ("is_active", "is_smoker", "is_alcohool_drinker", "is_donor", "is_armed_forces")
+
+
+def random_patient(rng: random.Random, registration_id: int) -> tuple:
+    """
+    A row of `COHORT_COLUMNS`.
+    """
+    return (
+        registration_id,
+        datetime(2024, 1, 1) + timedelta(minutes=registration_id),
+        date(1930, 1, 1) + timedelta(days=rng.randrange(90 * 365)),
+        rng.choice((None, 1, 2, 3, 4)),
+        *(rng.choice((True, False, None)) for _ in FLAGS),
+        rng.choice((None, *BloodGroupType)),
+        rng.choice((None, *GenderType)),
+    )
+
+
+def age(date_of_birth: date, today: date) -> int:
+    return (
+        today.year
+        - date_of_birth.year
+        - ((today.month, today.day) < (date_of_birth.month, date_of_birth.day))
+    )
+
+
+def matches(row: tuple, criteria: CohortCriteria, today: date) -> bool:
+    """
+    Whether a patient matches `criteria`, evaluated one patient at a time.
+    """
+    _, _, date_of_birth, institution_id, *flags, blood_type, gender = row
+    for name, value in zip(FLAGS, flags):
+        wanted = getattr(criteria, name)
+        if wanted is not None and value != wanted:
+            return False
+    for value, wanted in (
+        (blood_type, criteria.blood_type),
+        (gender, criteria.gender),
+        (institution_id, criteria.institution_id),
+    ):
+        if wanted is not None and value not in wanted:
+            return False
+    if criteria.min_age is not None and age(date_of_birth, today) < criteria.min_age:
+        return False
+    if criteria.max_age is not None and age(date_of_birth, today) > criteria.max_age:
+        return False
+    return (
+        all(matches(row, nested, today) for nested in criteria.all_of)
+        and (
+            not criteria.any_of
+            or any(matches(row, nested, today) for nested in criteria.any_of)
+        )
+        and not any(matches(row, nested, today) for nested in criteria.none_of)
+    )
+
+
+CRITERIA: list[dict[str, Any]] = [
+    {},
+    {"is_active": True},
+    {"is_smoker": False, "is_donor": True},
+    {"blood_type": [BloodGroupType.O_NEGATIVE, BloodGroupType.AB_POSITIVE]},
+    {"gender": [GenderType.FEMALE], "institution_id": [1, 3]},
+    {"institution_id": []},
+    {"min_age": 18},
+    {"max_age": 17},
+    {"min_age": 40, "max_age": 65},
+    {"min_age": 0, "max_age": 150},
+    {"min_age": 60, "max_age": 30},
+    {
+        "is_active": True,
+        "any_of": [{"is_smoker": True}, {"is_alcohool_drinker": True}],
+        "none_of": [{"institution_id": [2]}],
+    },
+    {
+        "all_of": [{"min_age": 30}, {"gender": [GenderType.MALE]}],
+        "none_of": [{"max_age": 40}],
+    },
+]
+
+
+class TestPatientCohorts:
+
+    @pytest.fixture
+    def rows(self) -> dict[int, tuple]:
+        rng = random.Random(23)
+        # Registration ids with gaps, as left by deleted rows
+        ids = rng.sample(range(1, 600), 300)
+        return {id_: random_patient(rng, id_) for id_ in ids}
+
+    @pytest.fixture
+    def cohorts(self, rows) -> PatientCohorts:
+        cohorts = PatientCohorts()
+        for row in rows.values():
+            cohorts.add(row)
+        return cohorts
+
+
+    @pytest.mark.parametrize("ids", [[], [0], [5, 1, 64, 8, 63, 7], list(range(200))])
+    def test_ids_of_bitmap_of(self, ids: list[int]) -> None:
+        bitmap = bitmap_of(ids)
+
+        assert bitmap.bit_count() == len(ids)
+        assert ids_of(bitmap) == sorted(ids)
+        assert ids_of(bitmap, 3) == sorted(ids)[:3]
+
+
+    def test_years_before_clamps(self) -> None:
+        assert years_before(TODAY, 1) == date(2023, 2, 28)
+        assert years_before(TODAY, 4) == date(2020, 2, 29)
+        assert years_before(TODAY, 5000) == date.min
+
+
+    def test_ages_are_bounded(self) -> None:
+        with pytest.raises(ValidationError):
+            CohortCriteria(max_age=5000)
+
+
+    @pytest.mark.parametrize("today", [TODAY, date(2024, 3, 1), date(2023, 12, 31)])
+    @pytest.mark.parametrize("criteria", CRITERIA)
+    def test_match(
+        self, cohorts: PatientCohorts, rows: dict, criteria: dict, today: date
+    ) -> None:
+        """
+        The bitmaps select the patients a filter over the rows selects.
+        """
+        criteria = CohortCriteria(**criteria)
+
+        assert ids_of(cohorts.match(criteria, today)) == sorted(
+            id_ for id_, row in rows.items() if matches(row, criteria, today)
+        )
+
+
+    @pytest.mark.parametrize(
+        "first, last",
+        [
+            (date(1950, 3, 1), date(1950, 3, 1)),
+            (date(1950, 1, 1), date(1950, 12, 31)),
+            (date(1960, 6, 15), date(1975, 2, 3)),
+            (date.min, date(1980, 1, 1)),
+            (date(1990, 1, 1), date(1989, 1, 1)),
+        ],
+    )
+    def test_born_between(
+        self, cohorts: PatientCohorts, rows: dict, first: date, last: date
+    ) -> None:
+        assert ids_of(cohorts.born_between(first, last)) == sorted(
+            id_ for id_, row in rows.items() if first <= row[2] <= last
+        )
+
+
+    def test_reindex_matches_a_fresh_index(
+        self, cohorts: PatientCohorts, rows: dict
+    ) -> None:
+        """
+        Patients added again, changed or not, are indexed under their new
+        values only, including in the institution bitmaps already built.
+        """
+        rng = random.Random(24)
+        scope = cohorts.of_institutions([1, 2])
+        assert ids_of(scope) == sorted(
+            id_ for id_, row in rows.items() if row[3] in (1, 2)
+        )
+
+        for id_ in rng.sample(sorted(rows), 150):
+            rows[id_] = random_patient(rng, id_)
+            cohorts.add(rows[id_])
+        for id_ in rng.sample(sorted(rows), 50):
+            # Unchanged
+            cohorts.add(rows[id_])
+        rows[1000] = random_patient(rng, 1000)
+        cohorts.add(rows[1000])
+
+        fresh = PatientCohorts()
+        for row in rows.values():
+            fresh.add(row)
+        assert len(cohorts) == len(fresh) == len(rows)
+        assert ids_of(cohorts.of_institutions([2, 1])) == ids_of(
+            fresh.of_institutions([1, 2])
+        )
+        for criteria in CRITERIA:
+            criteria = CohortCriteria(**criteria)
+            assert cohorts.match(criteria, TODAY) == fresh.match(criteria, TODAY)
+        assert cohorts.watermark == rows[1000][1]
@@ -1,13 +1,19 @@
 from datetime import datetime
-from typing import Any
+from typing import Any, NamedTuple
 
 import pytest
-from fastapi import status
+from fastapi import HTTPException, status
 from fastapi.testclient import TestClient
 
+from sqlalchemy import insert, select
 from sqlalchemy_utils import Ltree
 from alembic.config import Config
-from app.models import Organization
+from app.app_endpoints.organisation_endpoints import (build_organization_tree,
+                                                      create_organizations,
+                                                      move_organization,
+                                                      organization_tree_query)
+from app.models import Institution, Organization, User
+from app.schemas import OrganizationBulkCreate, OrganizationParentUpdate
 import asyncio
 from contextlib import ExitStack
 from alembic.migration import MigrationContext
@@ -40,6 +46,16 @@ organization_to_create = [
     }
 ]
 
+
+
+class TreeRow(NamedTuple):
+    id: int
+    name: str
+    path: str
+    institution_count: int
+    user_count: int
+
+
 class TestOrganizationEndpoints:
 
     @pytest.fixture(autouse=True)
@@ -128,3 +144,252 @@ class TestOrganizationEndpoints:
             assert response.status_code == status.HTTP_201_CREATED
             """
 
+
+    @pytest.fixture(scope="function")
+    async def organization_tree(self, db_session):
+        """
+        TREETEST with two children, the first of which has a child, one
+        institution below the first child and two users at the root.
+        """
+        ids = {}
+        for name, path in [
+            ("TREETEST", "TREETEST"),
+            ("TREETEST_C1", "TREETEST.C1"),
+            ("TREETEST_C1_G1", "TREETEST.C1.G1"),
+            ("TREETEST_C2", "TREETEST.C2"),
+        ]:
+            ids[name] = await db_session.scalar(
+                insert(Organization)
+                .values(name=name, path=Ltree(path), created_on=datetime.now())
+                .returning(Organization.id)
+            )
+        await db_session.execute(
+            insert(Institution).values(
+                name="TREETEST_INSTITUTION",
+                created_on=datetime.now(),
+                organization_id=ids["TREETEST_C1"],
+            )
+        )
+        await db_session.execute(
+            insert(User),
+            [
+                dict(
+                    username=f"treetest{number}",
+                    email=f"treetest{number}@example.com",
+                    pword_hash="password",
+                    organization_id=ids["TREETEST"],
+                )
+                for number in range(2)
+            ],
+        )
+        return ids
+
+
+    def test_build_organization_tree_nests_rows(self) -> None:
+        """
+        Rows sorted by path are nested below their parent.
+        """
+        tree = build_organization_tree(
+            [
+                TreeRow(1, "root", "A", 1, 2),
+                TreeRow(2, "child", "A.2", 0, 1),
+                TreeRow(3, "grandchild", "A.2.3", 4, 0),
+                TreeRow(4, "sibling", "A.4", 0, 0),
+            ]
+        )
+
+        assert tree.name == "root"
+        assert (tree.institution_count, tree.user_count) == (1, 2)
+        assert [child.name for child in tree.children] == ["child", "sibling"]
+        assert [node.name for node in tree.children[0].children] == ["grandchild"]
+        assert tree.children[0].children[0].institution_count == 4
+        assert tree.children[1].children == []
+
+
+    async def test_tree_query_counts_per_organization(
+        self, db_session, organization_tree
+    ) -> None:
+        """
+        Every organization below the root is returned, parents first, with
+        its own institutions and users.
+        """
+        rows = (
+            await db_session.execute(organization_tree_query("TREETEST", None))
+        ).all()
+
+        assert [row.name for row in rows] == [
+            "TREETEST",
+            "TREETEST_C1",
+            "TREETEST_C1_G1",
+            "TREETEST_C2",
+        ]
+        counts = {row.name: (row.institution_count, row.user_count) for row in rows}
+        assert counts == {
+            "TREETEST": (0, 2),
+            "TREETEST_C1": (1, 0),
+            "TREETEST_C1_G1": (0, 0),
+            "TREETEST_C2": (0, 0),
+        }
+
+
+    @pytest.mark.parametrize(
+        "depth, names",
+        [
+            (0, ["TREETEST"]),
+            (1, ["TREETEST", "TREETEST_C1", "TREETEST_C2"]),
+            (2, ["TREETEST", "TREETEST_C1", "TREETEST_C1_G1", "TREETEST_C2"]),
+        ],
+    )
+    async def test_tree_query_depth(
+        self, db_session, organization_tree, depth: int, names: list[str]
+    ) -> None:
+        """
+        `depth` limits the number of levels returned below the root.
+        """
+        rows = (
+            await db_session.execute(organization_tree_query("TREETEST", depth))
+        ).all()
+
+        assert [row.name for row in rows] == names
+        tree = build_organization_tree(rows)
+        assert tree.name == "TREETEST"
+
+
+    @pytest.fixture(scope="function")
+    def commit_as_flush(self, monkeypatch, db_session):
+        """
+        Endpoints called directly commit their session; flush instead so that
+        the test transaction is still rolled back.
+        """
+        monkeypatch.setattr(db_session, "commit", db_session.flush)
+
+
+    async def organization_paths(self, db_session, names: list[str]) -> dict[str, str]:
+        rows = await db_session.execute(
+            select(Organization.name, Organization.path).where(
+                Organization.name.in_(names)
+            )
+        )
+        return {name: str(path) for name, path in rows}
+
+
+    async def test_bulk_create_nests_parents_of_the_batch(
+        self, db_session, organization_tree, commit_as_flush
+    ) -> None:
+        """
+        Parents may be created by the same request, in any order, or already
+        exist.
+        """
+        created = await create_organizations(
+            [
+                OrganizationBulkCreate(name="BULKTEST_C", parent="BULKTEST_B"),
+                OrganizationBulkCreate(name="BULKTEST_B", parent="BULKTEST_A"),
+                OrganizationBulkCreate(name="BULKTEST_A", parent=None),
+                OrganizationBulkCreate(name="BULKTEST_D", parent="TREETEST"),
+            ],
+            db_session,
+            None,
+        )
+
+        ids = {organization.name: organization.id for organization in created}
+        paths = await self.organization_paths(db_session, list(ids))
+        assert paths == {organization.name: organization.path for organization in created}
+        assert paths["BULKTEST_A"] == f"A.{ids['BULKTEST_A']}"
+        assert paths["BULKTEST_B"] == f"{paths['BULKTEST_A']}.{ids['BULKTEST_B']}"
+        assert paths["BULKTEST_C"] == f"{paths['BULKTEST_B']}.{ids['BULKTEST_C']}"
+        assert paths["BULKTEST_D"] == f"TREETEST.{ids['BULKTEST_D']}"
+
+
+    @pytest.mark.parametrize(
+        "organizations, status_code",
+        [
+            (
+                [
+                    OrganizationBulkCreate(name="BULKTEST_A", parent="BULKTEST_B"),
+                    OrganizationBulkCreate(name="BULKTEST_B", parent="BULKTEST_A"),
+                ],
+                status.HTTP_422_UNPROCESSABLE_ENTITY,
+            ),
+            (
+                [
+                    OrganizationBulkCreate(name="BULKTEST_A", parent="TREETEST"),
+                    OrganizationBulkCreate(name="TREETEST_C1", parent="BULKTEST_A"),
+                ],
+                status.HTTP_409_CONFLICT,
+            ),
+            (
+                [
+                    OrganizationBulkCreate(name="BULKTEST_A", parent="TREETEST"),
+                    OrganizationBulkCreate(name="BULKTEST_B", parent="BULKTEST_TYPO"),
+                ],
+                status.HTTP_404_NOT_FOUND,
+            ),
+        ],
+    )
+    async def test_bulk_create_rejects_the_whole_batch(
+        self,
+        db_session,
+        organization_tree,
+        commit_as_flush,
+        organizations: list[OrganizationBulkCreate],
+        status_code: int,
+    ) -> None:
+        """
+        A cycle, a name clash or an unknown parent fails the request without
+        creating any organization.
+        """
+        with pytest.raises(HTTPException) as error:
+            # Rolled back on error, as by the session dependency
+            async with db_session.begin_nested():
+                await create_organizations(organizations, db_session, None)
+
+        assert error.value.status_code == status_code
+        assert await self.organization_paths(
+            db_session, ["BULKTEST_A", "BULKTEST_B"]
+        ) == {}
+        assert (await self.organization_paths(db_session, ["TREETEST_C1"])) == {
+            "TREETEST_C1": "TREETEST.C1"
+        }
+
+
+    async def test_move_rewrites_the_subtree(
+        self, db_session, organization_tree, commit_as_flush
+    ) -> None:
+        """
+        The moved organization and its descendants get the new parent's
+        prefix, other organizations keep their path.
+        """
+        moved = await move_organization(
+            "TREETEST_C1",
+            OrganizationParentUpdate(parent="TREETEST_C2"),
+            db_session,
+            None,
+            list(organization_tree.values()),
+        )
+
+        assert moved.path == "TREETEST.C2.C1"
+        assert await self.organization_paths(db_session, list(organization_tree)) == {
+            "TREETEST": "TREETEST",
+            "TREETEST_C1": "TREETEST.C2.C1",
+            "TREETEST_C1_G1": "TREETEST.C2.C1.G1",
+            "TREETEST_C2": "TREETEST.C2",
+        }
+
+
+    @pytest.mark.parametrize("parent", ["TREETEST_C1", "TREETEST_C1_G1"])
+    async def test_move_below_itself(
+        self, db_session, organization_tree, commit_as_flush, parent: str
+    ) -> None:
+        with pytest.raises(HTTPException) as error:
+            await move_organization(
+                "TREETEST_C1",
+                OrganizationParentUpdate(parent=parent),
+                db_session,
+                None,
+                list(organization_tree.values()),
+            )
+
+        assert error.value.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        assert (await self.organization_paths(db_session, ["TREETEST_C1_G1"])) == {
+            "TREETEST_C1_G1": "TREETEST.C1.G1"
+        }
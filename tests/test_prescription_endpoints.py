@@ -0,0 +1,280 @@
+import asyncio
+from contextlib import ExitStack
+from datetime import date, datetime, time, timedelta
+
+import pytest
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from alembic.script import ScriptDirectory
+from asyncpg import Connection
+from fastapi import HTTPException, Response, status
+from sqlalchemy import insert, select, text
+from sqlalchemy.dialects import postgresql
+
+from app import models
+from app.app_endpoints.prescription_endpoints import (after_cursor, fetch_page,
+                                                      prescription_listing_query)
+from app.conf import config as settings
+from app.database import Base, sessionmanager
+from app.partitions import add_months, partition_name
+from app.utils import encode_cursor
+from app.main import app as actual_app
+from benchmarks.factories import insert_clinician_and_patient
+
+
+class TestPrescriptionEndpoints:
+
+    @pytest.fixture(autouse=True)
+    def app(self):
+        with ExitStack():
+            yield actual_app
+
+
+    @pytest.fixture(scope="session")
+    def event_loop(self, request):
+        loop = asyncio.get_event_loop_policy().new_event_loop()
+        yield loop
+        loop.close()
+
+
+    def run_migrations(self, connection: Connection):
+        config = Config("app/alembic.ini")
+        config.set_main_option("script_location", "alembic")
+        config.set_main_option("sqlalchemy.url", settings.DB_TEST_URL)
+        script = ScriptDirectory.from_config(config)
+
+        def upgrade(rev, context):
+            return script._upgrade_revs("head", rev)
+
+        context = MigrationContext.configure(connection, opts={"target_metadata": Base.metadata, "fn": upgrade})
+
+        with context.begin_transaction():
+            with Operations.context(context):
+                context.run_migrations()
+
+
+    @pytest.fixture(scope="session", autouse=True)
+    async def setup_database(self):
+        # Run alembic migrations on test DB
+        async with sessionmanager.connect() as connection:
+            await connection.run_sync(self.run_migrations)
+
+        yield
+
+        # Teardown
+        await sessionmanager.close()
+
+
+    # Each test function is a clean slate
+    @pytest.fixture(scope="function")
+    async def db_session(self):
+        async with sessionmanager.session() as session:
+            try:
+                await session.begin()
+                yield session
+            finally:
+                await session.rollback()
+
+
+    async def explain(self, db_session, query) -> str:
+        # The test tables are tiny, so keep the planner from preferring a
+        # sequential scan that it would never pick on real data.
+        await db_session.execute(text("SET LOCAL enable_seqscan = off"))
+        sql = query.compile(
+            dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+        )
+        plan = await db_session.scalars(text(f"EXPLAIN {sql}"))
+        return "\n".join(plan)
+
+
+    async def test_date_window_uses_created_on_index(self, db_session) -> None:
+        """
+        The date window of the listing is answered from the created_on index.
+        """
+        query = prescription_listing_query(
+            models.Prescription.created_on.between(
+                datetime(2024, 1, 1), datetime(2024, 2, 1)
+            )
+        )
+
+        plan = await self.explain(db_session, query)
+
+        # Each partition has its own copy of the index
+        assert "created_on_prescription_id_idx" in plan
+        assert "Seq Scan on prescription_tab" not in plan
+
+
+    async def test_patient_filter_uses_patient_index(self, db_session) -> None:
+        """
+        Filtering on a patient uses the (patient_refrence, created_on) index.
+        """
+        query = prescription_listing_query(
+            models.Prescription.created_on.between(
+                datetime(2024, 1, 1), datetime(2024, 2, 1)
+            ),
+            models.Prescription.patient_refrence
+            == select(models.Patient.registration_id)
+            .where(models.Patient.patient_code == "PATIENT")
+            .scalar_subquery(),
+        )
+
+        plan = await self.explain(db_session, query)
+
+        assert "patient_refrence_created_on_prescription_id_idx" in plan
+        assert "Seq Scan on prescription_tab" not in plan
+
+
+    async def test_date_window_prunes_partitions(self, db_session) -> None:
+        """
+        A window within one month only reads the partition of that month.
+        """
+        month = add_months(date.today(), 0)
+        next_month = add_months(month, 1)
+        query = prescription_listing_query(
+            models.Prescription.created_on.between(
+                datetime.combine(month, time()),
+                datetime.combine(month, time()) + timedelta(days=7),
+            )
+        )
+
+        plan = await self.explain(db_session, query)
+
+        assert partition_name("prescription_tab", month) in plan
+        assert partition_name("prescription_tab", next_month) not in plan
+        assert "prescription_tab_default" not in plan
+
+
+    async def test_medication_filter_uses_medication_json_index(self, db_session) -> None:
+        """
+        Looking prescriptions up by medication code uses the GIN index.
+        """
+        query = prescription_listing_query(
+            models.Prescription.medication_json.has_key("MEDICATION")
+        )
+
+        plan = await self.explain(db_session, query)
+
+        assert "medication_json_idx" in plan
+        assert "Seq Scan on prescription_tab" not in plan
+
+
+    @pytest.fixture(scope="function")
+    async def clinician_prescriptions(self, db_session):
+        """
+        Five prescriptions of one clinician, three of them created at the
+        same instant, returning the clinician id and the prescription ids in
+        listing order.
+        """
+        now = datetime(2024, 1, 15, 12)
+        clinician_id, patient_id = await insert_clinician_and_patient(
+            db_session, "PAGINATION", now
+        )
+        created_on = [
+            now,
+            now + timedelta(hours=1),
+            now + timedelta(hours=1),
+            now + timedelta(hours=1),
+            now + timedelta(hours=2),
+        ]
+        codes = [f"PAGINATION_{number}" for number in range(len(created_on))]
+        await db_session.execute(
+            insert(models.PrescriptionCode),
+            [{"prescription_code": code} for code in codes],
+        )
+        rows = (
+            await db_session.execute(
+                insert(models.Prescription)
+                .values(
+                    [
+                        dict(
+                            prescription_code=code,
+                            clinician_refrence=clinician_id,
+                            patient_refrence=patient_id,
+                            created_on=created,
+                            updated_on=created,
+                            start_date=created,
+                            frequency=1,
+                        )
+                        for code, created in zip(codes, created_on)
+                    ]
+                )
+                .returning(
+                    models.Prescription.created_on,
+                    models.Prescription.prescription_id,
+                )
+            )
+        ).all()
+        return clinician_id, [prescription_id for _, prescription_id in sorted(rows)]
+
+
+    async def test_next_cursor_only_when_more_rows(
+        self, db_session, clinician_prescriptions
+    ) -> None:
+        """
+        X-Next-Cursor is set when a page is full and more rows remain, and
+        only then.
+        """
+        clinician_id, prescription_ids = clinician_prescriptions
+        query = prescription_listing_query(
+            models.Prescription.clinician_refrence == clinician_id
+        )
+
+        response = Response()
+        page = await fetch_page(db_session, query, len(prescription_ids), response)
+        assert len(page) == len(prescription_ids)
+        assert "X-Next-Cursor" not in response.headers
+
+        response = Response()
+        page = await fetch_page(db_session, query, 2, response)
+        assert len(page) == 2
+        assert "X-Next-Cursor" in response.headers
+
+
+    async def test_next_page_resumes_after_last_row(
+        self, db_session, clinician_prescriptions
+    ) -> None:
+        """
+        Each page starts right after the (created_on, prescription_id) of the
+        last row of the previous one, even among rows created at the same
+        instant, so that walking the pages returns every row exactly once.
+        """
+        clinician_id, prescription_ids = clinician_prescriptions
+        by_clinician = models.Prescription.clinician_refrence == clinician_id
+
+        # Pages of 2 end in the middle of the rows sharing a created_on
+        seen = []
+        cursor = None
+        while True:
+            response = Response()
+            filters = [by_clinician]
+            if cursor is not None:
+                filters.append(after_cursor(cursor))
+            page = await fetch_page(
+                db_session, prescription_listing_query(*filters), 2, response
+            )
+            seen.extend(row.prescription_id for row in page)
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                break
+
+        assert seen == prescription_ids
+
+
+    @pytest.mark.parametrize(
+        "cursor",
+        [
+            "not a cursor",
+            encode_cursor("2024-01-15T12:00:00"),
+            encode_cursor("yesterday", 1),
+            encode_cursor("2024-01-15T12:00:00", "one"),
+        ],
+    )
+    def test_malformed_cursor_is_rejected(self, cursor: str) -> None:
+        """
+        A cursor that was not made by the listing is a 422.
+        """
+        with pytest.raises(HTTPException) as error:
+            after_cursor(cursor)
+
+        assert error.value.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
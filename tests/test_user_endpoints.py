@@ -4,6 +4,7 @@ from typing import Any
 import pytest
 from fastapi.testclient import TestClient
 
+from sqlalchemy import insert
 from sqlalchemy_utils import Ltree
 from alembic.config import Config
 from app.models import Organization, User
@@ -14,7 +15,11 @@ from alembic.operations import Operations
 from alembic.script import ScriptDirectory
 from app.conf import config as settings
 from app.database import Base, get_db_session, sessionmanager
+from app.app_endpoints.user_endpoints import update_current_user
+from app.dependencies import principal_cache, user_from_token
 from app.main import app as actual_app
+from app.schemas import UserUpdate
+from app.security import create_access_token, decode_token
 from asyncpg import Connection
 from fastapi.testclient import TestClient
 
@@ -138,3 +143,40 @@ class TestUser:
             assert response.status_code == status.HTTP_201_CREATED
             """
             pass
+
+
+    async def test_rename_drops_principals_cached_under_old_username(
+        self, db_session, monkeypatch
+    ) -> None:
+        """
+        The principals cached for a user's tokens are dropped when the user
+        is renamed, although they are indexed under the old username.
+        """
+        # The endpoint commits, flush instead so that the test transaction is
+        # still rolled back.
+        monkeypatch.setattr(db_session, "commit", db_session.flush)
+        organization_id = await db_session.scalar(
+            insert(Organization)
+            .values(name="RENAMETEST", path=Ltree("RENAMETEST"), created_on=datetime.now())
+            .returning(Organization.id)
+        )
+        await db_session.execute(
+            insert(User).values(
+                username="renametest",
+                email="renametest@example.com",
+                pword_hash="password",
+                organization_id=organization_id,
+            )
+        )
+        token = create_access_token("renametest")
+        jti = decode_token(token)["jti"]
+        user = await user_from_token(token, db_session)
+        assert principal_cache.get(jti) is not None
+
+        await update_current_user(
+            UserUpdate(username="renamedtest", email="renametest@example.com"),
+            db_session,
+            user,
+        )
+
+        assert principal_cache.get(jti) is None